@@ -114,7 +114,12 @@ const float BEND_RESISTANCE = 60000.0; // resistance at 90 deg
 //#define OUTPUT_READABLE_WORLDACCEL
 
 // readable quaternions + world acceleration
-#define OUTPUT_AUTOMAIL_X
+//#define OUTPUT_AUTOMAIL_X
+
+// compact binary frames with quaternion, world acceleration and flex
+// sensor, see protocol.py for the layout. Needs a viewer that draws the
+// orientation from quaternions; older viewers need OUTPUT_AUTOMAIL_X
+#define OUTPUT_AUTOMAIL_BINARY
 
 // uncomment "OUTPUT_TEAPOT" if you want output that matches the
 // format used for the InvenSense teapot demo
@@ -146,6 +151,30 @@ float ypr[3];           // [yaw, pitch, roll]   yaw/pitch/roll container and gra
 // packet structure for InvenSense teapot demo
 uint8_t teapotPacket[14] = { '$', 0x02, 0,0, 0,0, 0,0, 0,0, 0x00, 0x00, '\r', '\n' };
 
+// packet structure for AutomailX binary output (little-endian, 29 bytes)
+#define AUTOMAIL_PROTOCOL_VERSION 1
+struct __attribute__((packed)) AutomailPacket {
+    uint8_t sync[2];      // 0xA5 0x5A
+    uint8_t version;
+    uint16_t seq;         // loops at 0xFFFF on purpose
+    uint32_t millis;
+    int16_t quat[4];      // w, x, y, z in Q14
+    int16_t accel[3];     // world-frame acceleration
+    float flex;           // flex sensor resistance
+    uint16_t checksum;    // Fletcher-16 of everything between sync and checksum
+};
+static_assert(sizeof(AutomailPacket) == 29, "AutomailPacket must be 29 bytes");
+AutomailPacket automailPacket = { { 0xA5, 0x5A }, AUTOMAIL_PROTOCOL_VERSION };
+
+uint16_t fletcher16(const uint8_t *data, size_t len) {
+    uint16_t sum1 = 0, sum2 = 0;
+    for (size_t i = 0; i < len; i++) {
+        sum1 = (sum1 + data[i]) % 255;
+        sum2 = (sum2 + sum1) % 255;
+    }
+    return (sum2 << 8) | sum1;
+}
+
 
 
 // ================================================================
@@ -411,6 +440,34 @@ void loop() {
             Serial.print("flex\t");
             Serial.println(flexR);
         #endif
+
+        #ifdef OUTPUT_AUTOMAIL_BINARY
+            // raw Q14 quaternion, no float conversion needed
+            mpu.dmpGetQuaternion(automailPacket.quat, fifoBuffer);
+
+            // world-frame acceleration, adjusted to remove gravity
+            mpu.dmpGetQuaternion(&q, fifoBuffer);
+            mpu.dmpGetGravity(&gravity, &q);
+            mpu.dmpGetAccel(&aa, fifoBuffer);
+            mpu.dmpGetLinearAccel(&aaReal, &aa, &gravity);
+            mpu.dmpGetLinearAccelInWorld(&aaWorld, &aaReal, &q);
+            automailPacket.accel[0] = aaWorld.x;
+            automailPacket.accel[1] = aaWorld.y;
+            automailPacket.accel[2] = aaWorld.z;
+
+            // flex sensor resistance from the voltage divider
+            {
+                int flexADC = analogRead(FLEX_PIN);
+                float flexV = flexADC * VCC / 1023.0;
+                automailPacket.flex = R_DIV * (VCC / flexV - 1.0);
+            }
+
+            automailPacket.millis = millis();
+            automailPacket.checksum = fletcher16(
+                (const uint8_t *)&automailPacket + 2, sizeof(AutomailPacket) - 4);
+            Serial.write((const uint8_t *)&automailPacket, sizeof(AutomailPacket));
+            automailPacket.seq++;
+        #endif
     
         #ifdef OUTPUT_TEAPOT
             // display quaternion values in InvenSense Teapot demo format:
@@ -1,14 +1,69 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import argparse
+import logging
+import time
 
-import pygame
-from pygame.locals import (DOUBLEBUF, K_DOWN, K_ESCAPE, K_UP, KEYDOWN, OPENGL,
-                           QUIT, RESIZABLE, VIDEORESIZE, K_r)
+_START = time.perf_counter()
 
-from sensors import SensorData, Sensors
-from simulation import Simulation
-from clf_predict import Predict
+
+class StartupProfiler():
+    """Measures how long each startup stage takes
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages = []
+        self.__done = False
+
+    def stage(self, name: str):
+        """Context manager that times one stage
+        """
+        return _Stage(self, name)
+
+    def first_frame(self):
+        """Marks the first frame as shown and prints the report once
+        """
+        if self.__done:
+            return
+        self.__done = True
+        self.stages.append(("time to first frame", time.perf_counter() - _START))
+        if self.enabled:
+            print("Startup profile:")
+            for name, elapsed in self.stages:
+                print("  %-24s %8.1f ms" % (name, elapsed * 1000))
+
+
+class _Stage():
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.stages.append((self.name, time.perf_counter() - self.start))
+
+
+# Most update steps run in one frame after a stall
+MAX_CATCH_UP = 5
+
+
+def set_mode(size, flags, vsync: bool = False):
+    """Opens or resizes the window, synced to the display refresh if asked
+    """
+    import pygame
+
+    if vsync:
+        pygame.display.gl_set_attribute(pygame.GL_SWAP_CONTROL, 1)
+        try:
+            return pygame.display.set_mode(size, flags, vsync=1)
+        except (TypeError, pygame.error):
+            # pygame 1 has no vsync argument, and some drivers refuse it
+            pass
+    return pygame.display.set_mode(size, flags)
 
 
 def main():
@@ -20,48 +75,175 @@ def main():
                        nargs='?', help='Listen to sensor data over serial (default)')
     group.add_argument('--demo', action='store_const', dest='demo',
                        const=True, help='Only show 3D model with no sensor data')
+    group.add_argument('--replay', metavar='file', default=None,
+                       help='Play back a recording instead of reading sensors')
+    parser.add_argument('--device', metavar='host:port', nargs='?', const=True, default=None,
+                        help='With --net, only show the device at this address, or the '
+                        'first one heard from if none is given')
+    parser.add_argument('--speed', metavar='N', type=float, default=1.0,
+                        help='Replay at N times the original speed, 0 for as fast as possible')
+    parser.add_argument('--rate', metavar='Hz', type=float, default=100.0,
+                        help='Sample rate of recordings without timestamps')
+    parser.add_argument('--loop', action='store_true',
+                        help='Start the replay over when it ends')
+    parser.add_argument('--no-predict', action='store_false', dest='predict',
+                        help="Don't classify the activity")
+    parser.add_argument('--combine', choices=('vote', 'proba'), default=None,
+                        help='Combine the windows classified in a frame by majority vote '
+                        'or by averaging class probabilities (default: vote). Needs '
+                        '--smoothing none')
+    parser.add_argument('--smoothing', choices=('hmm', 'hysteresis', 'none'), default='hmm',
+                        help='Decode the predictions over time to keep the pose '
+                        'from flickering: HMM forward filter, hysteresis or none')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Read the sensors and classify in separate processes')
+    parser.add_argument('--fps', metavar='N', type=int, default=60,
+                        help='Draw at most N frames per second, 0 for no limit')
+    parser.add_argument('--vsync', action='store_true',
+                        help='Sync frames to the display refresh rate')
+    parser.add_argument('--tick-rate', metavar='Hz', type=float, default=100.0,
+                        help='Update the simulation this many times per second')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Print how long each startup stage takes')
+    parser.add_argument('--log-level', default='WARNING',
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help='Lowest level of diagnostics to show')
+    parser.add_argument('--log-file', metavar='file', default=None,
+                        help='Also write diagnostics to a file')
+    parser.add_argument('--latency', action='store_true',
+                        help='Show latency percentiles of each stage on screen')
+    parser.add_argument('--latency-log', metavar='file', default=None,
+                        help='Append latency percentiles to a file as JSON lines')
+    parser.add_argument('--latency-interval', metavar='s', type=float, default=2.0,
+                        help='Seconds covered by each latency report')
     args = parser.parse_args()
-    if not args.net and not args.serial and not args.demo:
-        args = parser.parse_args(['--serial'])
+    if not args.net and not args.serial and not args.demo and not args.replay:
+        args.serial = True
+    if args.device is not None and not args.net:
+        parser.error("--device needs --net")
+    if args.combine is not None and args.smoothing != 'none':
+        parser.error("--combine needs --smoothing none, the decoder replaces it")
+    args.combine = args.combine or 'vote'
+
+    profiler = StartupProfiler(args.profile_startup)
+
+    import telemetry
+    telemetry.setup(args.log_level, args.log_file)
+    log = telemetry.get_logger('automailx')
+    sampler = telemetry.Sampler(60)
+
+    # Heavy modules are imported only by the paths that use them
+    with profiler.stage("import pygame"):
+        import pygame
+        from pygame.locals import (DOUBLEBUF, K_DOWN, K_ESCAPE, K_UP, KEYDOWN,
+                                   OPENGL, QUIT, RESIZABLE, VIDEORESIZE, K_r)
 
+    with profiler.stage("import simulation"):
+        from sensors import SensorData, Sensors
+        from simulation import Simulation
+
+    latency = None
+    if args.latency or args.latency_log:
+        from latency import LatencyMonitor
+        latency = LatencyMonitor(args.latency_log, args.latency_interval)
+
+    device = args.device
+    if isinstance(device, str):
+        from ingest import parse_address
+        device = parse_address(device)
+
+    pipeline = None
     if not args.demo:
-        sensors = Sensors(net_port=args.net, serial_port=args.serial)
+        sensor_options = dict(net_port=args.net, serial_port=args.serial,
+                              replay_file=args.replay, replay_speed=args.speed,
+                              replay_rate=args.rate, replay_loop=args.loop,
+                              device=device)
+        with profiler.stage("open sensors"):
+            if args.pipeline:
+                from pipeline import Pipeline
+                predict_options = None
+                if args.predict:
+                    predict_options = dict(combine=args.combine, smoothing=args.smoothing)
+                sensors = pipeline = Pipeline(sensor_options, predict_options)
+            else:
+                sensors = Sensors(latency=latency, **sensor_options)
+            sensors.start()
 
     video_flags = OPENGL | DOUBLEBUF | RESIZABLE
+    window_size = (900, 500)
 
-    pygame.init()
-    pygame.display.set_mode((900, 500), video_flags)
+    with profiler.stage("open window"):
+        pygame.init()
+        set_mode(window_size, video_flags, args.vsync)
 
     title = "AutomailX"
+    caption = title
     pygame.display.set_caption(title)
-    sim = Simulation(900, 500)
-    frames = 0
-    fps = 0
-    ticks = pygame.time.get_ticks()
+    with profiler.stage("init simulation"):
+        sim = Simulation(*window_size)
+    clock = pygame.time.Clock()
     sensor_data = SensorData()
     if args.demo:
         sensor_data.setdata(flex=sim.flex_straight)
     prediction = None
-    try:
-        predictor = Predict()
-    except Exception as exception:
-        print("Predictor failed:", exception.with_traceback)
-        predictor = None
-    while True:
-        if not args.demo:
-            sensor_data = sensors.read() or sensor_data
-
-        event = pygame.event.poll()
-        if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+    predictor = None
+    if not args.demo and args.predict and pipeline is None:
+        try:
+            with profiler.stage("import predictor"):
+                from clf_predict import Predict
+            with profiler.stage("load predictor"):
+                predictor = Predict(combine=args.combine, smoothing=args.smoothing)
+        except Exception as exception:
+            log.error("Predictor failed: %s", exception)
+    predictions_read = 0
+
+    # The state is updated in fixed steps of {step} seconds, whatever the
+    # frame rate, and each frame shows it interpolated between the last two
+    # steps. Frames that would look the same as the last one aren't drawn.
+    step = 1.0 / args.tick_rate
+    previous = current = sensor_data.copy()
+    accumulator = 0.0
+    last_time = time.perf_counter()
+    drawn = None
+    redraw = True
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                running = False
+            # if event.type == KEYDOWN and event.key == K_z:
+            #     ser.write("z")
+            elif event.type == VIDEORESIZE:
+                set_mode(event.dict['size'], video_flags, args.vsync)
+                sim.resize(*event.dict['size'])
+            elif event.type == KEYDOWN and event.key == K_r:
+                sim.recenter(current)
+            elif args.demo and event.type == KEYDOWN and event.key == K_UP:
+                sim.nextPose()
+            elif args.demo and event.type == KEYDOWN and event.key == K_DOWN:
+                sim.prevPose()
+            # anything else, like the window being exposed, may need a redraw
+            redraw = True
+        if not running:
             break
-        # if event.type == KEYDOWN and event.key == K_z:
-        #     ser.write("z")
-        elif event.type == VIDEORESIZE:
-            pygame.display.set_mode(event.dict['size'], video_flags)
-            sim.resize(*event.dict['size'])
-        elif event.type == KEYDOWN and event.key == K_r:
-            sim.recenter()
-        else:
+
+        now = time.perf_counter()
+        # after a stall, catch up by a few steps instead of all of them
+        accumulator += min(now - last_time, MAX_CATCH_UP * step)
+        last_time = now
+        samples = []
+        while accumulator >= step:
+            accumulator -= step
+            new_samples = []
+            if not args.demo:
+                new_samples = sensors.drain()
+                samples.extend(new_samples)
+                sensor_data = sensors.latest() or sensor_data
+                if latency is not None and new_samples:
+                    now = time.perf_counter()
+                    latency.record_many('queue', [now - sample.t_recv for sample in new_samples
+                                                  if sample.t_recv is not None])
+
             keys = pygame.key.get_pressed()  # checking pressed keys
             if keys[pygame.K_RIGHT]:
                 sensor_data.flex = \
@@ -69,30 +251,57 @@ def main():
             elif keys[pygame.K_LEFT]:
                 sensor_data.flex = \
                     min(sim.flex_straight, max(sim.flex_bent, sensor_data.flex - 600))
-            elif args.demo:
-                if event.type == KEYDOWN and event.key == K_UP:
-                    sim.nextPose()
-                elif event.type == KEYDOWN and event.key == K_DOWN:
-                    sim.prevPose()
-
-        if sensor_data is not None:
-            sim.sensor_data = sensor_data
-            if not args.demo and predictor is not None:
-                prediction = predictor.predict(sensor_data) or 0
-                sim.setPose(prediction)
-                print(" Prediction: %s   " % prediction, end='')
-        sim.draw()
-
-        pygame.display.flip()
-
-        if (pygame.time.get_ticks()-ticks) >= 250:
-            fps = ((frames*1000)//(pygame.time.get_ticks()-ticks))
-            ticks = pygame.time.get_ticks()
-            frames = 0
-        prediction_title = ("| Prediction: %d" % prediction) if prediction is not None else ""
-        pygame.display.set_caption("%s | FPS: %3d %s" % (title, fps, prediction_title))
 
-        frames = frames+1
+            if predictor is not None:
+                if latency is not None and new_samples:
+                    with latency.stage('predict'):
+                        prediction = predictor.predict_batch(new_samples)
+                else:
+                    prediction = predictor.predict_batch(new_samples)
+                sim.setPose(prediction or 0)
+                if sampler() and log.isEnabledFor(logging.DEBUG):
+                    log.debug("Prediction: %s", prediction)
+            elif pipeline is not None:
+                record = pipeline.prediction()
+                if record is not None and pipeline.predictions_read != predictions_read:
+                    predictions_read = pipeline.predictions_read
+                    prediction = int(record['prediction'])
+                    if latency is not None:
+                        latency.record('predict', float(record['predict_time']))
+                sim.setPose(prediction or 0)
+
+            previous = current
+            current = sensor_data.copy()
+
+        if latency is not None and latency.tick(now) and args.latency:
+            sim.overlay = latency.overlay()
+
+        sim.sensor_data = previous.interpolate(current, accumulator / step)
+        state = (tuple(sim.sensor_data), sim.pose, tuple(sim.overlay))
+        if redraw or state != drawn:
+            draw_start = time.perf_counter()
+            sim.draw()
+            pygame.display.flip()
+            profiler.first_frame()
+            drawn = state
+            redraw = False
+
+            if latency is not None:
+                now = time.perf_counter()
+                latency.record('draw', now - draw_start)
+                # how old the newest sample is by the time it's on screen
+                if samples and samples[-1].t_recv is not None:
+                    latency.record('total', now - samples[-1].t_recv)
+            clock.tick(args.fps)
+        else:
+            # nothing to show until the next step at the earliest
+            pygame.time.wait(int((step - accumulator) * 1000))
+
+        prediction_title = ("| Prediction: %d" % prediction) if prediction is not None else ""
+        text = "%s | FPS: %3d %s" % (title, clock.get_fps(), prediction_title)
+        if text != caption:
+            pygame.display.set_caption(text)
+            caption = text
 
     if not args.demo:
         sensors.close()
@@ -1,160 +1,655 @@
+#!/usr/bin/env python3
+"""Compares classifiers for activity recognition
+
+Every (model, fold) pair is fit in a process pool. Besides accuracy, the fit
+and predict wall time and the latency of classifying a single sample are
+measured, since the live viewer classifies one window at a time. The latency
+is measured once the pool is done, so other fits don't skew it.
+
+Folds are contiguous blocks of every activity run (see {blocked_splits}), as
+overlapping windows in both the training and the test set would make every
+model look perfect.
+
+Results are cached per model, parameters and training set, so adding a model
+only evaluates the new one. `tune` searches hyperparameters with successive
+halving, and `export` writes the best model for {Predict}.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import math
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-from matplotlib.ticker import FuncFormatter
-from sklearn import model_selection, svm
+import sklearn
+from sklearn.base import clone
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 from sklearn.ensemble import (AdaBoostClassifier, ExtraTreesClassifier,
                               GradientBoostingClassifier,
                               RandomForestClassifier)
 from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import learning_curve
+from sklearn.model_selection import ParameterGrid, ParameterSampler, learning_curve
 from sklearn.naive_bayes import GaussianNB
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier
 
+import dataset
+from clf_predict import MODEL_FILE
+
 # from sklearn.metrics import explained_variance_score, make_scorer
 
-seed = int(round(time.time() * 1000))
-
-X = []
-Y = []
-for filename in os.listdir('data'):
-    data = pd.read_csv('data/'+filename, sep=',', header=None, index_col=0)
-    # print(data)
-    for i in data.index.unique():
-        # Index is activity ID
-        # Y.append(i)
-        # X.append(data.loc[i].values[:250]) #TODO: Change this maximum value to some better dataset
-        for coords in data.loc[i].values:
-            Y.append(i)
-            X.append(coords)
-
-# prepare models
-models = []
-models.append(('LR', LogisticRegression()))
-models.append(('LDA', LinearDiscriminantAnalysis()))
-models.append(('KNN', KNeighborsClassifier()))
-models.append(('CART', DecisionTreeClassifier()))
-models.append(('NB', GaussianNB()))
-models.append(('SVM', SVC(gamma='scale')))
-models.append(('ADB', AdaBoostClassifier()))
-models.append(('RFC', RandomForestClassifier(n_estimators=100)))
-models.append(('ETC', ExtraTreesClassifier(n_estimators=100)))
-models.append(('GBC', GradientBoostingClassifier()))
+# Single-sample predictions timed per fold
+LATENCY_SAMPLES = 100
+# Fixed so that runs are comparable and cached results stay valid
+SEED = 100
 
-"""
-X_train, X_test, y_train, y_test = train_test_split(X, Y,
-test_size=0.3,
-random_state=100)
-"""
+# Values `tune` samples from, for the models worth tuning
+PARAM_SPACES = {
+    'LR': {'C': np.logspace(-2, 3, 11).tolist()},
+    'LDA': {'solver': ['svd', 'lsqr'], 'tol': [1e-4, 1e-3]},
+    'KNN': {'n_neighbors': [1, 3, 5, 7, 9, 15], 'weights': ['uniform', 'distance'],
+            'p': [1, 2]},
+    'CART': {'max_depth': [None, 3, 4, 6, 8, 12], 'min_samples_leaf': [1, 2, 4, 8],
+             'criterion': ['gini', 'entropy']},
+    'SVM': {'C': np.logspace(-1, 3, 9).tolist(), 'gamma': ['scale', 0.01, 0.1, 1.0]},
+    'ADB': {'n_estimators': [25, 50, 100], 'learning_rate': [0.1, 0.5, 1.0]},
+    'RFC': {'n_estimators': [10, 25, 50, 100], 'max_depth': [None, 4, 8, 12],
+            'max_features': ['sqrt', 0.5, None]},
+    'ETC': {'n_estimators': [10, 25, 50, 100], 'max_depth': [None, 4, 8, 12],
+            'max_features': ['sqrt', 0.5, None]},
+    'GBC': {'n_estimators': [25, 50, 100], 'max_depth': [2, 3, 4],
+            'learning_rate': [0.05, 0.1, 0.3]},
+}
+# Smallest successive halving round, in samples per fold
+MIN_FOLD_SAMPLES = 20
+# Accuracy traded for each millisecond of median single-sample latency
+LATENCY_WEIGHT = 0.05
 
-# evaluate each model in turn
-results = []
-names = []
-cv_means = []
-kfold = model_selection.KFold(n_splits=10, random_state=seed)
-scoring = 'accuracy'
-for name, model in models:
-    cv_results = model_selection.cross_val_score(model, X, Y,
-                                                 cv=kfold,
-                                                 scoring=scoring)
-    results.append(cv_results)
-    names.append(name)
-    cv_means.append(cv_results.mean())
-    msg = "%s: %f (%f)" % (name, cv_results.mean(), cv_results.std())
-    print(msg)
 
+def models():
+    """Candidate models as (name, estimator) pairs
+    """
+    return [
+        ('LR', LogisticRegression()),
+        ('LDA', LinearDiscriminantAnalysis()),
+        ('KNN', KNeighborsClassifier()),
+        ('CART', DecisionTreeClassifier()),
+        ('NB', GaussianNB()),
+        ('SVM', SVC(gamma='scale')),
+        ('ADB', AdaBoostClassifier()),
+        ('RFC', RandomForestClassifier(n_estimators=100)),
+        ('ETC', ExtraTreesClassifier(n_estimators=100)),
+        ('GBC', GradientBoostingClassifier()),
+    ]
 
-"""
-learning curve for best results from models
-"""
-# size_data = len(X)
-# print(size_data)
-# cv_fold = model_selection.KFold(size_data, shuffle=True)
-
-call_models = dict(models)
-cfl = call_models[names[pd.Series(cv_means).idxmax()]]
-# cfl = AdaBoostClassifier()
-train_sizes, train_scores, test_scores = learning_curve(cfl,
-                                                        X, Y,
-                                                        n_jobs=-1,
-                                                        cv=kfold,
-                                                        train_sizes=np.linspace
-                                                        (.1, 1.0, 5),
-                                                        verbose=0)
-
-train_scores_mean = np.mean(train_scores, axis=1)
-train_scores_std = np.std(train_scores, axis=1)
-test_scores_mean = np.mean(test_scores, axis=1)
-test_scores_std = np.std(test_scores, axis=1)
-
-fig, (ax1, ax2) = plt.subplots(2, 1)
-fig.subplots_adjust(hspace=0.8)
 
+def estimator_path(model):
+    """Importable name of an estimator's class, e.g. for {clf_predict.make_estimator}
+    """
+    return "%s.%s" % (type(model).__module__, type(model).__name__)
+
+
+def changed_params(model):
+    """Parameters of an estimator that differ from the class defaults
+    """
+    defaults = type(model)().get_params(deep=False)
+    return {key: value for key, value in model.get_params(deep=False).items()
+            if key not in defaults or value != defaults[key]}
+
+
+def blocked_splits(n_samples: int, folds: int = 10, groups=None, gap: int = 0):
+    """Cross-validation folds that keep overlapping windows apart
+
+    Feature vectors from a sliding window share most of their samples with
+    their neighbours, so shuffled folds put near copies of the test vectors
+    in the training set. Instead, every run of one activity is cut into
+    {folds} contiguous blocks, and fold k tests on block k of every run.
+    The {gap} vectors on either side of a test block are left out of
+    training.
+
+    Arguments:
+        n_samples {int} -- Number of feature vectors
+
+    Keyword Arguments:
+        folds {int} -- Number of folds (default: {10})
+        groups {numpy.ndarray} -- Run of each vector, as from
+        {dataset.Dataset.features}, or {None} for a single run (default: {None})
+        gap {int} -- Vectors left out of training around each test block,
+        one less than the window length for windows with a hop of 1 (default: {0})
+
+    Returns:
+        list -- (train, test) index arrays
+    """
+    if groups is None:
+        groups = np.zeros(n_samples, dtype=int)
+    groups = np.asarray(groups)
+    fold_of = np.empty(n_samples, dtype=int)
+    for group in np.unique(groups):
+        for fold, block in enumerate(np.array_split(np.flatnonzero(groups == group), folds)):
+            fold_of[block] = fold
+
+    splits = []
+    for fold in range(folds):
+        is_test = fold_of == fold
+        if not is_test.any():
+            continue
+        # vectors of the same run within {gap} of a test vector overlap it
+        near = np.zeros(n_samples, dtype=bool)
+        for offset in range(1, min(gap, n_samples - 1) + 1):
+            same = groups[:-offset] == groups[offset:]
+            near[offset:] |= is_test[:-offset] & same
+            near[:-offset] |= is_test[offset:] & same
+        splits.append((np.flatnonzero(~is_test & ~near), np.flatnonzero(is_test)))
+    return splits
+
+
+def evaluate_fold(name, model, X, y, train, test, keep: bool = False):
+    """Fits a model on one fold and times it.
+
+    Keyword Arguments:
+        keep {bool} -- Also return the fitted model (default: {False})
+
+    Returns:
+        dict -- Accuracy, and fit and predict wall time in seconds
+    """
+    model = clone(model)
+
+    start = time.perf_counter()
+    model.fit(X[train], y[train])
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predicted = model.predict(X[test])
+    predict_time = time.perf_counter() - start
+
+    return {
+        'model': name,
+        'accuracy': float(np.mean(predicted == y[test])),
+        'fit_time': fit_time,
+        'predict_time': predict_time,
+        'fitted': model if keep else None,
+    }
+
+
+def measure_latency(model, X, count: int = LATENCY_SAMPLES):
+    """Times the prediction of single samples, one after another.
+
+    Returns:
+        numpy.ndarray -- Latencies in seconds
+    """
+    latencies = np.empty(count)
+    for i in range(count):
+        row = i % len(X)
+        start = time.perf_counter()
+        model.predict(X[row:row + 1])
+        latencies[i] = time.perf_counter() - start
+    return latencies
+
+
+def benchmark(candidates, X, y, folds: int = 10, jobs: int = None, groups=None,
+              gap: int = 0):
+    """Evaluates every model on every fold in parallel.
+
+    Fits run in a process pool, but the single-sample latency is measured
+    afterwards with nothing else running, on the model fitted on the first
+    fold.
+
+    Arguments:
+        candidates {list} -- (name, estimator) pairs
+        X {numpy.ndarray} -- Feature vectors
+        y {numpy.ndarray} -- Labels
+
+    Keyword Arguments:
+        folds {int} -- Number of cross-validation folds (default: {10})
+        jobs {int} -- Worker processes, or {None} for one per CPU (default: {None})
+        groups {numpy.ndarray} -- Run of each vector, see {blocked_splits}
+        (default: {None})
+        gap {int} -- See {blocked_splits} (default: {0})
+
+    Returns:
+        list -- One summary dict per model, in the order given
+    """
+    if not candidates:
+        return []
+    X = np.asarray(X)
+    y = np.asarray(y)
+    splits = blocked_splits(len(y), folds, groups, gap)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [(index, executor.submit(evaluate_fold, name, model, X, y, train, test,
+                                           fold == 0))
+                   for index, (name, model) in enumerate(candidates)
+                   for fold, (train, test) in enumerate(splits)]
+        runs_by_model = [[] for _ in candidates]
+        for index, future in futures:
+            runs_by_model[index].append(future.result())
+
+    results = []
+    for (name, model), runs in zip(candidates, runs_by_model):
+        accuracies = np.array([run['accuracy'] for run in runs])
+        latencies = measure_latency(runs[0]['fitted'], X[splits[0][1]])
+        results.append({
+            'model': name,
+            'estimator': estimator_path(model),
+            'params': changed_params(model),
+            'accuracy_mean': float(accuracies.mean()),
+            'accuracy_std': float(accuracies.std()),
+            'fit_time': float(np.mean([run['fit_time'] for run in runs])),
+            'predict_time': float(np.mean([run['predict_time'] for run in runs])),
+            'latency_p50_us': float(np.percentile(latencies, 50) * 1e6),
+            'latency_p99_us': float(np.percentile(latencies, 99) * 1e6),
+            'fold_accuracies': accuracies.tolist(),
+        })
+    return results
+
+
+def result_key(model, digest: str, window: int, folds: int, seed: int,
+               samples: int = None):
+    """Identifies the result of evaluating a model on a training set
+    """
+    key = repr((estimator_path(model), sorted(changed_params(model).items()),
+                digest, window, folds, seed, sklearn.__version__, 'blocked'))
+    if samples is not None:
+        key += " %d" % samples
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def cached_benchmark(candidates, data: dataset.Dataset, window: int = 8,
+                     folds: int = 10, jobs: int = None, seed: int = SEED,
+                     cache_dir: str = 'cache', samples: int = None):
+    """Like {benchmark}, but only evaluates models without a cached result
+
+    Arguments:
+        candidates {list} -- (name, estimator) pairs
+        data {dataset.Dataset} -- The training set
+
+    Keyword Arguments:
+        window {int} -- Samples per feature window (default: {8})
+        folds {int} -- Number of cross-validation folds (default: {10})
+        jobs {int} -- Worker processes, or {None} for one per CPU (default: {None})
+        seed {int} -- Seed for picking {samples} (default: {SEED})
+        cache_dir {str} -- Where to keep results, or {None} to always
+        evaluate every model (default: {'cache'})
+        samples {int} -- Only use this many feature vectors, picked at
+        random, or {None} for all of them (default: {None})
+
+    Returns:
+        list -- One summary dict per model, in the order given
+    """
+    directory = None if cache_dir is None else os.path.join(cache_dir, 'models')
+    paths = [None] * len(candidates)
+    results = [None] * len(candidates)
+    if directory is not None:
+        for index, (_, model) in enumerate(candidates):
+            key = result_key(model, data.digest, window, folds, seed, samples)
+            paths[index] = os.path.join(directory, key + '.json')
+            if os.path.isfile(paths[index]):
+                with open(paths[index]) as result_file:
+                    results[index] = json.load(result_file)
+
+    missing = [index for index, result in enumerate(results) if result is None]
+    if missing:
+        print("Evaluating %d of %d models" % (len(missing), len(candidates)))
+        X, y, groups = data.features(window, groups=True)
+        if samples is not None and samples < len(y):
+            # sorted, so every run stays in time order
+            subset = np.sort(np.random.RandomState(seed).permutation(len(y))[:samples])
+            X, y, groups = X[subset], y[subset], groups[subset]
+        fresh = benchmark([candidates[index] for index in missing], X, y, folds, jobs,
+                          groups, window - 1)
+        for index, result in zip(missing, fresh):
+            result['window'] = window
+            results[index] = result
+            if paths[index] is not None:
+                os.makedirs(directory, exist_ok=True)
+                with open(paths[index] + '.tmp', 'w') as result_file:
+                    json.dump(result, result_file, indent=2)
+                os.replace(paths[index] + '.tmp', paths[index])
+
+    for result, (name, _) in zip(results, candidates):
+        # the same estimator may be listed under another name
+        result['model'] = name
+    return results
+
+
+def sample_candidates(names=None, budget: int = 8, seed: int = SEED):
+    """Random configurations of the models in {models}
+
+    Keyword Arguments:
+        names {list} -- Models to include, or {None} for all (default: {None})
+        budget {int} -- Configurations per model, at most (default: {8})
+        seed {int} -- Seed for sampling from {PARAM_SPACES} (default: {SEED})
+
+    Returns:
+        list -- (name, estimator) pairs
+    """
+    candidates = []
+    for name, model in models():
+        if names and name not in names:
+            continue
+        space = PARAM_SPACES.get(name, {})
+        size = len(ParameterGrid(space))
+        for params in ParameterSampler(space, min(budget, size), random_state=seed):
+            candidates.append((name, clone(model).set_params(**params)))
+    return candidates
+
+
+def objective(result, latency_weight: float = LATENCY_WEIGHT):
+    """Combines accuracy and single-sample latency into one score, higher is better
+    """
+    return result['accuracy_mean'] - latency_weight * result['latency_p50_us'] / 1000
+
+
+def successive_halving(candidates, data: dataset.Dataset, window: int = 8,
+                       folds: int = 10, jobs: int = None, seed: int = SEED,
+                       cache_dir: str = 'cache', eta: int = 3,
+                       latency_weight: float = LATENCY_WEIGHT):
+    """Searches for the best candidate, spending most time on the promising ones
+
+    Every round evaluates the remaining candidates on {eta} times more
+    samples than the previous one and keeps the best 1/{eta} of them by
+    {objective}. The last round uses the whole training set, so on small
+    sets there are fewer rounds and more candidates reach it.
+
+    Arguments:
+        candidates {list} -- (name, estimator) pairs
+        data {dataset.Dataset} -- The training set
+
+    Keyword Arguments:
+        eta {int} -- Reduction factor between rounds (default: {3})
+        latency_weight {float} -- See {objective} (default: {LATENCY_WEIGHT})
+
+    See {cached_benchmark} for the other arguments.
+
+    Returns:
+        list -- Results of the last round, best first. Each has the
+        {objective} and how many candidates and samples its round had.
+    """
+    if not candidates:
+        raise ValueError("No candidates to search")
+    total = len(data.features(window)[1])
+    if not total:
+        raise ValueError("No feature vectors with a window of %d samples in the "
+                         "training set" % window)
+    # every fold needs enough samples to fit any candidate, even if that
+    # means fewer rounds
+    smallest = min(total, folds * MIN_FOLD_SAMPLES)
+    rounds = min(math.ceil(math.log(len(candidates), eta)),
+                 int(math.log(total / smallest, eta)))
+    for round_index in range(rounds + 1):
+        samples = total // eta ** (rounds - round_index)
+        if len(candidates) == 1:
+            # nothing left to compare, so go straight to the whole set
+            samples = total
+        results = cached_benchmark(candidates, data, window, folds, jobs, seed, cache_dir,
+                                   None if samples >= total else samples)
+        for result in results:
+            result['objective'] = objective(result, latency_weight)
+            result['round'] = round_index
+            result['round_samples'] = samples
+            result['round_candidates'] = len(candidates)
+        order = sorted(range(len(results)), key=lambda index: results[index]['objective'],
+                       reverse=True)
+        print("Round %d: %d candidates on %d samples, best %s %.4f" % (
+            round_index, len(candidates), samples, results[order[0]]['model'],
+            results[order[0]]['objective']))
+        if samples >= total:
+            break
+        if round_index < rounds:
+            keep = max(1, len(candidates) // eta)
+            candidates = [candidates[index] for index in order[:keep]]
+    return [results[index] for index in order]
+
+
+def best_result(results):
+    """The result with the best {objective} if it has been computed, else the most accurate
+    """
+    return max(results, key=lambda result: result.get('objective', result['accuracy_mean']))
+
+
+def export(result, filename: str = MODEL_FILE):
+    """Writes a benchmark result as the model used by {clf_predict.Predict}
+    """
+    with open(filename, 'w') as model_file:
+        json.dump({
+            'name': result['model'],
+            'estimator': result['estimator'],
+            'params': result['params'],
+            'window': result['window'],
+            'accuracy': result['accuracy_mean'],
+            'latency_p50_us': result['latency_p50_us'],
+        }, model_file, indent=2)
+
+
+def read_results(filename: str):
+    with open(filename) as json_file:
+        return json.load(json_file)
+
+
+def write_results(results, filename: str):
+    """Saves benchmark results as JSON or CSV, depending on the extension
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if filename.endswith('.csv'):
+        columns = [key for key in results[0] if key not in ('fold_accuracies', 'params')]
+        with open(filename, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(filename, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+def print_results(results):
+    print("%-5s %9s %8s %10s %12s %11s %11s  %s" % (
+        "model", "accuracy", "std", "fit (ms)", "predict (ms)", "p50 (us)", "p99 (us)",
+        "params"))
+    for result in results:
+        print("%-5s %9.4f %8.4f %10.2f %12.2f %11.1f %11.1f  %s" % (
+            result['model'], result['accuracy_mean'], result['accuracy_std'],
+            result['fit_time'] * 1000, result['predict_time'] * 1000,
+            result['latency_p50_us'], result['latency_p99_us'],
+            ", ".join("%s=%r" % item for item in sorted(result.get('params', {}).items()))))
+
+
+def plot(results, estimator, X, y, filename: str, groups=None, gap: int = 0):
+    """Plots the accuracy of every model and the learning curve of the best
+    to an image file, cross-validated with {blocked_splits}
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import FuncFormatter
+
+    names = [result['model'] for result in results]
+    best = best_result(results)
+
+    """
+    learning curve for best results from models
+    """
+    kfold = blocked_splits(len(y), len(best['fold_accuracies']), groups, gap)
+    train_sizes, train_scores, test_scores = learning_curve(estimator,
+                                                            X, y,
+                                                            n_jobs=-1,
+                                                            cv=kfold,
+                                                            train_sizes=np.linspace
+                                                            (.1, 1.0, 5),
+                                                            verbose=0)
+
+    train_scores_mean = np.mean(train_scores, axis=1)
+    train_scores_std = np.std(train_scores, axis=1)
+    test_scores_mean = np.mean(test_scores, axis=1)
+    test_scores_std = np.std(test_scores, axis=1)
+
+    fig, (ax1, ax2) = plt.subplots(2, 1)
+    fig.subplots_adjust(hspace=0.8)
+
+    """
+    boxplot algorithm comparison
+    """
+
+    ax1.set_title('Algorithm Comparison')
+    ax1.boxplot([result['fold_accuracies'] for result in results])
+    ax1.set_xticklabels(names)
+
+    ax2.set_title(best['model'])
+    ax2.set_xlabel("Training examples")
+    ax2.set_ylabel("Score")
+    ax2.invert_yaxis()
+
+    # box-like grid
+    ax2.grid()
+
+    # plot the std deviation as a transparent range at each training set size
+    ax2.fill_between(train_sizes,
+                     train_scores_mean - train_scores_std,
+                     train_scores_mean + train_scores_std,
+                     alpha=0.1,
+                     color="r")
+
+    ax2.fill_between(train_sizes,
+                     test_scores_mean - test_scores_std,
+                     test_scores_mean + test_scores_std,
+                     alpha=0.1,
+                     color="g")
+
+    # plot the average training and test score lines at each training set size
+    ax2.plot(train_sizes,
+             train_scores_mean,
+             'o-',
+             color="r",
+             label="Training score")
+
+    ax2.plot(train_sizes,
+             test_scores_mean,
+             'o-',
+             color="g",
+             label="Cross-validation score")
+
+    ax2.annotate("%.1f%%" % (train_scores_mean[-1] * 100),
+                 xy=(train_sizes[-1], train_scores_mean[-1]),
+                 xytext=(5, 0), textcoords='offset points', va='center')
+
+    ax2.annotate("%.1f%%" % (test_scores_mean[-1] * 100),
+                 xy=(train_sizes[-1], test_scores_mean[-1]),
+                 xytext=(5, 0), textcoords='offset points', va='center')
+
+    # sizes the window for readability and displays the plot
+    # shows error from 0 to 1.1
+    ax2.set_ylim(-.1, 1.1)
+    ax2.set_xlim(0, train_sizes[-1] + 15)
+    ax2.set_xlabel("Training Set Size")
+    ax2.set_xticks(train_sizes)
+    ax2.set_ylabel("Accuracy Score")
+    ax2.legend(loc="best")
+    ax2.yaxis.set_major_formatter(FuncFormatter(lambda y, _: '{:.0%}'.format(y)))
+
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-j', '--jobs', type=int, default=None,
+                        help="Worker processes (default: one per CPU)")
+    common.add_argument('-k', '--folds', type=int, default=10,
+                        help="Number of cross-validation folds")
+    common.add_argument('-w', '--window', type=int, default=8,
+                        help="Samples per feature window, as in Predict")
+    common.add_argument('-m', '--models', type=lambda names: names.split(','),
+                        help="Comma-separated models to include (default: all)")
+    common.add_argument('--seed', type=int, default=SEED,
+                        help="Seed for picking the subsamples and candidate parameters")
+    common.add_argument('--no-cache', action='store_true',
+                        help="Evaluate every model, even if it has a cached result")
+
+    evaluate = subparsers.add_parser('evaluate', parents=[common],
+                                     help="Compare the models with default parameters")
+    evaluate.add_argument('-o', '--output', default='results/models.json',
+                          help="Where to write the results (.json or .csv)")
+    evaluate.add_argument('--plot', metavar='FILE',
+                          help="Also plot the comparison and the best model's "
+                          "learning curve to an image file")
+
+    tune = subparsers.add_parser('tune', parents=[common],
+                                 help="Search PARAM_SPACES with successive halving")
+    tune.add_argument('-o', '--output', default='results/tune.json',
+                      help="Where to write the results (.json or .csv)")
+    tune.add_argument('-b', '--budget', type=int, default=8,
+                      help="Random configurations to try per model")
+    tune.add_argument('--eta', type=int, default=3,
+                      help="Keep the best 1/eta candidates after each round")
+    tune.add_argument('--latency-weight', type=float, default=LATENCY_WEIGHT,
+                      help="Accuracy traded for each ms of single-sample latency")
+    tune.add_argument('--export', nargs='?', const=MODEL_FILE, metavar='FILE',
+                      help="Also export the winner for Predict (default: %s)" % MODEL_FILE)
+
+    export_parser = subparsers.add_parser('export', help="Write the best model for Predict")
+    export_parser.add_argument('results', nargs='?', default='results/models.json',
+                               help="Results of evaluate or tune (.json)")
+    export_parser.add_argument('-m', '--model',
+                               help="Export this model instead of the best one")
+    export_parser.add_argument('-o', '--output', default=MODEL_FILE,
+                               help="Where to write the model")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        results = read_results(args.results)
+        if args.model:
+            results = [result for result in results if result['model'] == args.model]
+            if not results:
+                parser.error("%s is not in %s" % (args.model, args.results))
+        best = best_result(results)
+        export(best, args.output)
+        print("Exported %s %s (accuracy %.4f) to %s" % (best['model'], best['params'],
+                                                        best['accuracy_mean'], args.output))
+        return
+
+    if args.command == 'tune':
+        candidates = sample_candidates(args.models, args.budget, args.seed)
+    else:
+        candidates = [(name, model) for name, model in models()
+                      if not args.models or name in args.models]
+    if not candidates:
+        parser.error("no models selected")
+
+    # Same features the live predictor classifies
+    data = dataset.load()
+    cache_dir = None if args.no_cache else 'cache'
+    if args.command == 'tune':
+        results = successive_halving(candidates, data, args.window, args.folds, args.jobs,
+                                     args.seed, cache_dir, args.eta, args.latency_weight)
+    else:
+        results = cached_benchmark(candidates, data, args.window, args.folds, args.jobs,
+                                   args.seed, cache_dir)
+    print_results(results)
+    write_results(results, args.output)
+
+    if args.command == 'tune' and args.export:
+        export(results[0], args.export)
+        print("Exported %s %s to %s" % (results[0]['model'], results[0]['params'],
+                                        args.export))
+
+    if args.command == 'evaluate' and args.plot:
+        X, Y, groups = data.features(args.window, groups=True)
+        best = best_result(results)
+        estimator = candidates[results.index(best)][1]
+        plot(results, estimator, X, Y, args.plot, groups, args.window - 1)
 
-"""
-boxplot algorithm comparison
-"""
 
-ax1.set_title('Algorithm Comparison')
-ax1.boxplot(results)
-ax1.set_xticklabels(names)
-
-ax2.set_title(names[pd.Series(cv_means).idxmax()])
-ax2.legend(loc="best")
-ax2.set_xlabel("Training examples")
-ax2.set_ylabel("Score")
-ax2.invert_yaxis()
-
-# box-like grid
-ax2.grid()
-
-# plot the std deviation as a transparent range at each training set size
-ax2.fill_between(train_sizes,
-                 train_scores_mean - train_scores_std,
-                 train_scores_mean + train_scores_std,
-                 alpha=0.1,
-                 color="r")
-
-ax2.fill_between(train_sizes,
-                 test_scores_mean - test_scores_std,
-                 test_scores_mean + test_scores_std,
-                 alpha=0.1,
-                 color="g")
-
-# plot the average training and test score lines at each training set size
-ax2.plot(train_sizes,
-         train_scores_mean,
-         'o-',
-         color="r",
-         label="Training score")
-
-ax2.plot(train_sizes,
-         test_scores_mean,
-         'o-',
-         color="g",
-         label="Cross-validation score")
-
-ax2.annotate("%.1f%%" % (train_scores_mean[-1] * 100),
-             xy=(train_sizes[-1], train_scores_mean[-1]),
-             xytext=(5, 0), textcoords='offset points', va='center')
-
-ax2.annotate("%.1f%%" % (test_scores_mean[-1] * 100),
-             xy=(train_sizes[-1], test_scores_mean[-1]),
-             xytext=(5, 0), textcoords='offset points', va='center')
-
-# sizes the window for readability and displays the plot
-# shows error from 0 to 1.1
-ax2.set_ylim(-.1, 1.1)
-ax2.set_xlim(0, train_sizes[-1] + 15)
-ax2.set_xlabel("Training Set Size")
-ax2.set_xticks(train_sizes)
-ax2.set_ylabel("Accuracy Score")
-ax2.legend(loc="best")
-ax2.yaxis.set_major_formatter(FuncFormatter(lambda y, _: '{:.0%}'.format(y))) 
-plt.show()
+if __name__ == '__main__':
+    main()
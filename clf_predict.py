@@ -1,69 +1,247 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import hashlib
+import importlib
+import json
 import os
-import time
-from collections import deque
+import pickle
 
 import numpy as np
-import pandas as pd
-from sklearn import model_selection
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 
+import dataset
+import features
+import inference
 import sensors
+from smoothing import make_decoder
+
+
+# Written by `clf_models.py export`
+MODEL_FILE = 'model.json'
+COMBINE = ('vote', 'proba')
+DEFAULT_MODEL = {
+    'name': 'LDA',
+    'estimator': 'sklearn.discriminant_analysis.LinearDiscriminantAnalysis',
+    'params': {},
+    'window': 8,
+}
+
+
+def load_model_config(filename: str = MODEL_FILE):
+    """Reads the exported model configuration, or the default one if there
+    is none
+    """
+    try:
+        with open(filename) as model_file:
+            return dict(DEFAULT_MODEL, **json.load(model_file))
+    except FileNotFoundError:
+        return dict(DEFAULT_MODEL)
+
+
+def make_estimator(model: dict):
+    """Creates the unfitted estimator described by a model configuration
+    """
+    module, name = model['estimator'].rsplit('.', 1)
+    return getattr(importlib.import_module(module), name)(**model['params'])
+
+
+def source_digest(module):
+    """Identifies the source code of a module, so a model trained on
+    features computed by older code isn't reused
+    """
+    with open(module.__file__, 'rb') as source:
+        return hashlib.sha256(source.read()).hexdigest()[:16]
+
 
 class Predict():
+    """Classifies the activity from a stream of sensor samples
+
+    The trained classifier is cached on disk, keyed by the contents of the
+    training files and the model configuration, so it is only refit when one
+    of them changes. Predictions go through an {inference.Engine} compiled
+    from it.
+    """
+
+    clf = None
+    engine = None
+    prediction = None
+    # training vectors {inference.compile} checks the compiled model on
+    probes = None
+
+    def __init__(self, window: int = None, hop: int = 4,
+                 data_dir: str = 'data', cache_dir: str = 'cache',
+                 model_file: str = MODEL_FILE, combine: str = 'vote',
+                 smoothing: str = 'none', **decoder_options):
+        """
+        Keyword Arguments:
+            window {int} -- Number of samples summarised by each feature
+            vector, or {None} to use the one the model was chosen with (default: {None})
+            hop {int} -- Classify every {hop} samples (default: {4})
+            data_dir {str} -- Directory with the training recordings (default: {'data'})
+            cache_dir {str} -- Directory for the trained model, or {None} to
+            always retrain (default: {'cache'})
+            model_file {str} -- Model configuration exported by
+            `clf_models.py export` (default: {'model.json'})
+            combine {str} -- How {predict_batch} combines the windows of a
+            batch, one of {COMBINE} (default: {'vote'})
+            smoothing {str} -- Decode the class probabilities of consecutive
+            windows with a {smoothing.Decoder}, one of
+            {smoothing.DECODERS}. Anything but 'none' replaces {combine}
+            (default: {'none'})
+            decoder_options -- Passed on to the decoder
+        """
+        if combine not in COMBINE:
+            raise ValueError("combine must be one of %s" % (COMBINE,))
+        self.combine = combine
+        self.model = load_model_config(model_file)
+        if window is None:
+            window = self.model['window']
+        self.window = window
+        self.features = features.FeatureEngine(window, hop)
+
+        path = None
+        if cache_dir is not None:
+            path = os.path.join(cache_dir, 'predict-%s.pkl' % self.cache_key(data_dir))
+            self.__load(path)
 
-    # Xnew = [[7380, 204, 14644, 69, -117, 191]]
-    start_time = None
-    elapsed_time = None
-    dq = deque()
-    # classifier
-    clf = LinearDiscriminantAnalysis()
-
-    def __init__(self):
-
-        X = []
-        Y = []
-        for filename in os.listdir('data'):
-            data = pd.read_csv('data/'+filename, sep=',', header=None, index_col=0)
-            # print(data)
-            for i in data.index.unique():
-                # Index is activity ID
-                # Y.append(i)
-                # X.append(data.loc[i].values[:250]) #TODO: Change this maximum value to some better dataset
-                for coords in data.loc[i].values:
-                    Y.append(i)
-                    X.append(coords)
+        if self.clf is None:
+            self.clf = self.train(dataset.load(data_dir, cache_dir))
+            if path is not None:
+                self.__save(path)
+        self.engine = inference.compile(self.clf, samples=self.probes)
+        self.decoder = make_decoder(smoothing, self.engine.classes, **decoder_options)
+
+    def config(self):
+        """Everything besides the data that affects the trained model
+        """
+        # unpickling the model imports it anyway
+        import sklearn
+
+        return {
+            'model': self.model['estimator'],
+            'params': self.model['params'],
+            'window': self.window,
+            'features': features.FEATURES,
+            'feature_code': source_digest(features),
+            'sklearn': sklearn.__version__,
+            'split': {'test_size': 0.3, 'random_state': 100},
+        }
+
+    def cache_key(self, data_dir):
+        """Hashes the training recordings, the model configuration, the
+        feature code and the sklearn version
+        """
+        key = repr(sorted(self.config().items())) + dataset.digest(data_dir)
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def __load(self, path):
+        try:
+            with open(path, 'rb') as model_file:
+                cached = pickle.load(model_file)
+            self.clf = cached['clf']
+            self.probes = cached['probes']
+        except FileNotFoundError:
+            pass
+        except Exception as exception:
+            print("Ignoring cached model %s: %s" % (path, exception))
+
+    def __save(self, path):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # only the model for the current data is ever useful
+        for filename in os.listdir(directory):
+            if filename.startswith('predict-') and filename.endswith('.pkl'):
+                os.remove(os.path.join(directory, filename))
+        with open(path + '.tmp', 'wb') as model_file:
+            pickle.dump({'clf': self.clf, 'probes': self.probes}, model_file)
+        os.replace(path + '.tmp', path)
+
+    def train(self, data: dataset.Dataset):
+        """Fits a new classifier on a training set
+        """
+        # Only needed when the cached model is stale
+        from sklearn import model_selection
+
+        X, Y = data.features(self.window)
 
         # Split data
         X_train, X_test, y_train, y_test = model_selection.train_test_split(
             X, Y,
-            test_size=0.3,
-            random_state=100)
+            **self.config()['split'])
 
-        self.clf.fit(X_train, y_train)
+        clf = make_estimator(self.model)
+        clf.fit(X_train, y_train)
+        rows = np.random.RandomState(0).permutation(len(X_train))[:inference.PROBES]
+        self.probes = X_train[rows]
+        return clf
 
     def predict(self, data: sensors.SensorData):
+        """Adds a sample to the sliding window.
+
+        Returns:
+            int -- The latest prediction, updated every {hop} samples, or
+            {None} while the first window is filling up
+        """
         if data is None:
             return None
-        elif self.start_time is None:
-            self.start_time = time.time()
-        self.elapsed_time = time.time() - self.start_time
 
-        self.dq.append(
-            {'time': self.elapsed_time, 'data': sensors.SensorData(*data.clf_data())})
-        # if time more than 1 second
-        if self.dq and self.elapsed_time - self.dq[0]['time'] >= 1:
-            save_data = data - self.dq.popleft()['data']
+        vector = self.features.push(tuple(data.clf_data()))
+        if vector is None:
+            pass
+        elif self.decoder is not None:
+            self.prediction = self.decoder.update(self.engine.predict_proba(vector[None])[0])
+        else:
+            self.prediction = int(self.engine.predict_one(vector))
+        return self.prediction
+
+    def predict_batch(self, samples):
+        """Adds many samples to the sliding window and classifies every
+        window they complete in one call, see {predict_windows}.
+
+        Arguments:
+            samples {list} -- {SensorData} samples, oldest first, or a
+            {SensorBatch}
 
-            # data_tobe_classified = pd.read_csv('new_data.csv',
-            #                                 sep=',',
-            #                                 header=None)
+        Returns:
+            int -- The decision for the batch, the previous one if the batch
+            completed no window, or {None} while the first window is filling up
+        """
+        if isinstance(samples, sensors.SensorBatch):
+            rows = samples.clf_data()
+        else:
+            rows = [tuple(sample.clf_data()) for sample in samples if sample is not None]
+        vectors = [vector for vector in map(self.features.push, rows) if vector is not None]
+        if vectors:
+            self.predict_windows(np.array(vectors))
+        return self.prediction
 
-            return self.clf.predict(np.asarray([(list(save_data.clf_data()))]))
+    def predict_windows(self, X):
+        """Classifies a batch of feature vectors and combines them into one
+        decision: the most common class, the latest one winning ties, with
+        'vote', or the class with the highest mean probability with
+        'proba'. With a decoder, every window is decoded in
+        order and the last decision is kept.
+
+        Arguments:
+            X {numpy.ndarray} -- Feature vectors, oldest first
+
+        Returns:
+            int -- The decision, or {None} for an empty batch
+        """
+        if not len(X):
+            return None
+        if self.decoder is not None:
+            for proba in self.engine.predict_proba(X):
+                self.prediction = self.decoder.update(proba)
+        elif self.combine == 'proba':
+            proba = self.engine.predict_proba(X).mean(axis=0)
+            self.prediction = int(self.engine.classes[proba.argmax()])
+        else:
+            predicted = self.engine.predict(X)
+            classes, counts = np.unique(predicted, return_counts=True)
+            winners = classes[counts == counts.max()]
+            # the latest of the tied classes
+            self.prediction = int(next(label for label in predicted[::-1] if label in winners))
+        return self.prediction
 
 def main():
     p = Predict()
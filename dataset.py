@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""Loads every recording in `data/` into one contiguous training set
+
+The first load writes the combined arrays to the cache directory. Later loads
+read them back directly, memory-mapped when they are large, until a recording
+is added, removed or changed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+import features
+import recording
+
+# Channels used by the classifier, in the order of {SensorData.clf_data}
+CHANNELS = features.CHANNELS
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+def sources(data_dir: str = 'data'):
+    """Paths of every recording in a directory, CSV or {recording} format
+
+    A CSV recording converted by {convert_csv} is left out in favour of its
+    `.rec`, so its samples aren't counted twice.
+    """
+    filenames = sorted(os.listdir(data_dir))
+    paths = []
+    for filename in filenames:
+        path = os.path.join(data_dir, filename)
+        if filename.endswith('.csv'):
+            converted = os.path.join(data_dir, os.path.splitext(filename)[0] + '.rec')
+            if not recording.is_recording(converted):
+                paths.append(path)
+        elif recording.is_recording(path):
+            paths.append(path)
+    return paths
+
+
+def digest(data_dir: str = 'data'):
+    """Identifies the current contents of a data directory
+
+    Uses names, sizes and modification times, so nothing has to be read.
+    """
+    hasher = hashlib.sha256()
+    for path in sources(data_dir):
+        files = recording.chunk_files(path) if os.path.isdir(path) else [path]
+        for filename in files:
+            stat = os.stat(filename)
+            hasher.update(("%s %d %d\n" % (os.path.relpath(filename, data_dir),
+                                           stat.st_size, stat.st_mtime_ns)).encode())
+    return hasher.hexdigest()[:16]
+
+
+def read_csv(path: str):
+    """Reads a legacy CSV recording.
+
+    Returns:
+        tuple -- (X, y): samples with shape (N, 4) and their labels
+    """
+    rows = np.loadtxt(path, delimiter=',', ndmin=2)
+    return rows[:, 1:5], rows[:, 0].astype(np.int16)
+
+
+def csv_rows(path: str):
+    """Number of samples in a legacy CSV recording, counted without parsing
+    them. Blank lines and comments are skipped, as by {read_csv}.
+    """
+    with open(path, 'rb') as csv_file:
+        return sum(1 for line in csv_file if line.split(b'#', 1)[0].strip())
+
+
+def csv_to_records(path: str, rate: float = 100.0):
+    """Converts a legacy CSV recording to an array with {recording.RECORD_DTYPE}
+
+    CSV files have no timestamps or orientation, so samples are spaced at
+    {rate} Hz and the quaternion is left at zero.
+    """
+    X, y = read_csv(path)
+    records = np.zeros(len(X), dtype=recording.RECORD_DTYPE)
+    records['time'] = np.arange(len(X)) / rate
+    records['seq'] = np.arange(len(X))
+    records['accel'] = X[:, 0:3]
+    records['flex'] = X[:, 3]
+    records['label'] = y
+    return records
+
+
+def convert_csv(path: str, destination: str = None, rate: float = 100.0):
+    """Writes a legacy CSV recording in the {recording} format
+
+    By default the recording goes next to the CSV, which {sources} then
+    leaves out.
+
+    Returns:
+        str -- The path of the new recording
+    """
+    if destination is None:
+        destination = os.path.splitext(path)[0] + '.rec'
+    recording.save(destination, csv_to_records(path, rate))
+    return destination
+
+
+class Dataset():
+    """Every sample of every recording, stored contiguously
+
+    Attributes:
+        X {numpy.ndarray} -- Samples with shape (N, 4), see {CHANNELS}
+        y {numpy.ndarray} -- Activity label of each sample
+        sessions {list} -- (name, start, stop) for each recording
+        digest {str} -- Identifies the data the set was built from
+    """
+
+    def __init__(self, X, y, sessions, digest=None):
+        self.X = X
+        self.y = y
+        self.sessions = sessions
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.y)
+
+    def segments(self):
+        """Yields (label, start, stop) for every run of one activity
+
+        Runs never cross from one recording into the next.
+        """
+        for _, start, stop in self.sessions:
+            labels = np.asarray(self.y[start:stop])
+            if not len(labels):
+                continue
+            edges = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+            bounds = np.concatenate(([0], edges, [len(labels)]))
+            for begin, end in zip(bounds[:-1], bounds[1:]):
+                yield int(labels[begin]), start + int(begin), start + int(end)
+
+    def features(self, window: int = 8, hop: int = 1, groups: bool = False):
+        """Computes the {features.FeatureEngine} vectors of every run
+
+        Keyword Arguments:
+            groups {bool} -- Also return the index of the run each vector
+            comes from, in the order of {segments} (default: {False})
+
+        Returns:
+            tuple -- (X, y) with one feature vector per row, or (X, y, groups)
+        """
+        vectors = []
+        labels = []
+        indices = []
+        for index, (label, start, stop) in enumerate(self.segments()):
+            run = features.extract(self.X[start:stop], window, hop)
+            vectors.append(run)
+            labels.append(np.full(len(run), label, dtype=np.int16))
+            indices.append(np.full(len(run), index))
+        if not vectors:
+            X = np.empty((0, len(features.FEATURES) * len(CHANNELS)))
+            y = np.empty(0, dtype=np.int16)
+            return (X, y, np.empty(0, dtype=int)) if groups else (X, y)
+        if groups:
+            return np.concatenate(vectors), np.concatenate(labels), np.concatenate(indices)
+        return np.concatenate(vectors), np.concatenate(labels)
+
+
+def _columns(chunk):
+    """Classifier channels and labels of a CSV chunk or a recording chunk
+    """
+    if isinstance(chunk, tuple):
+        return chunk
+    return np.column_stack((chunk['accel'], chunk['flex'])), chunk['label']
+
+
+def build(data_dir: str = 'data', destination: str = None):
+    """Reads every recording into one set, optionally writing it to disk
+
+    Keyword Arguments:
+        data_dir {str} -- Directory with the recordings (default: {'data'})
+        destination {str} -- Directory to write `X.npy`, `y.npy` and
+        `sessions.json` to, or {None} to keep everything in memory (default: {None})
+    """
+    # First pass: sizes only. Recordings are memory-mapped and CSV rows are
+    # counted without being parsed, so this is cheap and the combined set
+    # never needs to fit in memory twice.
+    parts = []
+    for path in sources(data_dir):
+        if os.path.isdir(path):
+            chunks = list(recording.chunks(path))
+            parts.append((path, chunks, sum(len(chunk) for chunk in chunks)))
+        else:
+            parts.append((path, None, csv_rows(path)))
+    total = sum(size for _, _, size in parts)
+
+    if destination is None:
+        X = np.empty((total, len(CHANNELS)))
+        y = np.empty(total, dtype=np.int16)
+    else:
+        os.makedirs(destination, exist_ok=True)
+        X = np.lib.format.open_memmap(os.path.join(destination, 'X.npy'), mode='w+',
+                                      dtype=np.float64, shape=(total, len(CHANNELS)))
+        y = np.lib.format.open_memmap(os.path.join(destination, 'y.npy'), mode='w+',
+                                      dtype=np.int16, shape=(total,))
+
+    sessions = []
+    position = 0
+    for path, chunks, size in parts:
+        start = position
+        if chunks is None:
+            # CSV recordings are only parsed, one at a time, to be copied
+            chunks = [read_csv(path)]
+            if len(chunks[0][1]) != size:
+                raise ValueError("%s has %d samples, but %d rows were counted"
+                                 % (path, len(chunks[0][1]), size))
+        for chunk in chunks:
+            values, labels = _columns(chunk)
+            X[position:position + len(labels)] = values
+            y[position:position + len(labels)] = labels
+            position += len(labels)
+        sessions.append((os.path.basename(path), start, position))
+
+    if destination is not None:
+        X.flush()
+        y.flush()
+        with open(os.path.join(destination, 'sessions.json'), 'w') as sessions_file:
+            json.dump(sessions, sessions_file)
+    return Dataset(X, y, sessions)
+
+
+def load(data_dir: str = 'data', cache_dir: str = 'cache',
+         mmap_threshold: int = MMAP_THRESHOLD):
+    """Loads the training set, building it if the recordings changed.
+
+    Keyword Arguments:
+        data_dir {str} -- Directory with the recordings (default: {'data'})
+        cache_dir {str} -- Where to keep the combined arrays, or {None} to
+        always build them in memory (default: {'cache'})
+        mmap_threshold {int} -- Memory-map the arrays when they are larger
+        than this many bytes (default: {64 MiB})
+
+    Returns:
+        Dataset -- The combined set
+    """
+    key = digest(data_dir)
+    if cache_dir is None:
+        dataset = build(data_dir)
+        dataset.digest = key
+        return dataset
+
+    path = os.path.join(cache_dir, 'dataset-%s' % key)
+    if not os.path.isdir(path):
+        # build under a temporary name so an interrupted build is never used
+        if os.path.isdir(path + '.tmp'):
+            shutil.rmtree(path + '.tmp')
+        build(data_dir, path + '.tmp')
+        for filename in os.listdir(cache_dir):
+            if filename.startswith('dataset-') and not filename.endswith('.tmp'):
+                shutil.rmtree(os.path.join(cache_dir, filename))
+        os.replace(path + '.tmp', path)
+
+    size = os.path.getsize(os.path.join(path, 'X.npy'))
+    mmap_mode = 'r' if size > mmap_threshold else None
+    X = np.load(os.path.join(path, 'X.npy'), mmap_mode=mmap_mode)
+    y = np.load(os.path.join(path, 'y.npy'), mmap_mode=mmap_mode)
+    with open(os.path.join(path, 'sessions.json')) as sessions_file:
+        sessions = [tuple(session) for session in json.load(sessions_file)]
+    return Dataset(X, y, sessions, key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    info = subparsers.add_parser('info', help="Show what the training set contains")
+    info.add_argument('--data', default='data', help="Directory with the recordings")
+
+    convert = subparsers.add_parser('convert', help="Convert CSV recordings to .rec")
+    convert.add_argument('files', nargs='+', help="CSV files to convert")
+    convert.add_argument('--rate', type=float, default=100.0,
+                         help="Sample rate to assume, since CSV has no timestamps")
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        dataset = load(args.data)
+        print("%d samples in %d recordings (%s)" % (len(dataset), len(dataset.sessions),
+                                                    dataset.digest))
+        for name, start, stop in dataset.sessions:
+            labels, counts = np.unique(dataset.y[start:stop], return_counts=True)
+            print("  %-32s %6d  %s" % (name, stop - start, dict(zip(labels.tolist(), counts.tolist()))))
+    elif args.command == 'convert':
+        for filename in args.files:
+            print("%s -> %s" % (filename, convert_csv(filename, rate=args.rate)))
+
+
+if __name__ == '__main__':
+    main()
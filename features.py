@@ -0,0 +1,157 @@
+"""Rolling features over a sliding window of sensor samples
+"""
+from collections import deque
+
+import numpy as np
+
+CHANNELS = ('ax', 'ay', 'az', 'flex')
+FEATURES = ('mean', 'var', 'min', 'max', 'delta', 'zero_crossings', 'energy')
+
+
+def feature_names(channels=CHANNELS):
+    """Names of the values in a feature vector, in order
+    """
+    return ["%s_%s" % (feature, channel) for feature in FEATURES for channel in channels]
+
+
+class FeatureEngine():
+    """Computes window statistics incrementally
+
+    Samples go into a fixed-size ring buffer. Sums, sums of squares and
+    zero-crossing counts are updated as samples enter and leave the window,
+    and min/max are kept in monotonic queues, so each sample costs O(1) no
+    matter how long the window is.
+    """
+
+    def __init__(self, window: int = 8, hop: int = 4, channels: int = len(CHANNELS)):
+        """
+        Keyword Arguments:
+            window {int} -- Number of samples in the window (default: {8})
+            hop {int} -- Emit a feature vector every {hop} samples once the
+            window is full (default: {4})
+            channels {int} -- Number of values in each sample (default: {4})
+        """
+        if window < 2:
+            raise ValueError("window must have at least 2 samples")
+        if hop < 1:
+            raise ValueError("hop must be at least 1")
+        self.window = window
+        self.hop = hop
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        """Forgets every sample pushed so far
+        """
+        self.ring = np.zeros((self.window, self.channels))
+        self.count = 0
+        self.sum = np.zeros(self.channels)
+        self.sumsq = np.zeros(self.channels)
+        self.crossings = np.zeros(self.channels)
+        self.__min = [deque() for _ in range(self.channels)]
+        self.__max = [deque() for _ in range(self.channels)]
+
+    @property
+    def size(self):
+        """Length of the feature vectors
+        """
+        return len(FEATURES) * self.channels
+
+    def push(self, sample):
+        """Adds one sample to the window.
+
+        Arguments:
+            sample {array_like} -- One value per channel
+
+        Returns:
+            numpy.ndarray -- The feature vector, if one is due at this
+            sample, or {None}
+        """
+        x = np.asarray(sample, dtype=float)
+        window = self.window
+        i = self.count % window
+
+        if self.count >= window:
+            # the oldest sample and the crossing to its successor leave
+            old = self.ring[i]
+            self.sum -= old
+            self.sumsq -= old * old
+            self.crossings -= old * self.ring[(i + 1) % window] < 0
+        if self.count > 0:
+            self.crossings += self.ring[i - 1] * x < 0
+
+        self.ring[i] = x
+        self.sum += x
+        self.sumsq += x * x
+        self.__update_extremes(x)
+        self.count += 1
+
+        if self.count % window == 0:
+            # don't let rounding errors pile up in the running sums
+            self.sum = self.ring.sum(axis=0)
+            self.sumsq = np.square(self.ring).sum(axis=0)
+
+        if self.count < window or (self.count - window) % self.hop:
+            return None
+        return self.features()
+
+    def __update_extremes(self, x):
+        index = self.count
+        expired = index - self.window
+        for channel, value in enumerate(x.tolist()):
+            lows = self.__min[channel]
+            while lows and lows[-1][1] >= value:
+                lows.pop()
+            lows.append((index, value))
+            if lows[0][0] <= expired:
+                lows.popleft()
+
+            highs = self.__max[channel]
+            while highs and highs[-1][1] <= value:
+                highs.pop()
+            highs.append((index, value))
+            if highs[0][0] <= expired:
+                highs.popleft()
+
+    def features(self):
+        """Computes the feature vector for the current window.
+
+        Returns:
+            numpy.ndarray -- Every feature in {FEATURES} for each channel,
+            named by {feature_names}
+        """
+        n = min(self.count, self.window)
+        newest = self.ring[(self.count - 1) % self.window]
+        oldest = self.ring[self.count % self.window if self.count >= self.window else 0]
+        mean = self.sum / n
+        energy = self.sumsq / n
+        return np.concatenate((
+            mean,
+            np.maximum(energy - mean * mean, 0.0),
+            [lows[0][1] for lows in self.__min],
+            [highs[0][1] for highs in self.__max],
+            newest - oldest,
+            self.crossings,
+            energy,
+        ))
+
+
+def extract(samples, window: int = 8, hop: int = 1):
+    """Runs a whole recording through a {FeatureEngine}.
+
+    Arguments:
+        samples {array_like} -- Samples with shape (N, channels)
+
+    Keyword Arguments:
+        window {int} -- Number of samples in the window (default: {8})
+        hop {int} -- Samples between feature vectors (default: {1})
+
+    Returns:
+        numpy.ndarray -- Feature vectors with shape (M, features)
+    """
+    samples = np.asarray(samples, dtype=float)
+    engine = FeatureEngine(window, hop, samples.shape[1])
+    vectors = [vector for vector in map(engine.push, samples) if vector is not None]
+    if not vectors:
+        return np.empty((0, engine.size))
+    return np.array(vectors)
@@ -0,0 +1,290 @@
+"""Fast inference for trained classifiers
+
+sklearn validates its input on every call, which costs more than the model
+itself when classifying one feature vector at a time. {compile} copies what a
+fitted model needs into plain NumPy arrays: coefficients for linear models
+and flattened node arrays for decision trees and forests.
+"""
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+import telemetry
+
+log = telemetry.get_logger(__name__)
+
+# Feature vectors the compiled model must agree with sklearn on
+PROBES = 64
+# Models whose probabilities are the plain mean over their trees. Boosted
+# ensembles weight their trees and are left to sklearn.
+TREE_MODELS = ('DecisionTreeClassifier', 'ExtraTreeClassifier',
+               'RandomForestClassifier', 'ExtraTreesClassifier')
+
+
+class Engine(ABC):
+    """Common interface of compiled models
+
+    Attributes:
+        classes {numpy.ndarray} -- Label of each column of {predict_proba}
+        n_features {int} -- Length of the feature vectors
+    """
+
+    def __init__(self, classes, n_features: int):
+        self.classes = np.asarray(classes)
+        self.n_features = n_features
+        # reused by {predict_one}, so a single sample allocates nothing
+        self.buffer = np.empty((1, n_features))
+
+    @abstractmethod
+    def predict_proba(self, X):
+        """Probability of each class for every row of {X}
+        """
+
+    def predict(self, X):
+        """Predicted class for every row of {X}
+        """
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+    def predict_one(self, vector):
+        """Predicted class of a single feature vector
+        """
+        self.buffer[0] = vector
+        return self.predict(self.buffer)[0]
+
+
+class LinearEngine(Engine):
+    """Linear decision functions, as in LDA or logistic regression
+    """
+
+    def __init__(self, coef, intercept, classes, proba: str = 'softmax'):
+        """
+        Arguments:
+            coef {numpy.ndarray} -- Weights with shape (classes, features),
+            or (1, features) for two classes
+            intercept {numpy.ndarray} -- One bias per row of {coef}
+            classes {numpy.ndarray} -- Class labels
+
+        Keyword Arguments:
+            proba {str} -- How decisions become probabilities: 'softmax' or
+            'ovr' to normalise one sigmoid per class (default: {'softmax'})
+        """
+        super().__init__(classes, coef.shape[1])
+        self.coef = np.ascontiguousarray(coef.T, dtype=float)
+        self.intercept = np.asarray(intercept, dtype=float)
+        self.proba = proba
+        self.scores = np.empty((1, self.coef.shape[1]))
+
+    def decision_function(self, X, out=None):
+        scores = np.dot(X, self.coef, out=out)
+        scores += self.intercept
+        return scores
+
+    def predict_proba(self, X):
+        scores = self.decision_function(np.asarray(X, dtype=float))
+        if scores.shape[1] == 1:
+            positive = 1 / (1 + np.exp(-scores))
+            return np.hstack((1 - positive, positive))
+        if self.proba == 'ovr':
+            proba = 1 / (1 + np.exp(-scores))
+        else:
+            proba = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        scores = self.decision_function(np.asarray(X, dtype=float))
+        if scores.shape[1] == 1:
+            return self.classes[(scores[:, 0] > 0).astype(int)]
+        return self.classes[np.argmax(scores, axis=1)]
+
+    def predict_one(self, vector):
+        self.buffer[0] = vector
+        scores = self.decision_function(self.buffer, out=self.scores)[0]
+        if len(scores) == 1:
+            return self.classes[int(scores[0] > 0)]
+        return self.classes[scores.argmax()]
+
+
+class TreeEngine(Engine):
+    """One or more decision trees, flattened into shared node arrays
+
+    The nodes of every tree are stored back to back. Leaves point to
+    themselves, so all samples in all trees can descend one level at a time
+    with the same vectorized step until the deepest leaf is reached.
+    """
+
+    def __init__(self, trees, classes, n_features: int):
+        """
+        Arguments:
+            trees {list} -- The {sklearn.tree._tree.Tree} of each estimator
+            classes {numpy.ndarray} -- Class labels
+            n_features {int} -- Length of the feature vectors
+        """
+        super().__init__(classes, n_features)
+        roots = []
+        feature, threshold, left, right, value = [], [], [], [], []
+        offset = 0
+        depth = 0
+        for tree in trees:
+            leaf = tree.children_left == -1
+            nodes = np.arange(tree.node_count) + offset
+            roots.append(offset)
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+            left.append(np.where(leaf, nodes, tree.children_left + offset))
+            right.append(np.where(leaf, nodes, tree.children_right + offset))
+            counts = tree.value[:, 0, :]
+            value.append(counts / counts.sum(axis=1, keepdims=True))
+            offset += tree.node_count
+            depth = max(depth, tree.max_depth)
+
+        self.roots = np.array(roots)
+        self.feature = np.concatenate(feature)
+        self.threshold = np.concatenate(threshold)
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.value = np.concatenate(value)
+        self.depth = depth
+
+    def leaves(self, X):
+        """Leaf reached in every tree, with shape (samples, trees)
+        """
+        # sklearn compares features as float32
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        return self.value[self.leaves(X)].mean(axis=1)
+
+
+class SklearnEngine(Engine):
+    """Fallback for models that can't be compiled
+    """
+
+    def __init__(self, clf, n_features: int = None):
+        super().__init__(clf.classes_, n_features or n_features_of(clf))
+        self.clf = clf
+
+    def predict_proba(self, X):
+        if hasattr(self.clf, 'predict_proba'):
+            return self.clf.predict_proba(X)
+        # e.g. SVC without probability estimates
+        scores = self.clf.decision_function(X)
+        if scores.ndim == 1:
+            positive = 1 / (1 + np.exp(-scores))
+            return np.column_stack((1 - positive, positive))
+        proba = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.clf.predict(X)
+
+
+def n_features_of(clf):
+    """Length of the feature vectors a fitted model takes, from whatever
+    attribute the installed sklearn gives it
+
+    Returns:
+        int -- The length, or {None} if the model doesn't tell
+    """
+    for name in ('n_features_in_', 'n_features_'):
+        if hasattr(clf, name):
+            return int(getattr(clf, name))
+    if hasattr(clf, 'coef_'):
+        return np.atleast_2d(clf.coef_).shape[1]
+    if hasattr(clf, 'tree_'):
+        return int(clf.tree_.n_features)
+    if getattr(clf, 'estimators_', None) is not None and len(clf.estimators_):
+        return n_features_of(np.ravel(clf.estimators_)[0])
+    for name in ('support_vectors_', '_fit_X', 'theta_', 'means_'):
+        if hasattr(clf, name):
+            return np.atleast_2d(getattr(clf, name)).shape[1]
+    return None
+
+
+def probes(n_features: int, samples=None, count: int = PROBES):
+    """Feature vectors to check a compiled model with
+
+    Arguments:
+        n_features {int} -- Length of the feature vectors
+
+    Keyword Arguments:
+        samples {numpy.ndarray} -- Training vectors. Half of the probes are
+        rows of it and the other half the same rows plus noise scaled to
+        each feature's deviation, so they land near the real decision
+        boundaries. Without it the probes are unit noise (default: {None})
+        count {int} -- Number of probes (default: {PROBES})
+    """
+    rng = np.random.RandomState(0)
+    if samples is None or not len(samples):
+        return rng.randn(count, n_features)
+    samples = np.asarray(samples, dtype=float)
+    rows = samples[rng.randint(len(samples), size=count // 2)]
+    noisy = rows + rng.randn(*rows.shape) * samples.std(axis=0)
+    return np.vstack((rows, noisy))
+
+
+def _linear(clf):
+    if not (hasattr(clf, 'coef_') and hasattr(clf, 'intercept_')):
+        return None
+    if type(clf).__name__ == 'LinearDiscriminantAnalysis':
+        proba = 'softmax'
+    elif getattr(clf, 'multi_class', None) == 'ovr' or getattr(clf, 'solver', None) == 'liblinear':
+        proba = 'ovr'
+    else:
+        proba = 'softmax'
+    return LinearEngine(np.atleast_2d(clf.coef_), np.atleast_1d(clf.intercept_),
+                        clf.classes_, proba)
+
+
+def _trees(clf):
+    if type(clf).__name__ not in TREE_MODELS:
+        return None
+    if hasattr(clf, 'tree_'):
+        trees = [clf.tree_]
+    else:
+        trees = [tree.tree_ for tree in clf.estimators_]
+    # multi-output trees aren't supported
+    if any(tree.value.shape[1] != 1 for tree in trees):
+        return None
+    return TreeEngine(trees, clf.classes_, int(trees[0].n_features))
+
+
+def compile(clf, verify: bool = True, samples=None):
+    """Builds the fastest {Engine} for a fitted classifier.
+
+    Arguments:
+        clf {sklearn.base.ClassifierMixin} -- A fitted classifier
+
+    Keyword Arguments:
+        verify {bool} -- Check that the compiled model predicts the same
+        classes as {clf} on {probes}, and fall back to {clf} if it
+        doesn't (default: {True})
+        samples {numpy.ndarray} -- Training vectors to probe with, see
+        {probes}. Without them, random probes rarely reach the real feature
+        scale (default: {None})
+
+    Returns:
+        Engine -- A {LinearEngine}, a {TreeEngine} or a {SklearnEngine}
+    """
+    for builder in (_linear, _trees):
+        try:
+            engine = builder(clf)
+        except (AttributeError, ValueError, IndexError):
+            engine = None
+        if engine is None:
+            continue
+        if not verify:
+            return engine
+        X = probes(engine.n_features, samples)
+        if np.array_equal(engine.predict(X), clf.predict(X)) and (
+                not hasattr(clf, 'predict_proba')
+                or np.allclose(engine.predict_proba(X), clf.predict_proba(X), atol=1e-6)):
+            return engine
+        log.warning("Not compiling %s: predictions differ", type(clf).__name__)
+    n_features = None if samples is None else np.shape(samples)[1]
+    return SklearnEngine(clf, n_features)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""Receives sensor frames from many devices over UDP
+
+Each device streams the binary frames of {protocol} to the same port. Packets
+are told apart by their source address, and every device gets its own
+{DeviceSession} with a queue of samples and counters for lost, reordered and
+duplicate frames, taken from the firmware sequence numbers.
+
+The sockets are non-blocking and watched with {selectors}. Whenever one is
+readable, every datagram waiting in it is read into a preallocated buffer
+before going back to the selector, which is as close to `recvmmsg` as the
+standard library gets.
+"""
+import argparse
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+import protocol
+from sensors import SensorData
+
+SEQ_MODULO = 1 << 16
+# Frames arriving at most this far behind count as reordered or duplicates,
+# anything older as a device restart
+REORDER_WINDOW = 1024
+
+
+class DeviceSession():
+    """Samples and link statistics of one device
+
+    Attributes:
+        key {tuple} -- Source address of the device
+        received {int} -- Frames received, not counting duplicates
+        lost {int} -- Frames skipped in the sequence that never arrived
+        reordered {int} -- Frames that arrived after a later one
+        duplicates {int} -- Frames received more than once
+        errors {int} -- Datagrams that held no valid frame
+        dropped {int} -- Samples dropped because the queue was full
+        restarts {int} -- Times the sequence jumped back, as after a reset
+    """
+
+    def __init__(self, key, queue_size: int = 1024):
+        self.key = key
+        self.queue = deque(maxlen=queue_size)
+        self.latest = None
+        self.expected = None
+        self.received = 0
+        self.lost = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.dropped = 0
+        self.restarts = 0
+        self.first_seen = None
+        self.last_seen = None
+        # recent sequence numbers counted as lost, in case they show up late
+        self.__missing = set()
+
+    def track(self, seq: int):
+        """Updates the loss and reordering counters with a sequence number.
+
+        Returns:
+            bool -- Whether the frame is new, as opposed to a duplicate
+        """
+        if self.expected is None:
+            self.expected = (seq + 1) % SEQ_MODULO
+            return True
+        ahead = (seq - self.expected) % SEQ_MODULO
+        behind = SEQ_MODULO - ahead
+        if ahead == 0:
+            self.expected = (seq + 1) % SEQ_MODULO
+        elif ahead < SEQ_MODULO // 2:
+            # a gap: everything in between is missing, unless it shows up late
+            self.lost += ahead
+            if ahead <= REORDER_WINDOW:
+                self.__missing.update((self.expected + i) % SEQ_MODULO for i in range(ahead))
+            self.expected = (seq + 1) % SEQ_MODULO
+        elif behind <= REORDER_WINDOW and seq in self.__missing:
+            self.__missing.discard(seq)
+            self.lost -= 1
+            self.reordered += 1
+        elif behind <= REORDER_WINDOW:
+            self.duplicates += 1
+            return False
+        else:
+            # far behind: the device started counting again
+            self.restarts += 1
+            self.__missing.clear()
+            self.expected = (seq + 1) % SEQ_MODULO
+        if len(self.__missing) > REORDER_WINDOW:
+            self.__missing.clear()
+        return True
+
+    def add(self, sample: SensorData):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(sample)
+        self.latest = sample
+
+    def drain(self):
+        """Returns every sample received since the last call, oldest first.
+        """
+        samples = []
+        popleft = self.queue.popleft
+        while True:
+            try:
+                samples.append(popleft())
+            except IndexError:
+                return samples
+
+    @property
+    def loss(self):
+        """Fraction of the frames sent that never arrived
+        """
+        total = self.received + self.lost
+        return self.lost / total if total else 0.0
+
+    def rate(self, now: float = None):
+        """Frames received per second since the first one
+        """
+        now = time.perf_counter() if now is None else now
+        if self.first_seen is None or now <= self.first_seen:
+            return 0.0
+        return self.received / (now - self.first_seen)
+
+    def stats(self):
+        return {
+            'device': "%s:%d" % self.key[:2],
+            'received': self.received,
+            'lost': self.lost,
+            'loss': self.loss,
+            'reordered': self.reordered,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'restarts': self.restarts,
+            'rate': self.rate(),
+        }
+
+
+class IngestServer():
+    """UDP server that splits incoming frames into one session per device
+    """
+
+    def __init__(self, port: int = 5000, host: str = '0.0.0.0',
+                 queue_size: int = 1024, batch: int = 256,
+                 packet_size: int = 2048, receive_buffer: int = 4 * 1024 * 1024):
+        """
+        Keyword Arguments:
+            port {int} -- UDP port to listen on (default: {5000})
+            host {str} -- Address to bind to (default: {'0.0.0.0'})
+            queue_size {int} -- Samples kept per device before the oldest
+            are dropped (default: {1024})
+            batch {int} -- Most datagrams read from a socket at a time, so
+            one busy socket can't starve the others (default: {256})
+            packet_size {int} -- Largest datagram accepted (default: {2048})
+            receive_buffer {int} -- Kernel receive buffer to ask for, in
+            bytes, so bursts aren't dropped between polls (default: {4 MiB})
+        """
+        self.queue_size = queue_size
+        self.batch = batch
+        self.receive_buffer = receive_buffer
+        self.sessions = {}
+        self.errors = 0
+        self.selector = selectors.DefaultSelector()
+        self.__buffer = bytearray(packet_size)
+        self.__view = memoryview(self.__buffer)
+        self.__thread = None
+        self.__running = False
+        self.listen(port, host)
+
+    def listen(self, port: int, host: str = '0.0.0.0'):
+        """Receives on another port as well
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer)
+        except OSError:
+            pass
+        sock.bind((host, port))
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ)
+        return sock
+
+    @property
+    def addresses(self):
+        return [key.fileobj.getsockname() for key in self.selector.get_map().values()]
+
+    def session(self, key):
+        """The session of a device, created on first use
+        """
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = DeviceSession(key, self.queue_size)
+        return session
+
+    def poll(self, timeout: float = None):
+        """Waits up to {timeout} seconds for datagrams and reads every one
+        that is waiting.
+
+        Returns:
+            int -- Number of datagrams read
+        """
+        count = 0
+        for key, _ in self.selector.select(timeout):
+            count += self.__read(key.fileobj)
+        return count
+
+    def __read(self, sock):
+        buffer = self.__buffer
+        view = self.__view
+        recvfrom_into = sock.recvfrom_into
+        count = 0
+        while count < self.batch:
+            try:
+                size, address = recvfrom_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                # ICMP port unreachable from an earlier send, on Windows
+                continue
+            count += 1
+            self.handle(bytes(view[:size]), address, time.perf_counter())
+        return count
+
+    def handle(self, data: bytes, address, t_recv: float):
+        """Adds the frames of one datagram to the session of its sender
+        """
+        session = self.session(address)
+        session.last_seen = t_recv
+        if session.first_seen is None:
+            session.first_seen = t_recv
+        records, _, errors = protocol.decode(data)
+        if not len(records):
+            session.errors += 1
+            self.errors += 1
+            return
+        session.errors += errors
+
+        quat = records['quat'] / protocol.QUAT_SCALE
+        accel = records['accel'].astype(float)
+        for (gw, gx, gy, gz), (ax, ay, az), flex, seq, millis in zip(
+                quat.tolist(), accel.tolist(), records['flex'].tolist(),
+                records['seq'].tolist(), records['millis'].tolist()):
+            if not session.track(seq):
+                continue
+            session.received += 1
+            sample = SensorData(gw, gx, gy, gz, ax, ay, az,
+                                flex if flex != float("inf") else 0)
+            sample.seq = session.received - 1
+            sample.t_recv = t_recv
+            sample.fw_seq = seq
+            sample.fw_millis = millis
+            session.add(sample)
+
+    def start(self):
+        """Polls in a background thread until {stop}
+        """
+        if self.__running:
+            return
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name="ingest", daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        while self.__running:
+            self.poll(0.5)
+
+    def stop(self):
+        self.__running = False
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def close(self):
+        """Stops polling and closes every socket
+        """
+        self.stop()
+        for key in list(self.selector.get_map().values()):
+            self.selector.unregister(key.fileobj)
+            key.fileobj.close()
+        self.selector.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_address(text: str):
+    """Parses `host:port` into an address tuple
+    """
+    host, _, port = text.rpartition(':')
+    return (socket.gethostbyname(host), int(port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, nargs='+', default=[5000],
+                        help="UDP ports to listen on")
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help="Seconds between reports")
+    parser.add_argument('--predict', action='store_true',
+                        help="Classify the activity of every device")
+    args = parser.parse_args()
+
+    predictors = {}
+    if args.predict:
+        from clf_predict import Predict
+
+    with IngestServer(args.port[0]) as server:
+        for port in args.port[1:]:
+            server.listen(port)
+        print("Listening on", ", ".join("%s:%d" % address for address in server.addresses))
+        server.start()
+        try:
+            while True:
+                time.sleep(args.interval)
+                for key, session in list(server.sessions.items()):
+                    stats = session.stats()
+                    line = ("%(device)-21s %(rate)7.1f/s  lost %(lost)d (%(loss).2f%%)"
+                            "  reordered %(reordered)d  duplicates %(duplicates)d"
+                            "  errors %(errors)d  dropped %(dropped)d") % dict(
+                                stats, loss=stats['loss'] * 100)
+                    samples = session.drain()
+                    if args.predict:
+                        if key not in predictors:
+                            predictors[key] = Predict()
+                        line += "  prediction %s" % predictors[key].predict_batch(samples)
+                    print(line)
+        except KeyboardInterrupt:
+            print("Interrupted.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Latency histograms for the path from a sensor sample to the screen
+
+Samples are stamped with {time.perf_counter} when they are received. Each
+stage of the pipeline records how long it took into a {Histogram}:
+
+| Stage   | From                       | To                            |
+|---------|----------------------------|-------------------------------|
+| parse   | bytes received             | samples parsed                |
+| queue   | bytes received             | sample taken by the main loop |
+| predict | start of classification    | end of classification         |
+| draw    | start of the frame         | buffers swapped               |
+| total   | newest sample received     | buffers swapped               |
+"""
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+STAGES = ('parse', 'queue', 'predict', 'draw', 'total')
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram():
+    """Counts latencies in logarithmic buckets
+
+    Recording costs the same no matter how many values were seen, and the
+    memory is fixed. Percentiles are accurate to the width of a bucket,
+    about 6% with the default 40 buckets per decade.
+    """
+
+    def __init__(self, low: float = 1e-6, high: float = 10.0, per_decade: int = 40):
+        """
+        Keyword Arguments:
+            low {float} -- Smallest latency told apart, in seconds (default: {1e-6})
+            high {float} -- Largest latency told apart, in seconds (default: {10.0})
+            per_decade {int} -- Buckets for every power of ten (default: {40})
+        """
+        self.low = low
+        self.per_decade = per_decade
+        self.size = int(math.ceil(math.log10(high / low) * per_decade)) + 2
+        self.reset()
+
+    def reset(self):
+        """Forgets every value recorded so far
+        """
+        self.counts = np.zeros(self.size, dtype=np.int64)
+        self.count = 0
+        self.max = 0.0
+
+    def __buckets(self, seconds):
+        # bucket 0 holds everything up to {low}, the last one everything too large
+        scaled = np.log10(np.maximum(seconds, self.low) / self.low) * self.per_decade
+        return np.minimum(np.ceil(scaled).astype(np.int64), self.size - 1)
+
+    def record(self, seconds: float):
+        """Adds one latency, in seconds
+        """
+        if seconds <= self.low:
+            index = 0
+        else:
+            index = min(int(math.ceil(math.log10(seconds / self.low) * self.per_decade)),
+                        self.size - 1)
+        self.counts[index] += 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def record_many(self, seconds):
+        """Adds an array of latencies, in seconds
+        """
+        seconds = np.asarray(seconds, dtype=float)
+        if not seconds.size:
+            return
+        self.counts += np.bincount(self.__buckets(seconds), minlength=self.size)
+        self.count += seconds.size
+        self.max = max(self.max, float(seconds.max()))
+
+    def percentile(self, percent: float):
+        """Latency below which {percent}% of the values fall, in seconds
+
+        Returns the upper edge of the bucket, or {None} if nothing was recorded.
+        The last bucket has no upper edge, so it gives the largest value seen.
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(percent / 100 * self.count)))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        if index == self.size - 1:
+            return self.max
+        return min(self.low * 10 ** (index / self.per_decade), self.max)
+
+
+class LatencyMonitor():
+    """Keeps a {Histogram} per stage and reports them periodically
+
+    Every {interval} seconds, {tick} takes a summary of the histograms,
+    appends it to the log file as one JSON line and starts over, so each
+    report covers only the last interval.
+
+    Stages may be recorded from any thread, such as the parse stage from
+    the {Sensors} reader, so the histograms are only touched under a lock.
+    """
+
+    def __init__(self, log_file: str = None, interval: float = 5.0):
+        """
+        Keyword Arguments:
+            log_file {str} -- File to append a JSON line to after every
+            interval, or {None} (default: {None})
+            interval {float} -- Seconds between reports (default: {5.0})
+        """
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.log_file = log_file
+        self.interval = interval
+        self.last_report = None
+        self.__since = time.perf_counter()
+        self.__lock = threading.Lock()
+        if log_file:
+            directory = os.path.dirname(log_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def record(self, stage: str, seconds: float):
+        with self.__lock:
+            self.histograms[stage].record(seconds)
+
+    def record_many(self, stage: str, seconds):
+        with self.__lock:
+            self.histograms[stage].record_many(seconds)
+
+    def stage(self, name: str):
+        """Context manager that records how long its body takes
+        """
+        return _Timer(self, name)
+
+    def summary(self):
+        """Count and percentiles in milliseconds of every stage that has values
+        """
+        with self.__lock:
+            return self.__summary()
+
+    def __summary(self):
+        summary = {}
+        for stage, histogram in self.histograms.items():
+            if not histogram.count:
+                continue
+            stats = {'count': histogram.count}
+            for percent in PERCENTILES:
+                stats['p%d_ms' % percent] = histogram.percentile(percent) * 1000
+            stats['max_ms'] = histogram.max * 1000
+            summary[stage] = stats
+        return summary
+
+    def tick(self, now: float = None):
+        """Reports and resets the histograms if the interval is over.
+
+        Returns:
+            bool -- Whether a new report was made
+        """
+        now = time.perf_counter() if now is None else now
+        if now - self.__since < self.interval:
+            return False
+        with self.__lock:
+            self.last_report = self.__summary()
+            for histogram in self.histograms.values():
+                histogram.reset()
+        if self.log_file:
+            with open(self.log_file, 'a') as log:
+                log.write(json.dumps({'time': time.time(),
+                                      'interval': now - self.__since,
+                                      'stages': self.last_report}) + '\n')
+        self.__since = now
+        return True
+
+    def overlay(self):
+        """Lines of text with the last report, for the on-screen display
+        """
+        if not self.last_report:
+            return []
+        lines = ["%-7s %7s %7s %7s %7s" % ("ms", "p50", "p95", "p99", "max")]
+        for stage, stats in self.last_report.items():
+            lines.append("%-7s %7.2f %7.2f %7.2f %7.2f" % (
+                stage, stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['max_ms']))
+        return lines
+
+
+class _Timer():
+    def __init__(self, monitor, stage):
+        self.monitor = monitor
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.monitor.record(self.stage, time.perf_counter() - self.start)
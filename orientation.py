@@ -0,0 +1,157 @@
+"""Vectorized orientation conversions
+
+Every function takes quaternions as an array of shape (N, 4) in
+(w, x, y, z) order, or a single quaternion of shape (4,), and converts all
+of them at once.
+"""
+import numpy as np
+
+
+def quat_to_euler(quats):
+    """Converts quaternions to euler angles in degrees
+
+    Arguments:
+        quats {array_like} -- Quaternions with shape (N, 4) or (4,)
+
+    Returns:
+        numpy.ndarray -- Angles with shape (N, 3) or (3,), in the same order
+        as {sensors.quat_to_euler}: pitch, yaw, roll
+    """
+    quats = np.asarray(quats, dtype=float)
+    w, x, y, z = np.moveaxis(quats, -1, 0)
+
+    # roll(x-axis rotation)
+    sinr_cosp = +2.0 * (w * x + y * z)
+    cosr_cosp = +1.0 - 2.0 * (x * x + y * y)
+    roll = np.arctan2(sinr_cosp, cosr_cosp)
+
+    # pitch(y-axis rotation), use 90 degrees if out of range
+    sinp = np.clip(+2.0 * (w * y - z * x), -1.0, 1.0)
+    pitch = np.arcsin(sinp)
+
+    # yaw(z-axis rotation)
+    siny_cosp = +2.0 * (w * z + x * y)
+    cosy_cosp = +1.0 - 2.0 * (y * y + z * z)
+    yaw = np.arctan2(siny_cosp, cosy_cosp)
+
+    return np.degrees(np.stack((pitch, yaw, roll), axis=-1))
+
+
+def quat_to_axis_rotation(quats):
+    """Converts quaternions to rotations around an axis
+
+    Arguments:
+        quats {array_like} -- Quaternions with shape (N, 4) or (4,)
+
+    Returns:
+        numpy.ndarray -- Rotations with shape (N, 4) or (4,): angle in
+        degrees, then the z, x and -y components of the axis
+    """
+    quats = np.asarray(quats, dtype=float)
+    norm = np.linalg.norm(quats, axis=-1, keepdims=True)
+    quats = np.divide(quats, norm, out=np.zeros_like(quats), where=norm > 0)
+    w = quats[..., 0]
+    vector = quats[..., 1:]
+
+    angle = np.arctan2(np.linalg.norm(vector, axis=-1), w)
+    # assuming quaternion normalised then w is less than 1, so term always positive.
+    s = np.sqrt(np.maximum(1 - w * w, 0.0))
+    # if s close to zero then direction of axis not important
+    s = np.where(s < 0.001, 1.0, s)
+    x, y, z = np.moveaxis(vector / s[..., np.newaxis], -1, 0)
+
+    return np.stack((np.degrees(angle), z, x, -y), axis=-1)
+
+
+def slerp(start, end, t):
+    """Spherical linear interpolation between quaternions
+
+    Both ends are normalized first, and the shorter of the two arcs between
+    them is taken.
+
+    Arguments:
+        start {array_like} -- Quaternions at {t} = 0, with shape (N, 4) or (4,)
+        end {array_like} -- Quaternions at {t} = 1, with the same shape
+        t {array_like} -- Fraction of the way from {start} to {end}, a float
+        or an array of shape (N,)
+
+    Returns:
+        numpy.ndarray -- Unit quaternions with the shape of {start}
+    """
+    start = np.asarray(start, dtype=float)
+    end = np.asarray(end, dtype=float)
+    start = start / np.linalg.norm(start, axis=-1, keepdims=True)
+    end = end / np.linalg.norm(end, axis=-1, keepdims=True)
+    t = np.asarray(t, dtype=float)[..., np.newaxis]
+
+    dot = np.sum(start * end, axis=-1, keepdims=True)
+    # q and -q are the same rotation, go the short way around
+    end = np.where(dot < 0, -end, end)
+    dot = np.minimum(np.abs(dot), 1.0)
+
+    theta = np.arccos(dot)
+    sin = np.sin(theta)
+    # nearly parallel: the weights below divide by ~0, a lerp is as good
+    close = sin < 1e-6
+    sin = np.where(close, 1.0, sin)
+    weight_start = np.where(close, 1 - t, np.sin((1 - t) * theta) / sin)
+    weight_end = np.where(close, t, np.sin(t * theta) / sin)
+    quats = weight_start * start + weight_end * end
+    return quats / np.linalg.norm(quats, axis=-1, keepdims=True)
+
+
+def ypr_to_quat(ypr):
+    """Converts yaw, pitch and roll in degrees to quaternions
+
+    The angles are applied as intrinsic rotations around z, y and x, in that
+    order, the same convention {quat_to_euler} uses. That function returns
+    them as pitch, yaw, roll though, so swap the first two angles to go back:
+    `ypr_to_quat(quat_to_euler(q)[..., [1, 0, 2]])` is {q} again, or {-q}.
+
+    Arguments:
+        ypr {array_like} -- Angles with shape (N, 3) or (3,)
+
+    Returns:
+        numpy.ndarray -- Unit quaternions with shape (N, 4) or (4,)
+    """
+    half = np.radians(np.asarray(ypr, dtype=float)) / 2
+    cy, cp, cr = np.moveaxis(np.cos(half), -1, 0)
+    sy, sp, sr = np.moveaxis(np.sin(half), -1, 0)
+    return np.stack((cr * cp * cy + sr * sp * sy,
+                     sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy,
+                     cr * cp * sy - sr * sp * cy), axis=-1)
+
+
+def quat_to_matrix(quats):
+    """Converts quaternions to 4x4 homogeneous rotation matrices
+
+    The quaternions are normalized first, and a zero quaternion gives the
+    identity. Points are rotated as `matrix @ (x, y, z, 1)`; OpenGL reads
+    matrices column by column, so pass the transpose to {glMultMatrixf}.
+
+    Arguments:
+        quats {array_like} -- Quaternions with shape (N, 4) or (4,)
+
+    Returns:
+        numpy.ndarray -- Matrices with shape (N, 4, 4) or (4, 4)
+    """
+    quats = np.asarray(quats, dtype=float)
+    norm = np.linalg.norm(quats, axis=-1, keepdims=True)
+    identity = np.zeros_like(quats)
+    identity[..., 0] = 1
+    quats = np.divide(quats, norm, out=identity, where=norm > 0)
+    w, x, y, z = np.moveaxis(quats, -1, 0)
+
+    matrix = np.zeros(quats.shape[:-1] + (4, 4))
+    matrix[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    matrix[..., 0, 1] = 2 * (x * y - w * z)
+    matrix[..., 0, 2] = 2 * (x * z + w * y)
+    matrix[..., 1, 0] = 2 * (x * y + w * z)
+    matrix[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    matrix[..., 1, 2] = 2 * (y * z - w * x)
+    matrix[..., 2, 0] = 2 * (x * z - w * y)
+    matrix[..., 2, 1] = 2 * (y * z + w * x)
+    matrix[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    matrix[..., 3, 3] = 1
+    return matrix
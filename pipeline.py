@@ -0,0 +1,293 @@
+"""Runs acquisition, inference and rendering in separate processes
+
+The acquisition process reads {Sensors} and writes every sample to a
+{SharedRing} of {SAMPLE_DTYPE} records. The inference process reads that
+ring, runs {Predict} and writes its decisions to a second ring of
+{PREDICTION_DTYPE} records. The render process, the one that created the
+{Pipeline}, reads both. Records are plain NumPy structs in shared memory, so
+nothing is pickled on the way and each stage has its own interpreter and GIL.
+
+The rings take no locks. They rely on the 8-byte write count being stored
+atomically and on the stores of a record becoming visible to other
+processes before the store of the count that follows them. x86 and x86-64
+guarantee both. Weakly ordered CPUs such as ARM only guarantee the first, so
+there a reader may, rarely, copy a record that isn't complete yet.
+"""
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import telemetry
+from sensors import SAMPLE_DTYPE, SensorBatch, SensorData
+
+log = telemetry.get_logger(__name__)
+
+PREDICTION_DTYPE = np.dtype([
+    ('seq', '<i8'),         # last sample that went into the decision
+    ('t_recv', '<f8'),      # when that sample was received
+    ('predict_time', '<f8'),  # seconds spent classifying the batch
+    ('prediction', '<i8'),
+])
+
+# Seconds a reader sleeps when its ring is empty
+POLL_INTERVAL = 0.001
+
+
+class SharedRing():
+    """Ring buffer of fixed-size records in shared memory
+
+    One process writes and any number of processes read, each with its own
+    {RingReader}. The writer never waits: when a reader falls {capacity}
+    records behind, the oldest records are lost to it. The slot the writer
+    may be filling is never read, so a reader gets at most {capacity} - 1
+    records at a time.
+
+    The first 64 bytes hold the number of records ever written. It is only
+    updated after the record itself, so readers never see a slot before it
+    has been filled.
+    """
+    HEADER = 64
+
+    def __init__(self, dtype, capacity: int = 4096, name: str = None):
+        """
+        Arguments:
+            dtype {numpy.dtype} -- Layout of the records
+
+        Keyword Arguments:
+            capacity {int} -- Number of records kept (default: {4096})
+            name {str} -- Attach to the ring with this name instead of
+            creating a new one (default: {None})
+        """
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=self.owner, size=self.HEADER + capacity * self.dtype.itemsize)
+        self.written = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.records = np.ndarray((capacity,), dtype=self.dtype, buffer=self.shm.buf,
+                                  offset=self.HEADER)
+        if self.owner:
+            self.written[0] = 0
+
+    @property
+    def spec(self):
+        """What another process needs to attach to this ring with {attach}
+        """
+        return (self.shm.name, self.dtype.descr, self.capacity)
+
+    @classmethod
+    def attach(cls, spec):
+        name, descr, capacity = spec
+        return cls(np.dtype(descr), capacity, name)
+
+    def write(self, record):
+        """Adds one record, given as a tuple in the order of the dtype
+        """
+        count = int(self.written[0])
+        self.records[count % self.capacity] = record
+        self.written[0] = count + 1
+
+    def reader(self, latest: bool = False):
+        """A new reader of this ring
+
+        Keyword Arguments:
+            latest {bool} -- Skip the records already written (default: {False})
+        """
+        return RingReader(self, int(self.written[0]) if latest else 0)
+
+    def close(self):
+        # the views have to go before the memory can be released
+        self.written = self.records = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingReader():
+    """Reads the records of a {SharedRing} in order
+
+    Attributes:
+        dropped {int} -- Records overwritten before they could be read
+    """
+
+    def __init__(self, ring: SharedRing, position: int = 0):
+        self.ring = ring
+        self.position = position
+        self.dropped = 0
+
+    def pending(self):
+        return int(self.ring.written[0]) - self.position
+
+    def read(self):
+        """Copies every record written since the last call, oldest first.
+
+        Returns:
+            numpy.ndarray -- The records
+        """
+        ring = self.ring
+        capacity = ring.capacity
+        end = int(ring.written[0])
+        start = max(self.position, end - capacity)
+        records = np.empty(end - start, dtype=ring.dtype)
+        first = start % capacity
+        count = min(end - start, capacity - first)
+        records[:count] = ring.records[first:first + count]
+        records[count:] = ring.records[:len(records) - count]
+
+        # anything the writer got to while we were copying may be torn,
+        # including the slot of the record it may be storing right now
+        overwritten = int(ring.written[0]) - capacity + 1 - start
+        if overwritten > 0:
+            records = records[overwritten:]
+            start += overwritten
+        self.dropped += start - self.position
+        self.position = end
+        return records
+
+
+def acquire(sensor_options: dict, sample_spec, stop):
+    """Acquisition process: reads the sensors into the sample ring
+    """
+    from sensors import Sensors
+
+    samples = SharedRing.attach(sample_spec)
+    sensors = Sensors(**sensor_options)
+    count = 0
+    try:
+        while not stop.is_set():
+            data = sensors.read()
+            if data is None:
+                if sensors.replay is not None and sensors.replay.done:
+                    break
+                continue
+            if data.seq is None:
+                # not every source numbers its samples
+                data = data.copy()
+                data.seq = count
+            count += 1
+            samples.write(data.record())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sensors.close()
+        samples.close()
+
+
+def infer(predict_options: dict, sample_spec, prediction_spec, stop):
+    """Inference process: classifies the samples in the sample ring and
+    writes each decision to the prediction ring
+    """
+    from clf_predict import Predict
+
+    samples = SharedRing.attach(sample_spec)
+    predictions = SharedRing.attach(prediction_spec)
+    try:
+        predictor = Predict(**predict_options)
+        reader = samples.reader()
+        while not stop.is_set():
+            records = reader.read()
+            if not len(records):
+                time.sleep(POLL_INTERVAL)
+                continue
+            start = time.perf_counter()
+            prediction = predictor.predict_batch(SensorBatch.from_records(records))
+            if prediction is not None:
+                predictions.write((records['seq'][-1], records['t_recv'][-1],
+                                   time.perf_counter() - start, prediction))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        log.exception("Inference process failed")
+    finally:
+        samples.close()
+        predictions.close()
+
+
+class Pipeline():
+    """Starts the acquisition and inference processes and reads their output
+
+    Offers the same {drain} and {latest} as a started {Sensors}, plus the
+    latest {prediction}.
+    """
+
+    def __init__(self, sensor_options: dict, predict_options: dict = None,
+                 capacity: int = 4096):
+        """
+        Arguments:
+            sensor_options {dict} -- Arguments for {Sensors}
+
+        Keyword Arguments:
+            predict_options {dict} -- Arguments for {Predict}, or {None} to
+            not classify (default: {None})
+            capacity {int} -- Records kept in each ring (default: {4096})
+        """
+        # spawn, so the children don't inherit the window or GL context
+        context = multiprocessing.get_context('spawn')
+        self.stop_event = context.Event()
+        self.samples = SharedRing(SAMPLE_DTYPE, capacity)
+        self.predictions = SharedRing(PREDICTION_DTYPE, capacity)
+        self.sample_reader = self.samples.reader()
+        self.prediction_reader = self.predictions.reader()
+        self.__latest = None
+        self.__prediction = None
+
+        self.processes = [context.Process(
+            target=acquire, name="acquisition", daemon=True,
+            args=(sensor_options, self.samples.spec, self.stop_event))]
+        if predict_options is not None:
+            self.processes.append(context.Process(
+                target=infer, name="inference", daemon=True,
+                args=(predict_options, self.samples.spec, self.predictions.spec,
+                      self.stop_event)))
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def drain(self):
+        """Returns every sample acquired since the last call, oldest first.
+        """
+        records = self.sample_reader.read()
+        if not len(records):
+            return []
+        samples = [SensorData.from_record(record) for record in records]
+        self.__latest = samples[-1]
+        return samples
+
+    def latest(self):
+        """The last sample returned by {drain}, or {None}
+        """
+        return self.__latest
+
+    def prediction(self):
+        """The latest decision of the inference process, as the record with
+        {PREDICTION_DTYPE}, or {None} if there is none yet
+        """
+        records = self.prediction_reader.read()
+        if len(records):
+            self.__prediction = records[-1]
+        return self.__prediction
+
+    @property
+    def predictions_read(self):
+        """Number of decisions read by {prediction} so far, which tells a
+        new one apart from the last even when both have the same record
+        """
+        return self.prediction_reader.position
+
+    @property
+    def dropped(self):
+        return self.sample_reader.dropped
+
+    def close(self):
+        """Stops the processes and releases the shared memory
+        """
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(2)
+            if process.is_alive():
+                process.terminate()
+        self.samples.close()
+        self.predictions.close()
@@ -0,0 +1,135 @@
+"""Binary frame format sent by the firmware
+
+Each frame is 29 bytes, little-endian, with no padding:
+
+| Bytes | Type       | Field                                        |
+|-------|------------|----------------------------------------------|
+| 0-1   | 2 x uint8  | sync word `A5 5A`                            |
+| 2     | uint8      | protocol version                             |
+| 3-4   | uint16     | sequence number, wraps at 65535              |
+| 5-8   | uint32     | firmware `millis()`                          |
+| 9-16  | 4 x int16  | DMP quaternion w, x, y, z in Q14 (1 = 16384) |
+| 17-22 | 3 x int16  | world-frame acceleration x, y, z             |
+| 23-26 | float32    | flex sensor resistance                       |
+| 27-28 | uint16     | Fletcher-16 of bytes 2-26                    |
+"""
+import struct
+
+import numpy as np
+
+SYNC = b'\xa5\x5a'
+VERSION = 1
+QUAT_SCALE = 16384.0
+
+FRAME = struct.Struct('<2sBHI4h3hfH')
+FRAME_DTYPE = np.dtype([
+    ('sync', 'S2'),
+    ('version', 'u1'),
+    ('seq', '<u2'),
+    ('millis', '<u4'),
+    ('quat', '<i2', (4,)),
+    ('accel', '<i2', (3,)),
+    ('flex', '<f4'),
+    ('checksum', '<u2'),
+])
+assert FRAME_DTYPE.itemsize == FRAME.size
+
+# Checksummed span: everything between the sync word and the checksum
+_CHECKED = slice(2, FRAME.size - 2)
+_CHECKED_LEN = FRAME.size - 4
+# Fletcher-16's second sum weighs byte i by (n - i)
+_WEIGHTS = np.arange(_CHECKED_LEN, 0, -1, dtype=np.int64)
+
+
+def fletcher16(data: bytes):
+    """Computes the Fletcher-16 checksum the firmware appends to each frame
+    """
+    sum1 = sum2 = 0
+    for byte in data:
+        sum1 = (sum1 + byte) % 255
+        sum2 = (sum2 + sum1) % 255
+    return (sum2 << 8) | sum1
+
+
+def encode(seq: int, millis: int, quat, accel, flex: float):
+    """Builds one frame, the same way the firmware does.
+
+    Arguments:
+        seq {int} -- Sequence number
+        millis {int} -- Firmware time in milliseconds
+        quat {tuple} -- Quaternion (w, x, y, z) as floats
+        accel {tuple} -- Acceleration (x, y, z) in raw sensor units
+        flex {float} -- Flex sensor resistance
+
+    Returns:
+        bytes -- The encoded frame
+    """
+    quat = [int(round(v * QUAT_SCALE)) for v in quat]
+    frame = bytearray(FRAME.pack(SYNC, VERSION, seq & 0xFFFF, millis & 0xFFFFFFFF,
+                                 *quat, *(int(v) for v in accel), flex, 0))
+    checksum = fletcher16(frame[_CHECKED])
+    frame[-2:] = checksum.to_bytes(2, 'little')
+    return bytes(frame)
+
+
+def _valid(frames: np.ndarray):
+    raw = frames.view(np.uint8).reshape(len(frames), FRAME.size)[:, _CHECKED]
+    sum1 = raw.sum(axis=1, dtype=np.int64) % 255
+    sum2 = raw.dot(_WEIGHTS) % 255
+    return (frames['sync'] == SYNC) & (frames['version'] == VERSION) \
+        & (frames['checksum'] == ((sum2 << 8) | sum1))
+
+
+def decode(buffer, offset: int = 0, resync: bool = True):
+    """Decodes every complete frame in a buffer in one pass.
+
+    Frames are viewed in place with {FRAME_DTYPE} and validated together, so
+    the cost per frame does not depend on Python code.
+
+    Arguments:
+        buffer {bytes|bytearray} -- Raw bytes from the stream
+
+    Keyword Arguments:
+        offset {int} -- Where to start decoding (default: {0})
+        resync {bool} -- Skip over invalid bytes looking for the next sync
+        word, instead of stopping at the first invalid frame (default: {True})
+
+    Returns:
+        tuple -- (records, consumed, errors): a structured array with
+        {FRAME_DTYPE} that owns its memory, the offset up to which the
+        buffer was consumed and how many corrupt frames were skipped
+    """
+    view = memoryview(buffer)
+    end = len(view)
+    runs = []
+    errors = 0
+    pos = offset
+    while True:
+        start = buffer.find(SYNC, pos) if resync else pos
+        if start < 0:
+            # keep a trailing byte that may be the first half of a sync word
+            pos = end - 1 if end > pos and view[end - 1] == SYNC[0] else end
+            break
+        count = (end - start) // FRAME.size
+        if count == 0:
+            pos = start
+            break
+
+        frames = np.frombuffer(view[start:start + count * FRAME.size], dtype=FRAME_DTYPE)
+        invalid = np.flatnonzero(~_valid(frames))
+        good = invalid[0] if len(invalid) else count
+        if good:
+            runs.append(frames[:good])
+        pos = start + good * FRAME.size
+        if good == count:
+            continue
+        if not resync:
+            break
+        errors += 1
+        pos += 1
+
+    if runs:
+        records = np.concatenate(runs)
+    else:
+        records = np.empty(0, dtype=FRAME_DTYPE)
+    return records, pos, errors
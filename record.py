@@ -1,36 +1,29 @@
 #!/usr/bin/env python3
-"""Reads data from the serial port and writes them to a file.
+"""Reads data from the serial port and writes them to a recording.
 """
 import argparse
-import csv
-import errno
 import os
+import threading
 import time
-from collections import deque
 
+import recording
 import sensors
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('file', nargs='?', default=None,
-                        help="Name of the file to save")
+                        help="Name of the recording to save")
+    parser.add_argument('-c', '--continuous', action='store_true',
+                        help="Record every sample, labelled with the current activity")
     args = parser.parse_args()
     filename = args.file
 
     if filename is None:
         i = 1
-        while os.path.exists("data/data%d.csv" % i):
+        while os.path.exists("data/data%d.rec" % i):
             i += 1
-        filename = "data/data%d.csv" % i
-
-    # Create directory if it doesn't exist
-    if not os.path.exists(os.path.dirname(filename)):
-        try:
-            os.makedirs(os.path.dirname(filename))
-        except OSError as exc:  # Guard against race condition
-            if exc.errno != errno.EEXIST:
-                raise
+        filename = "data/data%d.rec" % i
 
     # Start reading from serial port
     s = sensors.Sensors()
@@ -41,32 +34,67 @@ def main():
         pass
     print("")
 
-    while True:
-        prev_activity = activity
-        activity = input("Select activity to record or Q to finish [current: %d]: " % activity)\
-            or activity
-
-        if activity in ('q', 'Q'):
-            break
-        try:
-            activity = int(activity)
-        except ValueError:
-            print("Invalid option.")
-            activity = prev_activity
-            continue
-
-        print("\n ACTIVITY %d:" % (activity))
-
-        data = None
-        while data is None:
-            data = s.read()
-
-        save_data = list(data.clf_data())
-        with open(filename, "a", newline='') as csv_file:
-            csv_writer = csv.writer(csv_file)
-            csv_writer.writerow([activity] + save_data)
-        print("    Saved %s      " % save_data, end='\n\n')
-    print("Finished.")
+    recorder = recording.Recorder(filename)
+    state = {'activity': None}
+    stop = threading.Event()
+    worker = None
+    # keep reading in the background, so nothing piles up in the OS buffer
+    # while waiting for input
+    s.start()
+    if args.continuous:
+        worker = threading.Thread(target=record_stream, args=(s, recorder, state, stop))
+        worker.start()
+
+    try:
+        while True:
+            prev_activity = activity
+            activity = input("Select activity to record or Q to finish [current: %d]: " % activity)\
+                or activity
+
+            if activity in ('q', 'Q'):
+                break
+            try:
+                activity = int(activity)
+            except ValueError:
+                print("Invalid option.")
+                activity = prev_activity
+                continue
+
+            print("\n ACTIVITY %d:" % (activity))
+
+            if args.continuous:
+                state['activity'] = activity
+                print("    Recording...", end='\n\n')
+                continue
+
+            # the first sample received after the key press is the current pose
+            s.drain()
+            samples = []
+            while not samples:
+                time.sleep(0.001)
+                samples = s.drain()
+            data = samples[-1]
+
+            recorder.write(data, activity, recording.wall_time(data.t_recv))
+            print("    Saved %s      " % list(data.clf_data()), end='\n\n')
+    finally:
+        stop.set()
+        if worker is not None:
+            worker.join()
+        s.close()
+        recorder.close()
+    print("Finished. %d samples saved to %s" % (recorder.count, filename))
+
+
+def record_stream(s: sensors.Sensors, recorder: recording.Recorder, state: dict,
+                  stop: threading.Event):
+    """Writes every sample read in the background until {stop} is set
+    """
+    while not stop.wait(0.01):
+        activity = state['activity']
+        for sample in s.drain():
+            if activity is not None:
+                recorder.write(sample, activity, recording.wall_time(sample.t_recv))
 
 
 if __name__ == "__main__":
@@ -1,18 +1,18 @@
 #!/usr/bin/env python3
-"""Reads data from the serial port and writes them to a file.
+"""Reads data from the serial port and writes them to a recording.
+
+Press a number to choose the activity, Enter to save the current sample and
+Space to start or stop recording every sample.
 """
 import argparse
-import csv
-import errno
 import os
-import time
-from collections import deque
 
 import pygame
 from pygame.locals import (DOUBLEBUF, K_0, K_9, K_DOWN, K_ESCAPE, K_KP0, K_KP9,
-                           K_KP_ENTER, K_RETURN, K_UP, KEYDOWN, OPENGL, QUIT,
-                           RESIZABLE, VIDEORESIZE, K_q, K_r)
+                           K_KP_ENTER, K_RETURN, K_SPACE, K_UP, KEYDOWN, OPENGL,
+                           QUIT, RESIZABLE, VIDEORESIZE, K_q, K_r)
 
+import recording
 from sensors import SensorData, Sensors
 from simulation import Simulation
 
@@ -20,25 +20,19 @@ from simulation import Simulation
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('file', nargs='?', default=None,
-                        help="Name of the file to save")
+                        help="Name of the recording to save")
     args = parser.parse_args()
     filename = args.file
 
     if filename is None:
         i = 1
-        while os.path.exists("data/data%d.csv" % i):
+        while os.path.exists("data/data%d.rec" % i):
             i += 1
-        filename = "data/data%d.csv" % i
-
-    # Create directory if it doesn't exist
-    if not os.path.exists(os.path.dirname(filename)):
-        try:
-            os.makedirs(os.path.dirname(filename))
-        except OSError as exc:  # Guard against race condition
-            if exc.errno != errno.EEXIST:
-                raise
+        filename = "data/data%d.rec" % i
 
     sensors = Sensors()
+    sensors.start()
+    recorder = recording.Recorder(filename)
 
     video_flags = OPENGL | DOUBLEBUF | RESIZABLE
 
@@ -53,9 +47,14 @@ def main():
     ticks = pygame.time.get_ticks()
     sensor_data = SensorData()
     activity = 0
+    continuous = False
 
     while True:
-        sensor_data = sensors.read() or sensor_data
+        samples = sensors.drain()
+        sensor_data = sensors.latest() or sensor_data
+        if continuous:
+            for sample in samples:
+                recorder.write(sample, activity, recording.wall_time(sample.t_recv))
 
         event = pygame.event.poll()
         if event.type == QUIT or (event.type == KEYDOWN and (event.key == K_ESCAPE or event.key == K_q)):
@@ -77,11 +76,12 @@ def main():
         elif event.type == KEYDOWN and (event.key == K_RETURN or event.key == K_KP_ENTER):
             print("\n - ACTIVITY %d:" % (activity), end='')
 
-            save_data = list(sensor_data.clf_data())
-            with open(filename, "a", newline='') as csv_file:
-                csv_writer = csv.writer(csv_file)
-                csv_writer.writerow([activity] + save_data)
-            print(" Saved %s      " % save_data, end='\n\n')
+            recorder.write(sensor_data, activity, recording.wall_time(sensor_data.t_recv))
+            print(" Saved %s      " % list(sensor_data.clf_data()), end='\n\n')
+
+        elif event.type == KEYDOWN and event.key == K_SPACE:
+            continuous = not continuous
+            print("\n - %s ACTIVITY %d" % ("RECORDING" if continuous else "STOPPED", activity))
 
         if sensor_data is not None:
             sim.sensor_data = sensor_data
@@ -95,11 +95,13 @@ def main():
             ticks = pygame.time.get_ticks()
             frames = 0
         pygame.display.set_caption(
-            title + " | FPS: %d | Activity %d" % (fps, activity))
+            title + " | FPS: %d | Activity %d%s" % (fps, activity, " | REC" if continuous else ""))
 
         frames = frames+1
 
     sensors.close()
+    recorder.close()
+    print("\n%d samples saved to %s" % (recorder.count, filename))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,183 @@
+"""Columnar on-disk format for recorded sessions
+
+A recording is a directory, by convention named `*.rec`, holding a
+`meta.json` header and numbered `chunk-NNNNNN.npy` files. Every chunk is a
+plain NumPy array with {RECORD_DTYPE}, so it can be memory-mapped with
+`numpy.load(..., mmap_mode='r')`.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+VERSION = 1
+META = 'meta.json'
+CHUNK = 'chunk-%06d.npy'
+
+RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('seq', '<i8'),
+    ('gyro', '<f4', (4,)),
+    ('accel', '<f4', (3,)),
+    ('flex', '<f4'),
+    ('label', '<i2'),
+])
+
+
+# time.time() when time.perf_counter() was zero, to turn the receive stamps
+# of samples into wall-clock times
+_EPOCH = time.time() - time.perf_counter()
+
+
+def wall_time(t_recv: float = None):
+    """Wall-clock time of a {time.perf_counter} stamp such as
+    {SensorData.t_recv}, or now if there is no stamp
+    """
+    if t_recv is None:
+        return time.time()
+    return _EPOCH + t_recv
+
+
+def is_recording(path: str):
+    """Whether a path is a recording in this format
+    """
+    return os.path.isfile(os.path.join(path, META))
+
+
+def chunk_files(path: str):
+    """Paths of every chunk of a recording, in order
+    """
+    return sorted(os.path.join(path, filename) for filename in os.listdir(path)
+                  if filename.startswith('chunk-') and filename.endswith('.npy'))
+
+
+def chunks(path: str, mmap: bool = True):
+    """Yields every chunk of a recording, memory-mapped by default
+    """
+    with open(os.path.join(path, META)) as meta_file:
+        meta = json.load(meta_file)
+    if meta.get('version') != VERSION:
+        raise ValueError("Unsupported recording version %s in %s" % (meta.get('version'), path))
+    for filename in chunk_files(path):
+        yield np.load(filename, mmap_mode='r' if mmap else None)
+
+
+def _write_meta(path: str):
+    with open(os.path.join(path, META), 'w') as meta_file:
+        json.dump({
+            'version': VERSION,
+            'dtype': RECORD_DTYPE.descr,
+            'created': time.time(),
+        }, meta_file)
+
+
+def save(path: str, records: np.ndarray, chunk_size: int = 4096):
+    """Writes a whole array with {RECORD_DTYPE} as a new recording
+    """
+    os.makedirs(path)
+    _write_meta(path)
+    for index, start in enumerate(range(0, len(records), chunk_size)):
+        np.save(os.path.join(path, CHUNK % index), records[start:start + chunk_size])
+
+
+def load(path: str):
+    """Loads a whole recording into one array with {RECORD_DTYPE}
+    """
+    parts = list(chunks(path))
+    if not parts:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.concatenate(parts)
+
+
+class Recorder():
+    """Writes samples to a recording in batches from a background thread
+
+    Samples are copied into a preallocated chunk. Full chunks are handed to
+    the writer thread, so recording a sample never touches the disk.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 4096):
+        """
+        Arguments:
+            path {str} -- Directory of the recording, created if needed
+
+        Keyword Arguments:
+            chunk_size {int} -- Samples per chunk file (default: {4096})
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.count = 0
+
+        os.makedirs(path, exist_ok=True)
+        if not is_recording(path):
+            _write_meta(path)
+        # keep appending after the chunks of an earlier session
+        self.__next_chunk = len(chunk_files(path))
+
+        self.__chunk = np.empty(chunk_size, dtype=RECORD_DTYPE)
+        self.__size = 0
+        self.__queue = queue.Queue()
+        self.__thread = threading.Thread(target=self.__run, name="recorder", daemon=True)
+        self.__thread.start()
+
+    def write(self, sample, label: int, timestamp: float = None):
+        """Adds one sample to the recording.
+
+        Arguments:
+            sample {SensorData} -- The sample
+            label {int} -- Activity being recorded
+
+        Keyword Arguments:
+            timestamp {float} -- When the sample was taken, usually
+            {wall_time} of its {SensorData.t_recv}, or {None} for now. Samples
+            drained in batches would all get about the same time
+            (default: {None})
+        """
+        self.__chunk[self.__size] = (
+            time.time() if timestamp is None else timestamp,
+            -1 if sample.seq is None else sample.seq,
+            (sample.gw, sample.gx, sample.gy, sample.gz),
+            (sample.ax, sample.ay, sample.az),
+            sample.flex,
+            label)
+        self.__size += 1
+        self.count += 1
+        if self.__size == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Hands the samples written so far to the writer thread
+        """
+        if self.__size:
+            self.__queue.put((self.__next_chunk, self.__chunk[:self.__size]))
+            self.__next_chunk += 1
+            self.__chunk = np.empty(self.chunk_size, dtype=RECORD_DTYPE)
+            self.__size = 0
+
+    def close(self):
+        """Writes everything that is left and stops the writer thread
+        """
+        self.flush()
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            index, chunk = item
+            filename = os.path.join(self.path, CHUNK % index)
+            # write under a temporary name so readers never see half a chunk
+            with open(filename + '.tmp', 'wb') as chunk_file:
+                np.save(chunk_file, chunk)
+            os.replace(filename + '.tmp', filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
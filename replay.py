@@ -0,0 +1,94 @@
+"""Plays recorded sessions back as if they came from the sensors
+"""
+import time
+
+import numpy as np
+
+import recording
+from sensors import SensorData
+
+
+def load(filename: str, rate: float = 100.0):
+    """Loads a recording.
+
+    Arguments:
+        filename {str} -- A recording made by {recording.Recorder}, or a CSV
+        file with one `activity,ax,ay,az,flex` row per sample
+
+    Keyword Arguments:
+        rate {float} -- Sample rate in Hz, used for CSV recordings because
+        they carry no timestamps (default: {100.0})
+
+    Returns:
+        tuple -- (times, labels, samples): times in seconds, one activity
+        label per sample and the samples as an (N, 8) array with the
+        {SensorData} channels
+    """
+    if recording.is_recording(filename):
+        records = recording.load(filename)
+        samples = np.column_stack((records['gyro'], records['accel'], records['flex']))
+        times = records['time'] - records['time'][0] if len(records) else records['time']
+        return times, records['label'].astype(int), samples.astype(float)
+
+    rows = np.loadtxt(filename, delimiter=',', ndmin=2)
+    samples = np.zeros((len(rows), 8))
+    samples[:, 4:8] = rows[:, 1:5]
+    times = np.arange(len(rows)) / rate
+    return times, rows[:, 0].astype(int), samples
+
+
+class Replay():
+    """Streams a recording with its original timing, faster or slower
+    """
+
+    def __init__(self, filename: str, speed: float = 1.0, rate: float = 100.0,
+                 loop: bool = False):
+        """
+        Arguments:
+            filename {str} -- The recording to play, see {load}
+
+        Keyword Arguments:
+            speed {float} -- Playback speed, where 1 is real time and 0 is as
+            fast as possible (default: {1.0})
+            rate {float} -- Sample rate for recordings without timestamps
+            (default: {100.0})
+            loop {bool} -- Start over at the end instead of stopping (default: {False})
+        """
+        self.times, self.labels, self.samples = load(filename, rate)
+        self.speed = speed
+        self.loop = loop
+        self.index = 0
+        self.seq = 0
+        self.start = None
+
+    @property
+    def done(self):
+        """Whether every sample has been played and there's no loop
+        """
+        return self.index >= len(self.samples) and not self.loop
+
+    def read(self):
+        """Waits until the next sample is due and returns it.
+
+        Returns:
+            SensorData -- The next sample, or {None} at the end of the recording
+        """
+        if self.index >= len(self.samples):
+            if not self.loop or not len(self.samples):
+                return None
+            self.index = 0
+            self.start = None
+
+        if self.start is None:
+            self.start = time.perf_counter() - self.times[self.index] / (self.speed or 1)
+        if self.speed:
+            wait = self.start + self.times[self.index] / self.speed - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        sample = SensorData(*self.samples[self.index].tolist())
+        sample.seq = self.seq
+        sample.t_recv = time.perf_counter()
+        self.index += 1
+        self.seq += 1
+        return sample
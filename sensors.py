@@ -1,19 +1,33 @@
 """Reads sensor data and deals with them
 """
+import logging
 import math
 import socket
+import threading
 import time
-from struct import unpack_from
+from collections import deque, namedtuple
+from struct import Struct
 
-import serial
+import numpy as np
 from pyquaternion import Quaternion
-from serial import tools
-from serial.serialutil import SerialException
-from serial.tools import list_ports
+
+import orientation
+import protocol
+import telemetry
+
+log = telemetry.get_logger(__name__)
+
+# UDP packets carry 24 network-order floats
+UDP_PACKET = Struct('!24f')
+
+# Seconds a replay waits for room in the buffer of a started {Sensors}
+REPLAY_WAIT = 0.001
 
 
 def quat_to_euler(*args):
     """Converts quaternion to euler angles
+
+    Use {orientation.quat_to_euler} to convert many quaternions at once.
     """
     if len(args) == 4 and all(map(lambda x: isinstance(x, float), args)):
         w = args[0]
@@ -31,141 +45,213 @@ def quat_to_euler(*args):
         raise TypeError(
             "Use either 4 floats (w, x, y, z) or one Quaternion object.")
 
-    # roll(x-axis rotation)
-    sinr_cosp = +2.0 * (w * x + y * z)
-    cosr_cosp = +1.0 - 2.0 * (x * x + y * y)
-    roll = math.atan2(sinr_cosp, cosr_cosp)
+    pitch, roll, yaw = orientation.quat_to_euler((w, x, y, z)).tolist()
 
-    # pitch(y-axis rotation)
-    sinp = +2.0 * (w * y - z * x)
-    if math.fabs(sinp) >= 1:
-        pitch = math.copysign(math.pi / 2, sinp)
-        # use 90 degrees if out of range
-    else:
-        pitch = math.asin(sinp)
+    return SensorData.Triple(pitch, roll, yaw)
 
-    # yaw(z-axis rotation)
-    siny_cosp = +2.0 * (w * z + x * y)
-    cosy_cosp = +1.0 - 2.0 * (y * y + z * z)
-    yaw = math.atan2(siny_cosp, cosy_cosp)
+class Triple(namedtuple('Triple', ('x', 'y', 'z'))):
+    """Three values that can be read by index or by name
+    """
+    __slots__ = ()
 
-    pitch, yaw, roll = map(math.degrees, (pitch, roll, yaw))
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        return super().__getitem__(key)
+
+
+class Quat(namedtuple('Quat', ('w', 'x', 'y', 'z'))):
+    """Quaternion components, without the cost of a {Quaternion} object
+    """
+    __slots__ = ()
+
+    @property
+    def vector(self):
+        return self[1:]
+
+    def __bool__(self):
+        return any(self)
+
+
+def _is_unit(quat, tolerance: float = 0.1):
+    return abs(math.sqrt(sum(v * v for v in quat)) - 1) < tolerance
 
-    return SensorData.Triple(pitch, roll, yaw)
 
 class SensorData():
     """Stores sensor data including orientation and angle
+
+    Every channel is a plain float in a slot, so creating and copying a sample
+    doesn't allocate anything else. {gyro} and {accel} are read-only tuples
+    built on access.
+
+    Besides the channels, a sample carries where it came from: {seq} counts
+    the samples parsed on the host, {t_recv} is the {time.perf_counter} at
+    which its bytes were received, and {fw_seq} and {fw_millis} are the
+    firmware's sequence number and clock, when the frame format has them.
     """
-    class Triple():
-        def __init__(self, x: float, y: float, z: float):
-            self.x = x
-            self.y = y
-            self.z = z
-
-        def __len__(self):
-            return 3
-
-        def __getitem__(self, key):
-            if key in ("x", 0):
-                return self.x
-            if key in ("y", 1):
-                return self.y
-            if key in ("z", 2):
-                return self.z
-
-            if isinstance(key, int) and key >= self.__len__():
-                raise IndexError()
-            else:
-                raise KeyError(key)
+    Triple = Triple
+
+    _KEYS = ('gw', 'gx', 'gy', 'gz', 'ax', 'ay', 'az', 'flex')
+    __slots__ = _KEYS + ('seq', 't_recv', 'fw_seq', 'fw_millis')
 
     def __init__(self,
                  gw: float = 0.0, gx: float = 0.0, gy: float = 0.0, gz: float = 0.0,
                  ax: float = 0.0, ay: float = 0.0, az: float = 0.0,
                  angle: float = 0.0):
-        self.gyro = Quaternion([gw, gx, gy, gz])
-        self.accel = self.Triple(ax, ay, az)
+        self.gw = gw
+        self.gx = gx
+        self.gy = gy
+        self.gz = gz
+        self.ax = ax
+        self.ay = ay
+        self.az = az
         self.flex = angle
+        self.seq = None
+        self.t_recv = None
+        self.fw_seq = None
+        self.fw_millis = None
+
+    @property
+    def gyro(self):
+        """Orientation quaternion (w, x, y, z)
+        """
+        return Quat(self.gw, self.gx, self.gy, self.gz)
+
+    @gyro.setter
+    def gyro(self, value):
+        self.gw, self.gx, self.gy, self.gz = value
+
+    @property
+    def accel(self):
+        """World-frame acceleration (x, y, z)
+        """
+        return Triple(self.ax, self.ay, self.az)
+
+    @accel.setter
+    def accel(self, value):
+        self.ax, self.ay, self.az = value
 
     @property
     def gyro_euler(self):
         """Gets Euler angles for the gyro sensor
         """
-        return quat_to_euler(self.gyro.w, self.gyro.x, self.gyro.y, self.gyro.z)
+        return quat_to_euler(self.gw, self.gx, self.gy, self.gz)
 
     def __str__(self):
+        gyro_euler = self.gyro_euler
         return "gyro(%4.1f,%4.1f,%4.1f) accel(%8.1f,%8.1f,%8.1f) flex(%8.1f)" % \
-            (self.gyro_euler.x, self.gyro_euler.y, self.gyro_euler.z,
-             self.accel.x, self.accel.y, self.accel.z, self.flex)
+            (gyro_euler.x, gyro_euler.y, gyro_euler.z,
+             self.ax, self.ay, self.az, self.flex)
 
     def __len__(self):
         return 8
 
-    def __getitem__(self, key):
-        if key in ("gw", 0):
-            return self.gyro.w
-        if key in ("gx", 1):
-            return self.gyro.x
-        if key in ("gy", 2):
-            return self.gyro.y
-        if key in ("gz", 3):
-            return self.gyro.z
-        if key in ("ax", 4):
-            return self.gyro.x
-        if key in ("ay", 5):
-            return self.gyro.y
-        if key in ("az", 6):
-            return self.gyro.z
-        if key in ("flex", 7):
-            return self.flex
-
-        if isinstance(key, int) and key >= self.__len__():
-            raise IndexError()
-        else:
+    def __key(self, key):
+        if isinstance(key, int):
+            if not 0 <= key < len(self._KEYS):
+                raise IndexError()
+            return self._KEYS[key]
+        if key not in self._KEYS:
             raise KeyError(key)
+        return key
+
+    def __getitem__(self, key):
+        return getattr(self, self.__key(key))
 
     def __setitem__(self, key, value):
-        if key in ("gw", 0):
-            self.gyro.w = value
-        if key in ("gx", 1):
-            self.gyro.x = value
-        if key in ("gy", 2):
-            self.gyro.y = value
-        if key in ("gz", 3):
-            self.gyro.z = value
-        if key in ("ax", 4):
-            self.gyro.z = value
-        if key in ("ay", 5):
-            self.gyro.z = value
-        if key in ("az", 6):
-            self.gyro.z = value
-        if key in ("flex", 7):
-            self.flex = value
-        else:
-            raise KeyError()
+        setattr(self, self.__key(key), value)
+
+    def __iter__(self):
+        yield self.gw
+        yield self.gx
+        yield self.gy
+        yield self.gz
+        yield self.ax
+        yield self.ay
+        yield self.az
+        yield self.flex
 
     def __sub__(self, other):
         difference = SensorData(
-            self.gyro.w - other.gyro.w,
-            self.gyro.x - other.gyro.x,
-            self.gyro.y - other.gyro.y,
-            self.gyro.z - other.gyro.z,
-            self.accel.x - other.accel.x,
-            self.accel.y - other.accel.y,
-            self.accel.z - other.accel.z,
+            self.gw - other.gw,
+            self.gx - other.gx,
+            self.gy - other.gy,
+            self.gz - other.gz,
+            self.ax - other.ax,
+            self.ay - other.ay,
+            self.az - other.az,
             self.flex - other.flex
         )
 
         return difference
 
+    def copy(self):
+        """Returns an independent snapshot of this sample
+        """
+        sample = SensorData(self.gw, self.gx, self.gy, self.gz,
+                            self.ax, self.ay, self.az, self.flex)
+        sample.seq = self.seq
+        sample.t_recv = self.t_recv
+        sample.fw_seq = self.fw_seq
+        sample.fw_millis = self.fw_millis
+        return sample
+
+    def interpolate(self, other: 'SensorData', t: float):
+        """A sample a fraction {t} of the way from this one to {other}
+
+        The orientation is slerped and the other channels are interpolated
+        linearly. Everything but the channels is taken from {other}.
+        """
+        if t >= 1:
+            return other.copy()
+        sample = other.copy()
+        if t <= 0:
+            sample.gyro = self.gyro
+            sample.accel = self.accel
+            sample.flex = self.flex
+            return sample
+        start = self.gyro
+        end = other.gyro
+        if _is_unit(start) and _is_unit(end):
+            sample.gyro = orientation.slerp(start, end, t).tolist()
+        else:
+            # no orientation yet, as in recordings without one
+            sample.gyro = end
+        sample.accel = (a + (b - a) * t for a, b in zip(self.accel, other.accel))
+        sample.flex = self.flex + (other.flex - self.flex) * t
+        return sample
+
+    def record(self):
+        """The sample as a tuple in the layout of {SAMPLE_DTYPE}
+        """
+        return (-1 if self.seq is None else self.seq,
+                np.nan if self.t_recv is None else self.t_recv,
+                (self.gw, self.gx, self.gy, self.gz),
+                (self.ax, self.ay, self.az),
+                self.flex)
+
+    @classmethod
+    def from_record(cls, record):
+        """Builds a sample from one {SAMPLE_DTYPE} record, as made by {record}
+        """
+        seq, t_recv, gyro, accel, flex = record.tolist()
+        sample = cls(*gyro.tolist(), *accel.tolist(), flex)
+        sample.seq = None if seq < 0 else seq
+        sample.t_recv = None if math.isnan(t_recv) else t_recv
+        return sample
+
     def clf_data(self):
         """Generator of data to be used in the classifier"""
-        # yield self.gyro.w
-        # yield self.gyro.x
-        # yield self.gyro.y
-        # yield self.gyro.z
-        yield self.accel.x
-        yield self.accel.y
-        yield self.accel.z
+        # yield self.gw
+        # yield self.gx
+        # yield self.gy
+        # yield self.gz
+        yield self.ax
+        yield self.ay
+        yield self.az
         yield self.flex
 
     def setdata(self,
@@ -173,51 +259,371 @@ class SensorData():
                 ax: float = None, ay: float = None, az: float = None,
                 flex: float = None
                 ):
-        self.gyro[0] = gw or self.gyro.w
-        self.gyro[1] = gx or self.gyro.x
-        self.gyro[2] = gy or self.gyro.y
-        self.gyro[3] = gz or self.gyro.z
-        self.accel.x = ax or self.accel.x
-        self.accel.y = ay or self.accel.y
-        self.accel.z = az or self.accel.z
+        self.gw = gw or self.gw
+        self.gx = gx or self.gx
+        self.gy = gy or self.gy
+        self.gz = gz or self.gz
+        self.ax = ax or self.ax
+        self.ay = ay or self.ay
+        self.az = az or self.az
         self.flex = flex or self.flex
 
 
+# Columns of {SensorBatch}, one record per sample
+SAMPLE_DTYPE = np.dtype([
+    ('seq', '<i8'),
+    ('t_recv', '<f8'),
+    ('gyro', '<f8', (4,)),
+    ('accel', '<f8', (3,)),
+    ('flex', '<f8'),
+])
+
+
+class SensorBatch():
+    """Stores many samples column by column
+
+    Samples live in one preallocated structured array with {SAMPLE_DTYPE},
+    which grows by doubling. Columns are returned as views, so whole batches
+    can be processed with NumPy instead of one {SensorData} at a time.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """
+        Keyword Arguments:
+            capacity {int} -- Initial number of samples to allocate (default: {1024})
+        """
+        self.records = np.zeros(max(1, capacity), dtype=SAMPLE_DTYPE)
+        self.size = 0
+
+    @classmethod
+    def from_samples(cls, samples):
+        """Builds a batch from {SensorData} objects
+        """
+        samples = list(samples)
+        batch = cls(len(samples))
+        for sample in samples:
+            batch.append(sample)
+        return batch
+
+    @classmethod
+    def from_records(cls, records):
+        """Wraps an array with {SAMPLE_DTYPE} without copying it
+        """
+        batch = cls.__new__(cls)
+        batch.records = records
+        batch.size = len(records)
+        return batch
+
+    @classmethod
+    def from_frames(cls, frames, t_recv: float = None):
+        """Builds a batch from records decoded by {protocol.decode}, received
+        at {t_recv}
+        """
+        batch = cls(len(frames))
+        records = batch.records[:len(frames)]
+        records['seq'] = frames['seq']
+        records['t_recv'] = np.nan if t_recv is None else t_recv
+        records['gyro'] = frames['quat'] / protocol.QUAT_SCALE
+        records['accel'] = frames['accel']
+        records['flex'] = np.where(np.isinf(frames['flex']), 0, frames['flex'])
+        batch.size = len(frames)
+        return batch
+
+    def __reserve(self, size):
+        if size > len(self.records):
+            records = np.zeros(max(size, 2 * len(self.records)), dtype=SAMPLE_DTYPE)
+            records[:self.size] = self.records[:self.size]
+            self.records = records
+
+    def append(self, sample: SensorData):
+        """Adds one sample to the end of the batch
+        """
+        self.__reserve(self.size + 1)
+        self.records[self.size] = sample.record()
+        self.size += 1
+
+    def extend(self, batch: 'SensorBatch'):
+        """Adds every sample of another batch to the end of this one
+        """
+        self.__reserve(self.size + len(batch))
+        self.records[self.size:self.size + len(batch)] = batch.records[:len(batch)]
+        self.size += len(batch)
+
+    def clear(self):
+        """Removes every sample, keeping the allocated memory
+        """
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError()
+        return SensorData.from_record(self.records[index])
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self[i]
+
+    @property
+    def seq(self):
+        return self.records['seq'][:self.size]
+
+    @property
+    def t_recv(self):
+        """Receive time of every sample, NaN where unknown
+        """
+        return self.records['t_recv'][:self.size]
+
+    @property
+    def gyro(self):
+        """Quaternions with shape (N, 4)
+        """
+        return self.records['gyro'][:self.size]
+
+    @property
+    def accel(self):
+        """Accelerations with shape (N, 3)
+        """
+        return self.records['accel'][:self.size]
+
+    @property
+    def flex(self):
+        return self.records['flex'][:self.size]
+
+    @property
+    def gyro_euler(self):
+        """Euler angles for every sample with shape (N, 3)
+        """
+        return orientation.quat_to_euler(self.gyro)
+
+    def clf_data(self):
+        """Data to be used in the classifier, with shape (N, 4)
+        """
+        return np.column_stack((self.accel, self.flex))
+
+
+class FrameParser():
+    """Incrementally splits the serial byte stream into sensor frames
+
+    Bytes can be fed in chunks of any size. Every complete frame is returned
+    once, in order, as a new {SensorData} numbered by {seq}.
+    """
+    TEAPOT_SIZE = 14
+    MAX_LINE = 256
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # ypr/quat frames may omit channels, so the last values are kept
+        self.data = SensorData()
+        self.seq = 0
+        self.errors = 0
+        self.__t_recv = None
+
+    def feed(self, chunk: bytes, t_recv: float = None):
+        """Parses a chunk of bytes read from the serial port.
+
+        Arguments:
+            chunk {bytes} -- Raw bytes, possibly ending mid-frame
+
+        Keyword Arguments:
+            t_recv {float} -- When the chunk was received, stamped on every
+            frame it completes (default: {None})
+
+        Returns:
+            list -- Every {SensorData} completed by this chunk
+        """
+        self.__t_recv = t_recv
+        buf = self.buffer
+        buf += chunk
+        frames = []
+        pos = 0
+        while True:
+            if buf.startswith(protocol.SYNC, pos):
+                records, end, _ = protocol.decode(buf, pos, resync=False)
+                if not len(records):
+                    if len(buf) - pos < protocol.FRAME.size:
+                        break
+                    # corrupt frame, look for the next one
+                    self.errors += 1
+                    pos += 1
+                    continue
+                self.__emit_records(records, frames)
+                pos = end
+                continue
+            elif buf.startswith(b'$\x02', pos) \
+                    and buf[pos + 12:pos + 14] in (b'', b'\r', b'\r\n'):
+                end = pos + self.TEAPOT_SIZE
+                if end > len(buf):
+                    break
+                ok = self.__parse_teapot(buf[pos:end])
+            else:
+                end = buf.find(b'\n', pos) + 1
+                # garbage followed by a binary frame
+                sync = buf.find(protocol.SYNC, pos, end or len(buf))
+                if sync >= 0:
+                    self.errors += 1
+                    pos = sync
+                    continue
+                if end == 0:
+                    if len(buf) - pos > self.MAX_LINE:
+                        self.errors += 1
+                        pos = len(buf) - 1
+                    break
+                ok = self.__parse_line(bytes(buf[pos:end]))
+            pos = end
+
+            if ok:
+                frames.append(self.__snapshot())
+            else:
+                self.errors += 1
+        del buf[:pos]
+        return frames
+
+    def __snapshot(self):
+        sample = self.data.copy()
+        sample.seq = self.seq
+        sample.t_recv = self.__t_recv
+        self.seq += 1
+        return sample
+
+    def __emit_records(self, records, frames):
+        quat = records['quat'] / protocol.QUAT_SCALE
+        accel = records['accel'].astype(float)
+        for gyro, (ax, ay, az), flex, fw_seq, fw_millis in zip(
+                quat.tolist(), accel.tolist(), records['flex'].tolist(),
+                records['seq'].tolist(), records['millis'].tolist()):
+            self.data.gyro = gyro
+            self.data.accel = ax, ay, az
+            self.data.flex = flex if flex != float("inf") else 0
+            self.data.fw_seq = fw_seq
+            self.data.fw_millis = fw_millis
+            frames.append(self.__snapshot())
+
+    def __parse_line(self, line: bytes):
+        if line[-2:] != b'\r\n':
+            return False
+        data = line[:-2].split(b'\t')
+        try:
+            # serial data is in yaw/pitch/roll format
+            if len(data) == 10 and data[0] == b'ypr':
+                gyro = orientation.ypr_to_quat([float(v) for v in data[1:4]]).tolist()
+                accel = data[5:8] if data[4] == b'aworld' else None
+                flex = data[9] if data[8] == b'flex' else None
+            # serial data has quaternion data
+            elif len(data) == 11 and data[0] == b'quat':
+                gyro = [float(v) for v in data[1:5]]
+                accel = data[6:9] if data[5] == b'aworld' else None
+                flex = data[10] if data[9] == b'flex' else None
+            else:
+                return False
+
+            self.data.gyro = gyro
+            if accel is not None:
+                self.data.accel = (float(v) for v in accel)
+            if flex is not None:
+                flex = float(flex)
+                self.data.flex = flex if flex != float("inf") else 0
+        except ValueError:
+            return False
+        return True
+
+    def __parse_teapot(self, packet: bytes):
+        q = [0.0]*4
+        for i in range(4):
+            q[i] = ((packet[2 + 2*i] << 8) | packet[3 + 2*i]) / 16384.0
+            if q[i] >= 2:
+                q[i] = -4 + q[i]
+        self.data.gyro = q
+        return True
+
+
 class Sensors():
-    """Reads sensor data from UDP or serial ports
+    """Reads sensor data from UDP or serial ports, or replays a recording
     """
     __interval = 0
 
     mode = "serial"
     sock = None
     ser = None
+    replay = None
+    ingest = None
+    device = None
     data = None
-
-    def __init__(self, net_port=False, serial_port=True):
+    dropped = 0
+
+    __thread = None
+    __frames = None
+    __sampler = None
+    __running = False
+    __buffer = None
+    __latest = None
+
+    def __init__(self, net_port=False, serial_port=True, replay_file=None,
+                 replay_speed=1.0, replay_rate=100.0, replay_loop=False,
+                 latency=None, device=None):
         """
         Keyword Arguments:
             net_port {int|bool} -- UDP port or {False} if not UDP (default: {False})
             serial_port {str|bool} -- Serial port or {False} if not serial (default: {True})
+            replay_file {str} -- Recording to play back instead of reading
+            any port (default: {None})
+            replay_speed {float} -- Playback speed, where 0 is as fast as
+            possible (default: {1.0})
+            replay_rate {float} -- Sample rate of recordings without
+            timestamps, in Hz (default: {100.0})
+            replay_loop {bool} -- Start the recording over when it ends (default: {False})
+            latency {LatencyMonitor} -- Where to record how long parsing
+            takes, or {None} (default: {None})
+            device {tuple|bool} -- With UDP, only read the device at this
+            (host, port) address, or {True} for the first one heard from,
+            through an {ingest.IngestServer} (default: {None})
         """
+        self.latency = latency
         self.data = SensorData()
-        self.mode = "net" if net_port else "serial"
-        if self.mode == "net":
+        self.__sampler = telemetry.Sampler(100)
+        if replay_file:
+            self.mode = "file"
+        else:
+            self.mode = "net" if net_port else "serial"
+        if self.mode == "file":
+            from replay import Replay
+
+            print("Replaying:", replay_file)
+            self.replay = Replay(replay_file, replay_speed, replay_rate, replay_loop)
+        elif self.mode == "net":
             print("Receiver IP: ", socket.gethostbyname(socket.gethostname()))
             udp_port = net_port
             # UDP_PORT = int(raw_input ("Enter Port "))
             print("Port: ", udp_port)
-            self.sock = socket.socket(socket.AF_INET,  # Internet
-                                      socket.SOCK_DGRAM)  # UDP
-            self.sock.bind(("0.0.0.0", udp_port))
+            if device is not None:
+                from ingest import IngestServer
+
+                self.ingest = IngestServer(udp_port)
+                self.device = device
+                self.__frames = deque()
+            else:
+                self.sock = socket.socket(socket.AF_INET,  # Internet
+                                          socket.SOCK_DGRAM)  # UDP
+                self.sock.bind(("0.0.0.0", udp_port))
+                # don't block forever, so a background reader can be stopped
+                self.sock.settimeout(1)
+                self.parser = FrameParser()
         else:
+            # pyserial is only needed for this source
+            import serial
+            from serial.tools import list_ports
+
             port = serial_port
-            serial.tools.list_ports.grep
 
             try:
-                search = serial.tools.list_ports.grep(port)
+                search = list_ports.grep(port)
                 next(search)
             except Exception:
-                port_list = serial.tools.list_ports.comports()
+                port_list = list_ports.comports()
                 for p in port_list:
                     if 'arduino' in p.description.lower():
                         port = p.device
@@ -229,11 +635,93 @@ class Sensors():
             print("Serial port:", port)
             print("Baud rate:", baud_rate)
             self.ser = serial.Serial(port, baud_rate, timeout=1)
+            self.parser = FrameParser()
+            self.__frames = deque()
+
+    def start(self, buffer_size: int = 1024):
+        """Starts acquiring samples in a background thread.
+
+        After this, {read} no longer blocks and returns the latest sample.
+        Use {latest} and {drain} to consume samples at any rate.
+
+        Keyword Arguments:
+            buffer_size {int} -- How many samples to keep before the oldest
+            ones are dropped. A replay waits for room instead (default: {1024})
+        """
+        if self.__running:
+            return
+        self.__buffer = deque(maxlen=buffer_size)
+        self.__latest = None
+        self.dropped = 0
+        self.__running = True
+        self.__thread = threading.Thread(
+            target=self.__run, name="sensors", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stops the background thread started by {start}.
+        """
+        self.__running = False
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __run(self):
+        # deque.append and plain attribute assignment are atomic, so the
+        # consumers never need to take a lock
+        while self.__running:
+            data = self.__acquire()
+            if data is None:
+                if self.replay is not None and self.replay.done:
+                    # let a later start() play it again
+                    self.__running = False
+                    break
+                continue
+            sample = data.copy()
+            if self.replay is not None:
+                # a replay can wait for room, so none of it is lost
+                while len(self.__buffer) == self.__buffer.maxlen and self.__running:
+                    time.sleep(REPLAY_WAIT)
+            if len(self.__buffer) == self.__buffer.maxlen:
+                self.dropped += 1
+            self.__buffer.append(sample)
+            self.__latest = sample
+
+    def latest(self):
+        """Returns the most recent sample without blocking, or {None} if
+        nothing has been received yet.
+        """
+        return self.__latest
+
+    def drain(self):
+        """Returns every sample received since the last call, oldest first.
+        """
+        samples = []
+        if self.__buffer is None:
+            return samples
+        popleft = self.__buffer.popleft
+        while True:
+            try:
+                samples.append(popleft())
+            except IndexError:
+                return samples
 
     def read(self):
         """Reads data from source defined in {mode}.
+
+        If the background thread is running, returns the latest sample
+        instead of blocking.
         """
-        if self.mode == "net":
+        if self.__running:
+            return self.latest()
+        return self.__acquire()
+
+    def __acquire(self):
+        if self.mode == "file":
+            return self.replay.read()
+        elif self.mode == "net":
+            if self.ingest is not None:
+                return self.__readingest()
             return self.__readsocket()
         else:
             return self.__readserial()
@@ -243,128 +731,87 @@ class Sensors():
 
         try:
             data, _ = self.sock.recvfrom(1024)  # buffer size is 1024 bytes
-            print("received message: ", "%1.4f"
-                  % unpack_from('!f', data, 0), "%1.4f"
-                  % unpack_from('!f', data, 4), "%1.4f"
-                  % unpack_from('!f', data, 8), "%1.4f"
-
-                  % unpack_from('!f', data, 12), "%1.4f"
-                  % unpack_from('!f', data, 16), "%1.4f"
-                  % unpack_from('!f', data, 20), "%1.4f"
-
-                  % unpack_from('!f', data, 24), "%1.4f"
-                  % unpack_from('!f', data, 28), "%1.4f"
-                  % unpack_from('!f', data, 32), "%1.4f"
-
-                  % unpack_from('!f', data, 36), "%1.4f"
-                  % unpack_from('!f', data, 40), "%1.4f"
-                  % unpack_from('!f', data, 44), "%1.4f"
-
-                  % unpack_from('!f', data, 48), "%1.4f"
-                  % unpack_from('!f', data, 52), "%1.4f"
-                  % unpack_from('!f', data, 56), "%1.4f"
-                  % unpack_from('!f', data, 60), "%1.4f"
-                  % unpack_from('!f', data, 64), "%1.4f"
-                  % unpack_from('!f', data, 68), "%1.4f"
-                  % unpack_from('!f', data, 72), "%1.4f"
-                  % unpack_from('!f', data, 76), "%1.4f"
-                  % unpack_from('!f', data, 80), "%1.4f"
-                  % unpack_from('!f', data, 84), "%1.4f"
-                  % unpack_from('!f', data, 88), "%1.4f"
-                  % unpack_from('!f', data, 92))
-
-            accel = (unpack_from('!f', data, 0),
-                     unpack_from('!f', data, 4),
-                     unpack_from('!f', data, 8))
+            t_recv = time.perf_counter()
+            if data.startswith(protocol.SYNC):
+                frames = self.parser.feed(data, t_recv)
+                self.parser.buffer.clear()
+                self.__parsed(t_recv)
+                if frames:
+                    self.data = frames[-1]
+                    return self.data
+                return None
+
+            values = UDP_PACKET.unpack_from(data)
+            if self.__sampler() and log.isEnabledFor(logging.DEBUG):
+                log.debug("received message: %s", values)
+
+            accel = values[0:3]
 
             # angles = [float(x) for x in line.split(b',')]
-            angles = (unpack_from('!f', data, 36)[0],
-                      unpack_from('!f', data, 40)[0],
-                      unpack_from('!f', data, 44)[0])
+            angles = values[9:12]
 
             if len(angles) == 3:
 
                 if yaw_offset == 0:
                     yaw_offset = float(angles[0])
 
-                print("angles", angles)
-                ax = -float(angles[2])
-                ay = -float(angles[1])
-                az = float(angles[0])
-
-                self.data.setdata(ax, ay, az)
+                self.data.gyro = orientation.ypr_to_quat(
+                    (float(angles[0]), -float(angles[1]), -float(angles[2]))).tolist()
+                self.data.t_recv = t_recv
+                self.__parsed(t_recv)
                 return self.data
-        except Exception as e:
-            pass
+        except socket.timeout:
+            return None
+        except Exception as exception:
+            log.debug("Ignoring UDP packet: %s", exception)
+
+    def __readingest(self):
+        while not self.__frames:
+            # don't block forever, so a background reader can be stopped
+            if not self.ingest.poll(1):
+                return None
+            if self.device is True and self.ingest.sessions:
+                self.device = next(iter(self.ingest.sessions))
+                print("Device:", "%s:%d" % self.device)
+            session = self.ingest.sessions.get(self.device)
+            if session is not None:
+                self.__frames.extend(session.drain())
+        self.data = self.__frames.popleft()
+        return self.data
 
     def __readserial(self):
-        gw = gx = gy = gz = 0.0
-        ax = ay = az = 0.0
-        gyro = []
-        accel = []
-
         # request data by sending a character
         millis = int(round(time.time() * 1000))
         if (millis - self.__interval > 1000):
             # resend single character to trigger DMP init/start
             # in case the MPU is halted/reset while applet is running
+            from serial import SerialException
             try:
                 self.ser.write(b'r')
             except SerialException:
-                print("\nFail to write to serial")
-            __interval = millis
-
-        # while not line_done:
-        self.ser.flush()
-        self.ser.reset_input_buffer()
-        self.ser.reset_output_buffer()
-        line = self.ser.readline()
-
-        # serial data is in yaw/pitch/roll format
-        data = line[:-2].split(b'\t')
-        if len(data) == 10 and line[:3] == b'ypr' and line[-2:] == b'\r\n':
-            gyro = [0] + data[1:4] #TODO: change this workaround that uses Quaternion without w
-            if data[4] == b'aworld':
-                accel = data[5:8]
-            if data[8] == b'flex':
-                flex = float(data[9])
-                self.data.setdata(flex=(flex if flex != float("inf") else 0))
-        # serial data has quaternion data
-        elif len(data) == 11 and line[:4] == b'quat' and line[-2:] == b'\r\n':
-            gyro = data[1:5]
-            if data[5] == b'aworld':
-                accel = data[6:9]
-            if data[9] == b'flex':
-                flex = float(data[10])
-                self.data.setdata(flex=(flex if flex != float("inf") else 0))
-
-        elif len(line) > 9 and line[0:2] == b'$\x02' and line[-2:] == b'\r\n':
-            q = [0.0]*4
-            q[0] = ((line[2] << 8) | line[3]) / 16384.0
-            q[1] = ((line[4] << 8) | line[5]) / 16384.0
-            q[2] = ((line[6] << 8) | line[7]) / 16384.0
-            q[3] = ((line[8] << 8) | line[9]) / 16384.0
-
-            for i, _ in enumerate(range(4)):
-                if (q[i] >= 2):
-                    q[i] = -4 + q[i]
-            gyro = q
-
-        if len(gyro) == 4:
-            gw = float(gyro[0])
-            gx = float(gyro[1])
-            gy = float(gyro[2])
-            gz = float(gyro[3])
-            self.data.setdata(gw=gw, gx=gx, gy=gy, gz=gz)
-            if len(accel) == 3:
-                ax = float(accel[0])
-                ay = float(accel[1])
-                az = float(accel[2])
-                self.data.setdata(ax=ax, ay=ay, az=az)
-            return self.data
+                log.warning("Fail to write to serial")
+            self.__interval = millis
+
+        # Consume the stream continuously and hand out one frame per call, so
+        # nothing the DMP produced between calls is lost
+        while not self.__frames:
+            chunk = self.ser.read(self.ser.in_waiting or 1)
+            if not chunk:
+                return None
+            t_recv = time.perf_counter()
+            self.__frames.extend(self.parser.feed(chunk, t_recv))
+            self.__parsed(t_recv)
+
+        self.data = self.__frames.popleft()
+        return self.data
+
+    def __parsed(self, t_recv):
+        if self.latency is not None:
+            self.latency.record('parse', time.perf_counter() - t_recv)
 
     def close(self):
-        """Not implemented. Meant to be used if file source is ever implemented.
+        """Stops the background thread, if any.
         """
-        # self.file.close()
-        pass
+        self.stop()
+        if self.ingest is not None:
+            self.ingest.close()
@@ -1,56 +1,84 @@
 """Shows a 3D simulation of a leg prosthesis
 """
 import copy
-import math
+import logging
+from collections import OrderedDict
 
+import numpy as np
 import OpenGL.GL as gl
 import OpenGL.GLU as glu
-from numpy.lib import math
 import pygame
 from pyquaternion import Quaternion
-from sensors import SensorData, quat_to_euler
 
+import orientation
+import telemetry
+from sensors import SensorData
 
-def quat_to_axis_rotation(*args):
-    """Converts quaternion to euler angles
+log = telemetry.get_logger(__name__)
+
+
+# Turns the shank, modelled along z, to stand upright at rest
+MODEL_ALIGNMENT = Quaternion(axis=(.5, .5, -.5), degrees=120)
+
+
+def to_model_axes(quat: Quaternion):
+    """Rotation in the axes of the model from one in the axes of the sensor,
+    where the sensor's x, y and z are the model's -y, z and -x
     """
-    if len(args) == 4 and all(map(lambda x: isinstance(x, float), args)):
-        Quaternion(args).unit
-
-    elif len(args) == 1 and isinstance(args[0], Quaternion):
-        quat = args[0].unit
-
-    else:
-        raise TypeError(
-            "Use either 4 floats (w, x, y, z) or one Quaternion object.")
-
-    # 2 * math.acos(quat.w)
-    angle = math.atan2(math.sqrt(sum(i**2 for i in quat.vector)), quat.w)
-    # assuming quaternion normalised then w is less than 1, so term always positive.
-    s = math.sqrt(1-quat.w * quat.w)
-    if s < 0.001:  # test to avoid divide by zero, s is always positive due to sqrt
-        # if s close to zero then direction of axis not important
-        x = quat.x  # if it is important that axis is normalised then replace with x=1; y=z=0;
-        y = quat.y
-        z = quat.z
-    else:
-        x = quat.x / s  # normalise axis
-        y = quat.y / s
-        z = quat.z / s
-
-    # theta = 2 * \
-    #     math.atan2(math.sqrt(sum(i**2 for i in quat.vector)), quat.w)
-    # x, y, z = (n / math.sin(theta / 2) for n in quat.vector) \
-    #     if theta != 0 else (0, 0, 0)
-
-    return (math.degrees(angle), z, x, -y)
+    return Quaternion(quat.w, -quat.z, -quat.x, quat.y)
+
+
+def foot_quads(back: float, front: float, height: float, toe: float):
+    """Faces of one part of the foot, as (normal, vertices) pairs
+
+    Arguments:
+        back {float} -- y of the back face
+        front {float} -- y of the front face
+        height {float} -- z of the bottom face
+        toe {float} -- z of the top face at the front
+    """
+    return (
+        # foot - back
+        ((0, -1, 0), ((-0.2, back, 0.0), (0.2, back, 0.0),
+                      (0.2, back, height), (-0.2, back, height))),
+        # foot - right
+        ((-1, 0, 0), ((-0.2, back, height), (-0.2, front, height),
+                      (-0.2, front, toe), (-0.2, back, 0.0))),
+        # foot - left
+        ((1, 0, 0), ((0.2, back, height), (0.2, front, height),
+                     (0.2, front, toe), (0.2, back, 0.0))),
+        # foot - top
+        ((0, 0, -1), ((-0.2, back, 0.0), (-0.2, front, toe),
+                      (0.2, front, toe), (0.2, back, 0.0))),
+        # foot - front
+        ((0, 1, 0), ((-0.2, back, height), (-0.2, front, height),
+                     (0.2, front, height), (0.2, back, height))),
+        # foot - bottom
+        ((0, 0, 1), ((-0.2, front, height), (-0.2, front, toe),
+                     (0.2, front, toe), (0.2, front, height))),
+    )
 
 
 class Simulation():
     """Shows a 3D simulation of a leg prosthesis
+
+    The static meshes are compiled into display lists and the GL state is set
+    once, so each frame only issues a few transforms and list calls.
     """
+    blue = (.27, .388, .678)
+    dark_grey = (.235, .243, .266)
+    grey = (.309, .309, .309)
+    light_grey = (.447, .435, .449)
+    font_name = "Courier"
+    font_size = 18
+    text_cache_size = 64
+
     sensor_data = SensorData()
     offset = SensorData()
+    # inverse of the orientation of {offset}, or {None} if not recentered
+    offset_inverse = None
+    # extra lines of text shown under the readings
+    overlay = ()
     pose = 0
     __num_poses = 2
     flex_bent = 54000.0
@@ -77,6 +105,8 @@ class Simulation():
         glu.gluPerspective(45, 1.0*width/height, 0.1, 100.0)
         gl.glMatrixMode(gl.GL_MODELVIEW)
         gl.glLoadIdentity()
+        # the window may get a new GL context when it's resized
+        self.init_gl()
 
     def __init__(self, width: int, height: int):
         """
@@ -84,11 +114,79 @@ class Simulation():
             width {int} -- Window width in pixels
             height {int} -- Window height in pixels
         """
-        self.resize(width, height)
-
         self.quad = glu.gluNewQuadric()
         glu.gluQuadricDrawStyle(self.quad, gl.GL_LINE)
         glu.gluQuadricTexture(self.quad, gl.GL_TRUE)
+        self.lists = None
+        self.font = pygame.font.SysFont(self.font_name, self.font_size, True)
+        self.glyphs = {}
+        self.text_cache = OrderedDict()
+        # log the sensor data once every second or so
+        self.sampler = telemetry.Sampler(60)
+
+        self.resize(width, height)
+
+    def init_gl(self):
+        """Sets the GL state and builds the display lists used by {draw}
+        """
+        gl.glClearColor(.8, .8, .8, 1.0)
+        gl.glClearDepth(1.0)
+        gl.glEnable(gl.GL_DEPTH_TEST)
+        gl.glEnable(gl.GL_LIGHTING)
+        gl.glShadeModel(gl.GL_SMOOTH)
+        gl.glDisable(gl.GL_COLOR_MATERIAL)
+        gl.glDepthFunc(gl.GL_LEQUAL)
+        gl.glHint(gl.GL_PERSPECTIVE_CORRECTION_HINT, gl.GL_NICEST)
+        gl.glEnable(gl.GL_LIGHT0)
+        # the light position is transformed by the modelview matrix, so set it
+        # with the camera in place
+        gl.glPushMatrix()
+        gl.glLoadIdentity()
+        gl.glTranslatef(0, 0.0, -7.0)
+        gl.glLightfv(gl.GL_LIGHT0, gl.GL_POSITION, (1, 2, 3))
+        gl.glPopMatrix()
+        gl.glLightfv(gl.GL_LIGHT0, gl.GL_AMBIENT, (.5, .5, .5))
+        gl.glLightfv(gl.GL_LIGHT0, gl.GL_DIFFUSE, (.6, .6, .6))
+        gl.glLightfv(gl.GL_LIGHT0, gl.GL_SPECULAR, (0, 0, 0))
+        # gl.glLightfv(gl.GL_LIGHT0, gl.GL_SPOT_DIRECTION, (-2, -3, -3))
+        gl.glLightf(gl.GL_LIGHT0, gl.GL_SPOT_CUTOFF, 180) # omnidirectional
+
+        self.__clear_text_cache()
+        if self.lists is not None:
+            gl.glDeleteLists(self.lists, 6)
+        self.lists = gl.glGenLists(6)
+        (self.shank_list, self.joint_list, self.lower_list,
+         self.heel_list, self.toe_joint_list, self.toe_list) = range(self.lists, self.lists + 6)
+
+        self.__compile_cylinder(self.shank_list, self.blue, 0.2, 0.15, 2, 10)
+        self.__compile_sphere(self.joint_list, self.dark_grey, 0.2)
+        self.__compile_cylinder(self.lower_list, self.blue, 0.15, 0.125, 1.8, 9)
+        self.__compile_quads(self.heel_list, self.grey, foot_quads(-0.1, 0.8, 0.3, 0.1))
+        self.__compile_sphere(self.toe_joint_list, self.dark_grey, 0.1)
+        self.__compile_quads(self.toe_list, self.grey, foot_quads(0.02, 0.4, 0.2, 0.1))
+
+    def __compile_cylinder(self, index, color, base, top, height, slices):
+        gl.glNewList(index, gl.GL_COMPILE)
+        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE, color)
+        glu.gluCylinder(self.quad, base, top, height, slices, 1)
+        gl.glEndList()
+
+    def __compile_sphere(self, index, color, radius):
+        gl.glNewList(index, gl.GL_COMPILE)
+        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE, color)
+        glu.gluSphere(self.quad, radius, 6, 6)
+        gl.glEndList()
+
+    def __compile_quads(self, index, color, faces):
+        gl.glNewList(index, gl.GL_COMPILE)
+        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE, color)
+        gl.glBegin(gl.GL_QUADS)
+        for normal, vertices in faces:
+            gl.glNormal3f(*normal)
+            for vertex in vertices:
+                gl.glVertex3f(*vertex)
+        gl.glEnd()
+        gl.glEndList()
 
     def nextPose(self):
         """Show next pose of the foot
@@ -119,89 +217,109 @@ class Simulation():
             data = self.sensor_data
 
         self.offset = copy.deepcopy(data)
+        offset = Quaternion(*data.gyro)
+        if offset:
+            self.offset_inverse = offset.normalised.inverse
+            self.flex_bent = self.offset.flex - self.flex_straight + self.flex_bent
+            self.flex_straight = self.offset.flex
+
+    def __clear_text_cache(self):
+        for index in self.glyphs.values():
+            gl.glDeleteLists(index, 1)
+        for index in self.text_cache.values():
+            gl.glDeleteLists(index, 1)
+        self.glyphs.clear()
+        self.text_cache.clear()
+
+    def __glyph(self, char):
+        """Display list that draws one character and moves the raster
+        position past it
+        """
+        index = self.glyphs.get(char)
+        if index is None:
+            surface = self.font.render(
+                char, True, (20, 20, 20, 255), (204, 204, 204, 230))
+            pixels = pygame.image.tostring(surface, "RGBA", True)
+            index = gl.glGenLists(1)
+            gl.glNewList(index, gl.GL_COMPILE)
+            gl.glDrawPixels(surface.get_width(), surface.get_height(),
+                            gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, pixels)
+            gl.glBitmap(0, 0, 0, 0, surface.get_width(), 0, None)
+            gl.glEndList()
+            self.glyphs[char] = index
+        return index
 
     def drawText(self, position, textString):
-        font = pygame.font.SysFont("Courier", 18, True)
-        text_surface = font.render(
-            textString, True, (20, 20, 20, 255), (204, 204, 204, 230))
-        text_data = pygame.image.tostring(text_surface, "RGBA", True)
+        """Draws a line of text at a 3D position
+
+        Each character is rendered once into a display list. Whole lines are
+        kept in an LRU cache of display lists too, so a line that was drawn
+        recently costs a single call.
+        """
         gl.glRasterPos3d(*position)
-        gl.glDrawPixels(text_surface.get_width(), text_surface.get_height(),
-                        gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, text_data)
+        key = (self.font_name, self.font_size, textString)
+        index = self.text_cache.get(key)
+        if index is not None:
+            self.text_cache.move_to_end(key)
+            gl.glCallList(index)
+            return
+
+        glyphs = [self.__glyph(char) for char in textString]
+        index = gl.glGenLists(1)
+        gl.glNewList(index, gl.GL_COMPILE_AND_EXECUTE)
+        for glyph in glyphs:
+            gl.glCallList(glyph)
+        gl.glEndList()
+        self.text_cache[key] = index
+        if len(self.text_cache) > self.text_cache_size:
+            _, evicted = self.text_cache.popitem(last=False)
+            gl.glDeleteLists(evicted, 1)
 
     def draw(self):
         """Draws one frame in the OpenGL window
         """
-        blue = (.27, .388, .678)
-        dark_grey = (.235, .243, .266)
-        grey = (.309, .309, .309)
-        light_grey = (.447, .435, .449)
         sensor_data = self.sensor_data
-        print("\r%s" % sensor_data, end='')
-        #FIXME: Workaround to avoid using quaternions
-        quat = Quaternion(sensor_data.gyro.w, sensor_data.gyro.x,
-                          sensor_data.gyro.y, sensor_data.gyro.z)#.unit
-        offset = Quaternion(self.offset.gyro.w, self.offset.gyro.x,
-                            self.offset.gyro.y, self.offset.gyro.z)
+        if self.sampler() and log.isEnabledFor(logging.DEBUG):
+            log.debug("%s", sensor_data.copy())
+        quat = Quaternion(*sensor_data.gyro)
+        if not quat:
+            # no orientation yet
+            quat = Quaternion()
+        elif self.offset_inverse is not None:
+            quat = self.offset_inverse * quat
+        # one matrix for the whole orientation, aligned to the model
+        matrix = orientation.quat_to_matrix((to_model_axes(quat) * MODEL_ALIGNMENT).elements)
 
-        if offset:
-            #TODO: Change back to quaternions
-            # quat = offset.inverse * sensor_data.gyro
-            quat = quat - offset
-            self.flex_bent = self.offset.flex - self.flex_straight + self.flex_bent
-            self.flex_straight = self.offset.flex
-
-        gyro_euler = quat_to_euler(quat)
-        rotation = quat_to_axis_rotation(quat)
         flex_angle =\
             self.translate_range(self.sensor_data.flex, self.flex_straight, self.flex_bent, 0.0, 90.0) \
             if self.sensor_data.flex != 0 else 0
         flex_angle = min(170, max(-20, flex_angle))
 
-        gl.glClearColor(.8, .8, .8, 1.0)
-        gl.glClearDepth(1.0)
-        gl.glEnable(gl.GL_DEPTH_TEST)
-        gl.glEnable(gl.GL_LIGHTING)
-        gl.glShadeModel(gl.GL_SMOOTH)
-        gl.glDisable(gl.GL_COLOR_MATERIAL)
-        gl.glDepthFunc(gl.GL_LEQUAL)
-        gl.glHint(gl.GL_PERSPECTIVE_CORRECTION_HINT, gl.GL_NICEST)
         gl.glClear(gl.GL_COLOR_BUFFER_BIT |
                    gl.GL_DEPTH_BUFFER_BIT | gl.GL_STENCIL_BUFFER_BIT)
-        gl.glEnable(gl.GL_LIGHT0)
-        gl.glLightfv(gl.GL_LIGHT0, gl.GL_POSITION, (1, 2, 3))
-        gl.glLightfv(gl.GL_LIGHT0, gl.GL_AMBIENT, (.5, .5, .5))
-        gl.glLightfv(gl.GL_LIGHT0, gl.GL_DIFFUSE, (.6, .6, .6))
-        gl.glLightfv(gl.GL_LIGHT0, gl.GL_SPECULAR, (0, 0, 0))
-        # gl.glLightfv(gl.GL_LIGHT0, gl.GL_SPOT_DIRECTION, (-2, -3, -3))
-        gl.glLightf(gl.GL_LIGHT0, gl.GL_SPOT_CUTOFF, 180) # omnidirectional
 
         gl.glLoadIdentity()
         gl.glTranslatef(0, 0.0, -7.0)
 
         osd_line = \
+            "w: {0:<7.2f}".format(quat.w) + \
             "x: {0:<7.2f}".format(quat.x) + \
             "y: {0:<7.2f}".format(quat.y) + \
             "z: {0:<7.2f}".format(quat.z) + \
             "flex: {0:>8}".format("{0:.2f}°".format(flex_angle))
 
         self.drawText((-2, 1.9, 2), osd_line)
+        for i, line in enumerate(self.overlay):
+            self.drawText((-2, 1.72 - 0.18 * i, 2), line)
 
         gl.glPushMatrix()
 
         gl.glTranslatef(0, 2.0, 0.0)
         gl.glNormal3f(0.0, -1.0, 0.0)
-        #TODO: Change back to quaternions
-        # gl.glRotatef(-gyro_euler.x, 0, 1, 0)
-        # gl.glRotatef(-gyro_euler.y, 1, 0, 0)
-        # gl.glRotatef(gyro_euler.z*2, 0, 0, 1)
-        # gl.glRotatef(quat.x, 0, 1, 0)
-        gl.glRotatef(2*quat.y, 0, 0, 1)
-        gl.glRotatef(quat.z, 1, 0, 0)
-        gl.glRotatef(120, .5, .5, -.5)
-
-        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE, blue)
-        glu.gluCylinder(self.quad, 0.2, 0.15, 2, 10, 1)
+        # GL reads matrices column by column
+        gl.glMultMatrixf(np.ascontiguousarray(matrix.T, dtype=np.float32))
+
+        gl.glCallList(self.shank_list)
 
         gl.glTranslatef(0, 0, 2)
 
@@ -209,11 +327,8 @@ class Simulation():
         # Pitch, rotate around x-axis
         gl.glRotatef(flex_angle, 1.0, 0.0, 0.0)
 
-        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE,dark_grey)
-        glu.gluSphere(self.quad, 0.2, 6, 6)
-
-        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE,blue)
-        glu.gluCylinder(self.quad, 0.15, 0.125, 1.8, 9, 1)
+        gl.glCallList(self.joint_list)
+        gl.glCallList(self.lower_list)
 
         gl.glTranslatef(0, 0, 1.8)
 
@@ -226,55 +341,9 @@ class Simulation():
         elif self.pose == 1:
             gl.glRotatef(60.0, 1.0, 0.0, 0.0)
 
-        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE,dark_grey)
-        glu.gluSphere(self.quad, 0.2, 6, 6)
-
-        gl.glBegin(gl.GL_QUADS)
-        
-        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE,grey)
-        # foot - back
-        gl.glNormal3f(0, -1, 0)
-        gl.glVertex3f(-0.2, -0.1, 0.0)
-        gl.glVertex3f(0.2, -0.1, 0.0)
-        gl.glVertex3f(0.2, -0.1, 0.3)
-        gl.glVertex3f(-0.2, -0.1, 0.3)
-
-        # foot - right
-        gl.glNormal3f(-1, 0, 0)
-        gl.glVertex3f(-0.2, -0.1, 0.3)
-        gl.glVertex3f(-0.2, 0.8, 0.3)
-        gl.glVertex3f(-0.2, 0.8, 0.1)
-        gl.glVertex3f(-0.2, -0.1, 0.0)
+        gl.glCallList(self.joint_list)
+        gl.glCallList(self.heel_list)
 
-        # foot - left
-        gl.glNormal3f(1, 0, 0)
-        gl.glVertex3f(0.2, -0.1, 0.3)
-        gl.glVertex3f(0.2, 0.8, 0.3)
-        gl.glVertex3f(0.2, 0.8, 0.1)
-        gl.glVertex3f(0.2, -0.1, 0.0)
-
-        # foot - top
-        gl.glNormal3f(0, 0, -1)
-        gl.glVertex3f(-0.2, -0.1, 0.0)
-        gl.glVertex3f(-0.2, 0.8, 0.1)
-        gl.glVertex3f(0.2, 0.8, 0.1)
-        gl.glVertex3f(0.2, -0.1, 0.0)
-
-        # foot - front
-        gl.glNormal3f(0, 1, 0)
-        gl.glVertex3f(-0.2, -0.1, 0.3)
-        gl.glVertex3f(-0.2, 0.8, 0.3)
-        gl.glVertex3f(0.2, 0.8, 0.3)
-        gl.glVertex3f(0.2, -0.1, 0.3)
-
-        # foot - bottom
-        gl.glNormal3f(0, 0, 1)
-        gl.glVertex3f(-0.2, 0.8, 0.3)
-        gl.glVertex3f(-0.2, 0.8, 0.1)
-        gl.glVertex3f(0.2, 0.8, 0.1)
-        gl.glVertex3f(0.2, 0.8, 0.3)
-
-        gl.glEnd()
         gl.glTranslatef(0, 0.8, 0.1)
 
         # -------------------
@@ -286,55 +355,7 @@ class Simulation():
         elif self.pose == 1:
             gl.glRotatef(-60.0, 1.0, 0.0, 0.0)
 
-        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE,dark_grey)
-        glu.gluSphere(self.quad, 0.1, 6, 6)
-
-        gl.glMaterialfv(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE,grey)
-        
-        gl.glBegin(gl.GL_QUADS)
-
-        # foot - back
-        gl.glNormal3f(0, -1, 0)
-        gl.glVertex3f(-0.2, 0.02, 0.0)
-        gl.glVertex3f(0.2, 0.02, 0.0)
-        gl.glVertex3f(0.2, 0.02, 0.2)
-        gl.glVertex3f(-0.2, 0.02, 0.2)
+        gl.glCallList(self.toe_joint_list)
+        gl.glCallList(self.toe_list)
 
-        # foot - right
-        gl.glNormal3f(-1, 0, 0)
-        gl.glVertex3f(-0.2, 0.02, 0.2)
-        gl.glVertex3f(-0.2, 0.4, 0.2)
-        gl.glVertex3f(-0.2, 0.4, 0.1)
-        gl.glVertex3f(-0.2, 0.02, 0.0)
-
-        # foot - left
-        gl.glNormal3f(1, 0, 0)
-        gl.glVertex3f(0.2, 0.02, 0.2)
-        gl.glVertex3f(0.2, 0.4, 0.2)
-        gl.glVertex3f(0.2, 0.4, 0.1)
-        gl.glVertex3f(0.2, 0.02, 0.0)
-
-        # foot - top
-        gl.glNormal3f(0, 0, -1)
-        gl.glVertex3f(-0.2, 0.02, 0.0)
-        gl.glVertex3f(-0.2, 0.4, 0.1)
-        gl.glVertex3f(0.2, 0.4, 0.1)
-        gl.glVertex3f(0.2, 0.02, 0.0)
-
-        # foot - front
-        gl.glNormal3f(0, 1, 0)
-        gl.glVertex3f(-0.2, 0.02, 0.2)
-        gl.glVertex3f(-0.2, 0.4, 0.2)
-        gl.glVertex3f(0.2, 0.4, 0.2)
-        gl.glVertex3f(0.2, 0.02, 0.2)
-
-        # foot - bottom
-        gl.glNormal3f(0, 0, 1)
-        gl.glVertex3f(-0.2, 0.4, 0.2)
-        gl.glVertex3f(-0.2, 0.4, 0.1)
-        gl.glVertex3f(0.2, 0.4, 0.1)
-        gl.glVertex3f(0.2, 0.4, 0.2)
-
-        gl.glEnd()
         gl.glPopMatrix()
-
@@ -0,0 +1,154 @@
+"""Online decoding of noisy activity predictions
+
+The classifier looks at one window at a time, so a single odd window is
+enough to flip the pose. The decoders here take the class probabilities of
+each window in turn and only change their decision when the evidence lasts.
+Every update costs the same, no matter how long they have been running.
+"""
+import numpy as np
+
+DECODERS = ('none', 'hmm', 'hysteresis')
+
+
+class Decoder():
+    """Turns a sequence of class probabilities into a sequence of decisions
+    """
+
+    def __init__(self, classes):
+        """
+        Arguments:
+            classes {numpy.ndarray} -- Label of each column of the probabilities
+        """
+        self.classes = np.asarray(classes)
+        self.reset()
+
+    def reset(self):
+        """Forgets everything seen so far
+        """
+        self.state = None
+
+    def update(self, proba):
+        """Adds the probabilities of the next window.
+
+        Arguments:
+            proba {numpy.ndarray} -- Probability of each class
+
+        Returns:
+            int -- The decided class
+        """
+        self.state = int(np.argmax(proba))
+        return int(self.classes[self.state])
+
+
+class ForwardFilter(Decoder):
+    """Forward algorithm of a hidden Markov model over the activities
+
+    The classifier probabilities are used as emission likelihoods, and the
+    belief is carried from one window to the next through the transition
+    matrix. Unless one is given, every activity stays as it is with
+    probability {stay} and switches to each other one with equal probability.
+    """
+
+    def __init__(self, classes, stay: float = 0.9, transitions=None, floor: float = 0.05):
+        """
+        Arguments:
+            classes {numpy.ndarray} -- Label of each column of the probabilities
+
+        Keyword Arguments:
+            stay {float} -- Probability of keeping the same activity from one
+            window to the next (default: {0.9})
+            transitions {numpy.ndarray} -- Full transition matrix, where row i
+            has the probabilities of going from class i to every class
+            (default: {None})
+            floor {float} -- Lowest likelihood of any class, so that one
+            confident window can't rule out the current activity (default: {0.05})
+        """
+        n = len(classes)
+        if transitions is None:
+            transitions = np.full((n, n), (1 - stay) / max(n - 1, 1))
+            np.fill_diagonal(transitions, stay)
+        transitions = np.asarray(transitions, dtype=float)
+        if transitions.shape != (n, n):
+            raise ValueError("transitions must have shape (%d, %d)" % (n, n))
+        self.transitions = transitions / transitions.sum(axis=1, keepdims=True)
+        self.floor = floor
+        super().__init__(classes)
+
+    def reset(self):
+        super().reset()
+        self.belief = np.full(len(self.classes), 1 / len(self.classes))
+        self.__predicted = np.empty_like(self.belief)
+
+    def update(self, proba):
+        belief = np.dot(self.belief, self.transitions, out=self.__predicted)
+        belief *= np.maximum(proba, self.floor)
+        self.belief = belief / belief.sum()
+        self.state = int(self.belief.argmax())
+        return int(self.classes[self.state])
+
+
+class Hysteresis(Decoder):
+    """Keeps the current activity until another one clearly wins
+
+    Switching needs a class to beat the current one by at least {margin}
+    for {hold} windows in a row.
+    """
+
+    def __init__(self, classes, margin: float = 0.2, hold: int = 2):
+        """
+        Arguments:
+            classes {numpy.ndarray} -- Label of each column of the probabilities
+
+        Keyword Arguments:
+            margin {float} -- Probability a challenger must lead by (default: {0.2})
+            hold {int} -- Windows the lead must last (default: {2})
+        """
+        self.margin = margin
+        self.hold = hold
+        super().__init__(classes)
+
+    def reset(self):
+        super().reset()
+        self.challenger = None
+        self.count = 0
+
+    def update(self, proba):
+        best = int(np.argmax(proba))
+        if self.state is None:
+            self.state = best
+        elif best != self.state and proba[best] - proba[self.state] >= self.margin:
+            if best == self.challenger:
+                self.count += 1
+            else:
+                self.challenger = best
+                self.count = 1
+            if self.count >= self.hold:
+                self.state = best
+                self.challenger = None
+                self.count = 0
+        else:
+            self.challenger = None
+            self.count = 0
+        return int(self.classes[self.state])
+
+
+def make_decoder(name: str, classes, **options):
+    """Creates a decoder by name.
+
+    Arguments:
+        name {str} -- One of {DECODERS}
+        classes {numpy.ndarray} -- Label of each column of the probabilities
+
+    Keyword Arguments:
+        options -- Passed on to the decoder
+
+    Returns:
+        Decoder -- The decoder, or {None} for 'none'
+    """
+    if name == 'none':
+        return None
+    if name == 'hmm':
+        return ForwardFilter(classes, **options)
+    if name == 'hysteresis':
+        return Hysteresis(classes, **options)
+    raise ValueError("Unknown decoder %r, expected one of %s" % (name, DECODERS))
@@ -0,0 +1,175 @@
+"""Diagnostics that stay off the hot paths
+
+Modules log through {get_logger}. {setup} puts a {DroppingQueueHandler} on
+the shared logger: it never blocks and never formats anything, it only
+hands the record to a queue. A {logging.handlers.QueueListener} thread
+formats the records and writes them out. Messages are formatted in that
+thread, so arguments should be values that don't change afterwards.
+
+Code that runs for every sample should also check a {Sampler} before
+logging, so most calls cost a counter increment, and repeated messages are
+rate limited per call site by {RateLimitFilter}.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+ROOT = 'automailx'
+FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+_listener = None
+
+
+def get_logger(name: str):
+    """Logger of a module, under the shared {ROOT} logger
+    """
+    return logging.getLogger("%s.%s" % (ROOT, name))
+
+
+class Sampler():
+    """Says yes once every {every} calls
+
+    Meant to guard logging calls on hot paths:
+
+        if sampler() and log.isEnabledFor(logging.DEBUG):
+            log.debug(...)
+    """
+
+    def __init__(self, every: int = 100):
+        self.every = max(1, every)
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        if self.count >= self.every:
+            self.count = 0
+            return True
+        return False
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most {rate} records per second through from each call site
+
+    Each call site gets a token bucket that holds up to {burst} records.
+    The number of records held back is added to the next one let through.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 5):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.__buckets = {}
+        self.__lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.__lock:
+            tokens, last, suppressed = self.__buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.__buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self.__buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.msg = "%s (%d similar messages suppressed)" % (record.msg, suppressed)
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue
+    is full, and leaves all formatting to the listener
+
+    Attributes:
+        dropped {int} -- Records dropped because the queue was full
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full at exit. Give the thread a moment to make
+        # room, then throw away what it hasn't written rather than fail.
+        try:
+            self.queue.put(self._sentinel, timeout=1.0)
+        except queue.Full:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(self._sentinel)
+
+
+def setup(level='WARNING', filename: str = None, rate: float = 1.0, burst: int = 5,
+          queue_size: int = 10000):
+    """Sends everything logged under {ROOT} to stderr, and to a file if
+    given, from a background thread.
+
+    Keyword Arguments:
+        level {str|int} -- Lowest level to log (default: {'WARNING'})
+        filename {str} -- Also append to this file (default: {None})
+        rate {float} -- Records per second let through from each call site,
+        or {None} for no limit (default: {1.0})
+        burst {int} -- Records a call site may log at once before the rate
+        applies (default: {5})
+        queue_size {int} -- Records waiting to be written before new ones
+        are dropped (default: {10000})
+
+    Returns:
+        logging.Logger -- The {ROOT} logger
+    """
+    global _listener
+    shutdown()
+
+    formatter = logging.Formatter(FORMAT)
+    handlers = [logging.StreamHandler()]
+    if filename:
+        handlers.append(logging.FileHandler(filename))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    if rate is not None:
+        queue_handler.addFilter(RateLimitFilter(rate, burst))
+
+    logger = logging.getLogger(ROOT)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+    _listener = _Listener(log_queue, *handlers)
+    _listener.start()
+    return logger
+
+
+def shutdown():
+    """Writes out every queued record and stops the listener thread
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import features
+from features import FeatureEngine
+
+
+def reference(window):
+    """Features of one window, computed from scratch
+    """
+    return np.concatenate((
+        window.mean(axis=0),
+        window.var(axis=0),
+        window.min(axis=0),
+        window.max(axis=0),
+        window[-1] - window[0],
+        (window[1:] * window[:-1] < 0).sum(axis=0),
+        np.square(window).mean(axis=0),
+    ))
+
+
+def signal(count=200, channels=4):
+    rng = np.random.RandomState(0)
+    # a slow drift plus noise, so the extremes and crossings keep changing
+    drift = np.sin(np.arange(count) / 7.0)[:, None] * 50
+    return drift + rng.randn(count, channels) * 20 + [0, 5, -5, 1000][:channels]
+
+
+@pytest.mark.parametrize('window, hop', [(2, 1), (8, 4), (16, 1), (25, 3)])
+def test_matches_reference(window, hop):
+    samples = signal()
+    vectors = features.extract(samples, window, hop)
+    expected = [reference(samples[end - window:end])
+                for end in range(window, len(samples) + 1, hop)]
+    assert vectors.shape == (len(expected), len(features.FEATURES) * samples.shape[1])
+    assert np.allclose(vectors, expected)
+
+
+def test_emits_every_hop_once_full():
+    engine = FeatureEngine(window=4, hop=2, channels=1)
+    due = [engine.push([value]) is not None for value in range(10)]
+    assert due == [False, False, False, True, False, True, False, True, False, True]
+
+
+def test_running_sums_stay_accurate():
+    # large values make rounding errors in the running sums show up
+    samples = signal(5000) * 1e4
+    vector = features.extract(samples, 8, 1)[-1]
+    assert np.allclose(vector, reference(samples[-8:]))
+
+
+def test_reset_forgets_samples():
+    samples = signal(30)
+    engine = FeatureEngine(window=8, hop=1)
+    for sample in samples:
+        engine.push(sample)
+    engine.reset()
+    vectors = [engine.push(sample) for sample in samples[:8]]
+    assert np.allclose(vectors[-1], reference(samples[:8]))
+
+
+def test_names_match_vector():
+    assert len(features.feature_names()) == FeatureEngine().size
+
+
+def test_short_recording():
+    assert features.extract(signal(5), window=8).shape == (0, FeatureEngine().size)
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        FeatureEngine(window=1)
+    with pytest.raises(ValueError):
+        FeatureEngine(hop=0)
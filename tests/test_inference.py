@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.ensemble import AdaBoostClassifier, ExtraTreesClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+import inference
+
+
+def dataset(n_classes=3):
+    # features far from unit scale, like the sensor channels
+    X, y = make_classification(n_samples=300, n_features=6, n_informative=4,
+                               n_classes=n_classes, random_state=0)
+    return X * 1000 + 500, y
+
+
+def assert_same(engine, clf, X):
+    assert np.array_equal(engine.predict(X), clf.predict(X))
+    assert np.allclose(engine.predict_proba(X), clf.predict_proba(X), atol=1e-6)
+    assert engine.predict_one(X[0]) == clf.predict(X[:1])[0]
+
+
+@pytest.mark.parametrize('clf, engine', [
+    (LinearDiscriminantAnalysis(), inference.LinearEngine),
+    (LogisticRegression(max_iter=1000), inference.LinearEngine),
+    (DecisionTreeClassifier(random_state=0), inference.TreeEngine),
+    (RandomForestClassifier(n_estimators=10, random_state=0), inference.TreeEngine),
+    (ExtraTreesClassifier(n_estimators=10, random_state=0), inference.TreeEngine),
+])
+@pytest.mark.parametrize('n_classes', [2, 3])
+def test_compiled_matches_sklearn(clf, engine, n_classes):
+    X, y = dataset(n_classes)
+    clf.fit(X, y)
+    compiled = inference.compile(clf, samples=X)
+    assert isinstance(compiled, engine)
+    assert_same(compiled, clf, X)
+    assert_same(compiled, clf, inference.probes(X.shape[1], X, count=200))
+
+
+def test_boosted_trees_are_left_to_sklearn():
+    X, y = dataset()
+    clf = AdaBoostClassifier(n_estimators=10, random_state=0).fit(X, y)
+    engine = inference.compile(clf, samples=X)
+    assert isinstance(engine, inference.SklearnEngine)
+    assert engine.n_features == X.shape[1]
+    assert_same(engine, clf, X)
+
+
+def test_probes_follow_the_training_scale():
+    X, _ = dataset()
+    probes = inference.probes(X.shape[1], X)
+    assert probes.shape == (inference.PROBES, X.shape[1])
+    # half are training rows, the rest stay within a few deviations of them
+    assert all((row == X).all(axis=1).any() for row in probes[:inference.PROBES // 2])
+    assert np.all(np.abs(probes - X.mean(axis=0)) < 10 * X.std(axis=0))
+    assert inference.probes(4).shape == (inference.PROBES, 4)
+
+
+def test_n_features_without_n_features_in():
+    X, y = dataset()
+    for clf in (LinearDiscriminantAnalysis(), DecisionTreeClassifier(),
+                RandomForestClassifier(n_estimators=3)):
+        clf.fit(X, y)
+        # sklearn 0.20 doesn't have the attribute
+        del clf.n_features_in_
+        assert inference.n_features_of(clf) == X.shape[1]
+
+
+def test_engine_is_abstract():
+    with pytest.raises(TypeError):
+        inference.Engine([0, 1], 3)
@@ -0,0 +1,103 @@
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from latency import Histogram, LatencyMonitor
+
+# relative width of a bucket with the default 40 per decade
+BUCKET = 10 ** (1 / 40) - 1
+
+
+def latencies(count=10000):
+    return np.random.RandomState(0).lognormal(np.log(2e-3), 1.0, count)
+
+
+@pytest.mark.parametrize('percent', [50, 95, 99])
+def test_percentiles_within_a_bucket(percent):
+    values = latencies()
+    histogram = Histogram()
+    histogram.record_many(values)
+    exact = np.percentile(values, percent)
+    assert exact <= histogram.percentile(percent) <= exact * (1 + BUCKET) * 1.001
+
+
+def test_record_matches_record_many():
+    values = latencies(500)
+    one = Histogram()
+    for value in values:
+        one.record(value)
+    many = Histogram()
+    many.record_many(values)
+    assert np.array_equal(one.counts, many.counts)
+    assert (one.count, one.max) == (many.count, many.max)
+
+
+def test_out_of_range_values():
+    histogram = Histogram(low=1e-3, high=1.0)
+    histogram.record_many([0.0, 1e-4, 50.0])
+    histogram.record(-1.0)
+    histogram.record(100.0)
+    assert histogram.counts[0] == 3
+    assert histogram.counts[-1] == 2
+    assert histogram.max == 100.0
+    # the last bucket is open-ended
+    assert histogram.percentile(100) == 100.0
+    assert histogram.percentile(20) == 1e-3
+
+
+def test_empty_and_reset():
+    histogram = Histogram()
+    assert histogram.percentile(50) is None
+    histogram.record_many([])
+    assert histogram.count == 0
+    histogram.record(0.01)
+    histogram.reset()
+    assert histogram.count == 0 and histogram.max == 0.0
+    assert histogram.percentile(99) is None
+
+
+def test_tick_reports_each_interval(tmp_path):
+    log_file = tmp_path / 'latency' / 'log.jsonl'
+    monitor = LatencyMonitor(str(log_file), interval=5.0)
+    start = monitor._LatencyMonitor__since
+    monitor.record('draw', 0.004)
+    monitor.record_many('queue', [0.001, 0.002])
+    assert not monitor.tick(start + 1)
+    assert monitor.tick(start + 5)
+    assert set(monitor.last_report) == {'draw', 'queue'}
+    assert monitor.last_report['queue']['count'] == 2
+    assert monitor.summary() == {}
+    assert not monitor.tick(start + 6)
+
+    report = json.loads(log_file.read_text())
+    assert report['interval'] == pytest.approx(5.0)
+    assert report['stages'] == monitor.last_report
+    assert [line.split()[0] for line in monitor.overlay()[1:]] == ['queue', 'draw']
+
+
+def test_stage_timer():
+    monitor = LatencyMonitor()
+    with monitor.stage('predict'):
+        pass
+    assert monitor.summary()['predict']['count'] == 1
+
+
+def test_concurrent_records_are_kept():
+    monitor = LatencyMonitor()
+
+    def record():
+        for _ in range(5000):
+            monitor.record('parse', 1e-4)
+            monitor.record_many('total', [1e-3, 2e-3])
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = monitor.summary()
+    assert summary['parse']['count'] == 20000
+    assert summary['total']['count'] == 40000
+    assert monitor.histograms['total'].counts.sum() == 40000
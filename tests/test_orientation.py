@@ -0,0 +1,56 @@
+import numpy as np
+
+import orientation
+
+
+def same_rotation(a, b):
+    # q and -q are the same rotation
+    return np.allclose(np.abs(np.sum(a * b, axis=-1)), 1.0)
+
+
+def random_quats(count=100):
+    quats = np.random.RandomState(0).randn(count, 4)
+    return quats / np.linalg.norm(quats, axis=-1, keepdims=True)
+
+
+def test_ypr_round_trip():
+    ypr = np.random.RandomState(1).uniform([-180, -85, -180], [180, 85, 180], (100, 3))
+    pitch_yaw_roll = orientation.quat_to_euler(orientation.ypr_to_quat(ypr))
+    assert np.allclose(pitch_yaw_roll[:, [1, 0, 2]], ypr)
+
+
+def test_quat_round_trip():
+    quats = random_quats()
+    angles = orientation.quat_to_euler(quats)
+    assert same_rotation(orientation.ypr_to_quat(angles[..., [1, 0, 2]]), quats)
+    # a single quaternion works the same
+    angles = orientation.quat_to_euler(quats[0])
+    assert same_rotation(orientation.ypr_to_quat(angles[[1, 0, 2]]), quats[0])
+
+
+def test_ypr_axes():
+    assert np.allclose(orientation.ypr_to_quat((90, 0, 0)), [np.sqrt(0.5), 0, 0, np.sqrt(0.5)])
+    assert np.allclose(orientation.ypr_to_quat((0, 90, 0)), [np.sqrt(0.5), 0, np.sqrt(0.5), 0])
+    assert np.allclose(orientation.ypr_to_quat((0, 0, 90)), [np.sqrt(0.5), np.sqrt(0.5), 0, 0])
+
+
+def test_matrix_rotates_like_the_quaternion():
+    quats = random_quats(20)
+    matrices = orientation.quat_to_matrix(quats)
+    point = np.array([0.3, -1.2, 2.0])
+    for quat, matrix in zip(quats, matrices):
+        w, v = quat[0], quat[1:]
+        # q p q* written out for a pure quaternion p
+        expected = point + 2 * w * np.cross(v, point) + 2 * np.cross(v, np.cross(v, point))
+        assert np.allclose(matrix[:3, :3].dot(point), expected)
+        assert np.allclose(matrix[3], [0, 0, 0, 1])
+    assert np.allclose(orientation.quat_to_matrix([0, 0, 0, 0]), np.eye(4))
+
+
+def test_slerp():
+    start = orientation.ypr_to_quat((0, 0, 0))
+    end = orientation.ypr_to_quat((90, 0, 0))
+    assert np.allclose(orientation.slerp(start, end, 0.5), orientation.ypr_to_quat((45, 0, 0)))
+    # the short way around, even when the end has the other sign
+    assert same_rotation(orientation.slerp(start, -end, 0.5), orientation.ypr_to_quat((45, 0, 0)))
+    assert np.allclose(orientation.slerp(end, end, 0.3), end)
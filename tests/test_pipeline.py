@@ -0,0 +1,129 @@
+import threading
+
+import numpy as np
+import pytest
+
+import pipeline
+import sensors
+from pipeline import SharedRing
+from sensors import SAMPLE_DTYPE, SensorData
+
+DTYPE = np.dtype([('seq', '<i8'), ('value', '<f8')])
+
+
+@pytest.fixture
+def ring():
+    ring = SharedRing(DTYPE, capacity=8)
+    yield ring
+    ring.close()
+
+
+def write(ring, seqs):
+    for seq in seqs:
+        ring.write((seq, seq * 0.5))
+
+
+class Count():
+    """Stands in for the write count, advancing on every read as if the
+    writer kept going while the reader copied
+    """
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def __getitem__(self, index):
+        return self.values.pop(0) if len(self.values) > 1 else self.values[0]
+
+
+def test_read_in_order(ring):
+    reader = ring.reader()
+    write(ring, range(5))
+    records = reader.read()
+    assert records['seq'].tolist() == [0, 1, 2, 3, 4]
+    assert records['value'].tolist() == [0, 0.5, 1, 1.5, 2]
+    assert not len(reader.read())
+    assert reader.dropped == 0
+
+
+def test_read_wraps_around(ring):
+    reader = ring.reader()
+    write(ring, range(5))
+    reader.read()
+    # the next records run past the end of the slots and start over
+    write(ring, range(5, 11))
+    records = reader.read()
+    assert records['seq'].tolist() == [5, 6, 7, 8, 9, 10]
+    assert reader.dropped == 0
+    assert reader.position == 11
+
+
+def test_reader_that_fell_behind(ring):
+    reader = ring.reader()
+    write(ring, range(20))
+    records = reader.read()
+    # one slot fewer than the capacity, the writer may be filling the oldest
+    assert records['seq'].tolist() == list(range(13, 20))
+    assert reader.dropped == 13
+    write(ring, range(20, 23))
+    assert reader.read()['seq'].tolist() == [20, 21, 22]
+    assert reader.dropped == 13
+
+
+def test_records_overwritten_while_copying(ring):
+    reader = ring.reader()
+    write(ring, range(10))
+    written = ring.written
+    # 10 records when the copy starts, 12 once it is done
+    ring.written = Count([10, 12])
+    try:
+        records = reader.read()
+    finally:
+        ring.written = written
+    assert records['seq'].tolist() == [5, 6, 7, 8, 9]
+    assert reader.dropped == 5
+    assert reader.position == 10
+
+
+def test_latest_reader_skips_written(ring):
+    write(ring, range(3))
+    reader = ring.reader(latest=True)
+    assert not len(reader.read())
+    write(ring, [3])
+    assert reader.read()['seq'].tolist() == [3]
+
+
+def test_attach_shares_records(ring):
+    other = SharedRing.attach(ring.spec)
+    try:
+        write(other, range(3))
+        assert ring.reader().read()['seq'].tolist() == [0, 1, 2]
+    finally:
+        other.close()
+
+
+def test_acquire_numbers_unnumbered_samples(monkeypatch):
+    class Source():
+        replay = None
+
+        def __init__(self, **options):
+            self.count = 0
+
+        def read(self):
+            if self.count == 5:
+                stop.set()
+            self.count += 1
+            # legacy UDP packets have no sequence number
+            return SensorData(1.0, 0.0, 0.0, 0.0)
+
+        def close(self):
+            pass
+
+    stop = threading.Event()
+    monkeypatch.setattr(sensors, 'Sensors', Source)
+    samples = SharedRing(SAMPLE_DTYPE, capacity=16)
+    try:
+        reader = samples.reader()
+        pipeline.acquire({}, samples.spec, stop)
+        assert reader.read()['seq'].tolist() == [0, 1, 2, 3, 4, 5]
+    finally:
+        samples.close()
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+import protocol
+from sensors import FrameParser
+
+
+def frame(seq, quat=(1.0, 0.0, 0.0, 0.0)):
+    return protocol.encode(seq, 1000 + seq, quat, (seq, -seq, 2 * seq), 25000.0 + seq)
+
+
+def stream(count):
+    return b''.join(frame(seq) for seq in range(count))
+
+
+def test_fletcher16_reference_values():
+    assert protocol.fletcher16(b'abcde') == 0xC8F0
+    assert protocol.fletcher16(b'abcdef') == 0x2057
+
+
+def test_round_trip():
+    quat = (0.5, -0.5, 0.5, -0.5)
+    data = protocol.encode(70000, 2 ** 32 + 5, quat, (1, -2, 3), 1234.5)
+    assert len(data) == protocol.FRAME.size
+    records, consumed, errors = protocol.decode(data)
+    assert (consumed, errors) == (len(data), 0)
+    record = records[0]
+    # the sequence number and clock wrap like their firmware counterparts
+    assert record['seq'] == 70000 & 0xFFFF
+    assert record['millis'] == 5
+    assert np.allclose(record['quat'] / protocol.QUAT_SCALE, quat)
+    assert record['accel'].tolist() == [1, -2, 3]
+    assert record['flex'] == pytest.approx(1234.5)
+
+
+def test_checksum_covers_every_field():
+    data = frame(3)
+    assert protocol.fletcher16(data[2:-2]) == int.from_bytes(data[-2:], 'little')
+
+
+def test_partial_frame_is_left_for_later():
+    data = stream(3)
+    records, consumed, errors = protocol.decode(data[:-5])
+    assert records['seq'].tolist() == [0, 1]
+    assert consumed == 2 * protocol.FRAME.size
+    assert errors == 0
+
+
+@pytest.mark.parametrize('offset', [2, 9, 20, protocol.FRAME.size - 1])
+def test_corrupt_byte_is_skipped(offset):
+    data = bytearray(stream(3))
+    data[protocol.FRAME.size + offset] ^= 0x40
+    records, consumed, errors = protocol.decode(bytes(data))
+    assert records['seq'].tolist() == [0, 2]
+    assert consumed == len(data)
+    assert errors >= 1
+
+
+def test_stops_at_corrupt_frame_without_resync():
+    data = bytearray(stream(3))
+    data[protocol.FRAME.size + 10] ^= 0xFF
+    records, consumed, errors = protocol.decode(bytes(data), resync=False)
+    assert records['seq'].tolist() == [0]
+    assert consumed == protocol.FRAME.size
+
+
+def test_resyncs_after_garbage():
+    data = b'\x00\x13garbage' + stream(2)
+    records, consumed, errors = protocol.decode(data)
+    assert records['seq'].tolist() == [0, 1]
+    assert consumed == len(data)
+
+
+def test_keeps_half_a_sync_word():
+    data = stream(1) + protocol.SYNC[:1]
+    records, consumed, _ = protocol.decode(data)
+    assert len(records) == 1
+    assert consumed == len(data) - 1
+
+
+def test_parser_handles_any_chunk_size():
+    data = stream(5)
+    parser = FrameParser()
+    frames = []
+    for start in range(0, len(data), 7):
+        frames += parser.feed(data[start:start + 7])
+    assert [sample.fw_seq for sample in frames] == [0, 1, 2, 3, 4]
+    assert [sample.seq for sample in frames] == [0, 1, 2, 3, 4]
+    assert frames[2].accel == (2, -2, 4)
+    assert frames[2].fw_millis == 1002
+    assert parser.errors == 0
+    assert not parser.buffer
+
+
+def test_parser_resyncs_after_corrupt_frame():
+    data = bytearray(stream(3))
+    data[protocol.FRAME.size + 12] ^= 0x01
+    parser = FrameParser()
+    frames = parser.feed(bytes(data))
+    assert [sample.fw_seq for sample in frames] == [0, 2]
+    assert parser.errors >= 1
+
+
+def test_parser_mixes_text_lines_and_frames():
+    line = b'quat\t1.0\t0.0\t0.0\t0.0\taworld\t1\t2\t3\tflex\t500\r\n'
+    parser = FrameParser()
+    frames = parser.feed(b'noise' + frame(0) + line + frame(1))
+    assert len(frames) == 3
+    assert frames[1].accel == (1, 2, 3)
+    assert frames[1].flex == 500
+    assert frames[2].fw_seq == 1
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+import smoothing
+from smoothing import Decoder, ForwardFilter, Hysteresis
+
+CLASSES = [0, 3, 7]
+A = [0.8, 0.1, 0.1]
+B = [0.1, 0.8, 0.1]
+
+
+def decode(decoder, probas):
+    return [decoder.update(np.asarray(proba)) for proba in probas]
+
+
+def test_plain_decoder_follows_argmax():
+    assert decode(Decoder(CLASSES), [A, B, A]) == [0, 3, 0]
+
+
+def test_forward_filter_ignores_a_single_odd_window():
+    assert decode(ForwardFilter(CLASSES), [A] * 5 + [B] + [A] * 2) == [0] * 8
+
+
+def test_forward_filter_switches_when_evidence_lasts():
+    decisions = decode(ForwardFilter(CLASSES), [A] * 5 + [B] * 5)
+    assert decisions[:6] == [0] * 6
+    assert decisions[-1] == 3
+
+
+def test_forward_filter_matches_forward_algorithm():
+    rng = np.random.RandomState(0)
+    probas = rng.dirichlet(np.ones(3), size=20)
+    decoder = ForwardFilter(CLASSES, stay=0.8, floor=0.05)
+    belief = np.full(3, 1 / 3)
+    for proba in probas:
+        decoder.update(proba)
+        belief = belief.dot(decoder.transitions) * np.maximum(proba, 0.05)
+        belief /= belief.sum()
+        assert np.allclose(decoder.belief, belief)
+
+
+def test_forward_filter_normalises_transitions():
+    decoder = ForwardFilter([0, 1], transitions=[[3, 1], [1, 1]])
+    assert np.allclose(decoder.transitions, [[0.75, 0.25], [0.5, 0.5]])
+    with pytest.raises(ValueError):
+        ForwardFilter(CLASSES, transitions=np.eye(2))
+
+
+def test_forward_filter_reset():
+    decoder = ForwardFilter(CLASSES)
+    decode(decoder, [B] * 5)
+    decoder.reset()
+    assert np.allclose(decoder.belief, 1 / 3)
+    assert decoder.state is None
+
+
+def test_hysteresis_needs_a_lasting_lead():
+    decoder = Hysteresis(CLASSES, margin=0.2, hold=2)
+    assert decode(decoder, [A, B, A, B, B]) == [0, 0, 0, 0, 3]
+
+
+def test_hysteresis_ignores_a_small_lead():
+    decoder = Hysteresis(CLASSES, margin=0.2, hold=1)
+    assert decode(decoder, [A, [0.35, 0.45, 0.2], [0.1, 0.8, 0.1]]) == [0, 0, 3]
+
+
+def test_hysteresis_restarts_the_count_for_a_new_challenger():
+    decoder = Hysteresis(CLASSES, margin=0.2, hold=2)
+    C = [0.1, 0.1, 0.8]
+    assert decode(decoder, [A, B, C, C]) == [0, 0, 0, 7]
+
+
+def test_make_decoder():
+    assert smoothing.make_decoder('none', CLASSES) is None
+    assert isinstance(smoothing.make_decoder('hmm', CLASSES, stay=0.5), ForwardFilter)
+    assert smoothing.make_decoder('hysteresis', CLASSES, hold=3).hold == 3
+    with pytest.raises(ValueError):
+        smoothing.make_decoder('kalman', CLASSES)